@@ -2,7 +2,7 @@
 
 {
     'name': 'Novasur - Servicios Digitales',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.1.0',
     'summary': 'Gestión de credenciales digitales (Spotify, Netflix, YouTube, etc.)',
     'description': """
         Gestión de Credenciales de Servicios Digitales
@@ -25,13 +25,25 @@
         'product',
         'mail',
     ],
+    'external_dependencies': {
+        'python': ['cryptography'],
+    },
     'data': [
         'security/ir.model.access.csv',
         'data/mail_template.xml',
+        'data/mail_activity_data.xml',
         'views/service_credentials_views.xml',
+        'data/ir_actions_server.xml',
         'views/product_product_views.xml',
         'views/sale_order_views.xml',
-        #'data/ir_cron.xml',  # 👈 mover al final
+        'views/res_config_settings_views.xml',
+        'views/service_credentials_delivery_views.xml',
+        'views/service_credentials_event_views.xml',
+        'views/service_credentials_history_views.xml',
+        'views/service_credentials_assignment_job_views.xml',
+        'views/service_credentials_report_views.xml',
+        'wizard/service_credentials_import_wizard_views.xml',
+        'data/ir_cron.xml',
     ],
     'demo': [],
     'installable': True,
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+##### password_encrypted pasa de adjunto (ir.attachment) a columna bytea de service_credentials.
+##### Copia los valores de los adjuntos a la columna en bloques y elimina los adjuntos.
+##### Así la rotación de claves y la importación masiva trabajan sobre la tabla con SQL por lotes.
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools import SQL
+import logging
+
+_logger = logging.getLogger(__name__)
+
+MIGRATION_CHUNK_SIZE = 1000
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Attachment = env['ir.attachment'].sudo()
+    domain = [
+        ('res_model', '=', 'service.credentials'),
+        ('res_field', '=', 'password_encrypted'),
+    ]
+    moved = 0
+    while True:
+        attachments = Attachment.search(domain, order='id', limit=MIGRATION_CHUNK_SIZE)
+        if not attachments:
+            break
+        values = [
+            SQL("(%s, %s::bytea)", attachment.res_id, attachment.datas)
+            for attachment in attachments if attachment.res_id and attachment.datas
+        ]
+        if values:
+            cr.execute(SQL(
+                """
+                UPDATE service_credentials c
+                   SET password_encrypted = v.value
+                  FROM (VALUES %s) AS v(id, value)
+                 WHERE c.id = v.id AND c.password_encrypted IS NULL
+                """,
+                SQL(", ").join(values),
+            ))
+            moved += cr.rowcount
+        attachments.unlink()
+        env.invalidate_all()
+
+    _logger.info(f"[CIFRADO] {moved} contraseñas movidas de adjuntos a la tabla service_credentials")
@@ -3,8 +3,27 @@
 ##### Cada import activa un archivo que extiende o define lógica del módulo.
 
 from . import service_credentials           # Modelo principal (estructura de datos, validaciones)
+from . import service_credentials_crypto    # Cifrado Fernet de contraseñas y rotación de claves
 from . import service_credentials_assign    # Funciones de asignación y envío de correo
+from . import service_credentials_allocation  # Estrategias de asignación del pool
 from . import service_credentials_cron      # Cron job para expiraciones automáticas
+from . import service_credentials_counters  # Contadores almacenados por producto (opcional)
+from . import service_credentials_event     # Registro de eventos (append-only)
+from . import service_credentials_delivery  # Bandeja de salida de correos de credenciales
+from . import service_credentials_import    # API de importación masiva
 from . import product_product               # Herencia de productos para servicios digitales
 from . import sale_order                    # Integración con órdenes de venta
 from . import product_template
+
+# Extienden métodos de sale_order.py: deben importarse después
+from . import service_credentials_reservation  # Reservas temporales de carrito / presupuesto
+from . import service_credentials_seat      # Credenciales compartidas por asientos
+from . import service_credentials_history   # Archivo histórico (datos fríos)
+from . import service_credentials_stock     # Stock publicado para el catálogo web (caché)
+from . import service_credentials_assignment_job  # Cola de asignación con reintentos (backorders)
+from . import service_credentials_subscription  # Duración de suscripción y renovación
+from . import service_credentials_report    # Reportes del pool (tablas de análisis)
+from . import service_credentials_forecast  # Pronóstico de quiebre de stock y alertas
+from . import service_credentials_recycle   # Reciclaje automático de cuentas (reinicio)
+
+from . import res_config_settings           # Ajustes de servicios digitales
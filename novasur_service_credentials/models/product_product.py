@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
+from odoo.tools import SQL
+import logging
+
+_logger = logging.getLogger(__name__)
 
 
 class ProductProduct(models.Model):
@@ -40,18 +44,106 @@ class ProductProduct(models.Model):
         store=False
     )
 
-    @api.depends('credential_ids', 'credential_ids.state')
+    # 🔹 Contadores almacenados (solo se mantienen con el modo de contadores activo)
+    credential_total_counter = fields.Integer(
+        string='Contador Total Credenciales',
+        readonly=True,
+        copy=False,
+        default=0
+    )
+
+    credential_available_counter = fields.Integer(
+        string='Contador Credenciales Disponibles',
+        readonly=True,
+        copy=False,
+        default=0
+    )
+
+    credential_assigned_counter = fields.Integer(
+        string='Contador Credenciales Asignadas',
+        readonly=True,
+        copy=False,
+        default=0
+    )
+
+    @api.depends('credential_ids', 'credential_ids.state', 'credential_ids.active', 'credential_ids.has_free_seats')
     def _compute_credential_stats(self):
-        """Calcula estadísticas de credenciales."""
-        for product in self:
-            credentials = product.credential_ids.filtered(lambda c: c.active)
-            product.credential_count = len(credentials)
-            product.available_credential_count = len(
-                credentials.filtered(lambda c: c.state == 'available')
-            )
-            product.assigned_credential_count = len(
-                credentials.filtered(lambda c: c.state == 'assigned')
+        """
+        Calcula estadísticas de credenciales.
+        
+        Con el modo de contadores almacenados activo se leen los contadores del
+        producto más los deltas aún no consolidados; si no, se agregan con una sola consulta agrupada por lote de
+        productos, sin cargar las credenciales en memoria.
+        """
+        if self.env['service.credentials']._stored_counters_enabled():
+            pending = self.env['service.credentials.counter.delta']._get_pending(self._origin.ids)
+            for product in self:
+                product_pending = pending.get(product._origin.id, {})
+                product.credential_count = product.credential_total_counter + product_pending.get('total', 0)
+                product.available_credential_count = (
+                    product.credential_available_counter + product_pending.get('available', 0)
+                )
+                product.assigned_credential_count = (
+                    product.credential_assigned_counter + product_pending.get('assigned', 0)
+                )
+            return
+        
+        stats = {}
+        product_ids = self._origin.ids
+        if product_ids:
+            groups = self.env['service.credentials']._read_group(
+                [('product_id', 'in', product_ids), ('active', '=', True)],
+                groupby=['product_id', 'state', 'has_free_seats'],
+                aggregates=['__count'],
             )
+            for product, state, has_free_seats, count in groups:
+                product_stats = stats.setdefault(product.id, {'total': 0, 'available': 0, 'assigned': 0})
+                product_stats['total'] += count
+                # Las cuentas compartidas sin asientos libres no son stock disponible
+                if state == 'assigned' or (state == 'available' and has_free_seats):
+                    product_stats[state] += count
+        
+        for product in self:
+            product_stats = stats.get(product._origin.id, {})
+            product.credential_count = product_stats.get('total', 0)
+            product.available_credential_count = product_stats.get('available', 0)
+            product.assigned_credential_count = product_stats.get('assigned', 0)
+
+    @api.model
+    def _rebuild_credential_counters(self):
+        """
+        Recalcula desde cero los contadores almacenados de todos los productos.
+        Se usa al activar el modo de contadores almacenados.
+        """
+        self.env['service.credentials'].flush_model(['product_id', 'state', 'active', 'has_free_seats'])
+        # Los deltas pendientes ya quedan incluidos en el recuento
+        self.env.cr.execute(SQL("DELETE FROM service_credentials_counter_delta"))
+        self.env['service.credentials.counter.delta'].invalidate_model()
+        self.env.cr.execute(SQL(
+            """
+            UPDATE product_product p
+               SET credential_total_counter = COALESCE(c.total, 0),
+                   credential_available_counter = COALESCE(c.available, 0),
+                   credential_assigned_counter = COALESCE(c.assigned, 0)
+              FROM product_product p2
+         LEFT JOIN (
+                SELECT product_id,
+                       COUNT(*) AS total,
+                       COUNT(*) FILTER (WHERE state = 'available' AND has_free_seats) AS available,
+                       COUNT(*) FILTER (WHERE state = 'assigned') AS assigned
+                  FROM service_credentials
+                 WHERE active
+              GROUP BY product_id
+                   ) c ON c.product_id = p2.id
+             WHERE p.id = p2.id
+            """
+        ))
+        self.invalidate_model([
+            'credential_total_counter',
+            'credential_available_counter',
+            'credential_assigned_counter',
+        ])
+        _logger.info("[CREDENCIALES] Contadores almacenados de productos recalculados")
 
     def action_view_credentials(self):
         """Abre la vista de credenciales del producto."""
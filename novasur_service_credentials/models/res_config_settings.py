@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+##### Extiende la configuración de Ventas con las opciones de servicios digitales
+
+from odoo import models, fields
+
+from .service_credentials_counters import STORED_COUNTERS_PARAM
+from .service_credentials_event import CHATTER_SUMMARY_PARAM
+from .service_credentials_reservation import RESERVATION_TTL_PARAM, DEFAULT_RESERVATION_TTL
+from .service_credentials_history import ARCHIVE_RETENTION_PARAM, DEFAULT_ARCHIVE_RETENTION
+from .service_credentials_assignment_job import BACKORDER_PARAM
+from .service_credentials_forecast import FORECAST_WINDOW_PARAM, DEFAULT_FORECAST_WINDOW
+from .service_credentials_recycle import RECYCLE_GRACE_PARAM, DEFAULT_RECYCLE_GRACE
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = 'res.config.settings'
+
+    credential_stored_counters = fields.Boolean(
+        string="Contadores de credenciales almacenados",
+        config_parameter=STORED_COUNTERS_PARAM,
+        help="Mantiene en cada producto contadores de credenciales que se actualizan en cada "
+             "cambio de estado, de modo que las vistas de productos no recuenten el pool completo. "
+             "Recomendado para pools grandes."
+    )
+
+    credential_chatter_summary = fields.Boolean(
+        string="Resumen de asignaciones en el chatter",
+        config_parameter=CHATTER_SUMMARY_PARAM,
+        help="Además del historial de eventos, publica un mensaje resumen en el chatter de la "
+             "orden de venta al asignar credenciales."
+    )
+
+    credential_backorder = fields.Boolean(
+        string="Confirmar ventas sin stock",
+        config_parameter=BACKORDER_PARAM,
+        help="Permite confirmar ventas aunque no haya credenciales suficientes. Lo faltante queda "
+             "en la cola de asignación y se asigna automáticamente al ingresar stock."
+    )
+
+    credential_reservation_ttl = fields.Integer(
+        string="Duración de reservas (minutos)",
+        config_parameter=RESERVATION_TTL_PARAM,
+        default=DEFAULT_RESERVATION_TTL,
+        help="Tiempo durante el cual una credencial queda reservada para un carrito o presupuesto "
+             "antes de volver al pool disponible."
+    )
+
+    credential_archive_retention = fields.Integer(
+        string="Retención antes de archivar (días)",
+        config_parameter=ARCHIVE_RETENTION_PARAM,
+        default=DEFAULT_ARCHIVE_RETENTION,
+        help="Días que una credencial expirada o archivada permanece en la tabla de credenciales "
+             "antes de moverse al histórico."
+    )
+
+    credential_forecast_window = fields.Integer(
+        string="Ventana del pronóstico (días)",
+        config_parameter=FORECAST_WINDOW_PARAM,
+        default=DEFAULT_FORECAST_WINDOW,
+        help="Días de asignaciones usados para calcular el consumo promedio de cada servicio "
+             "y pronosticar su quiebre de stock."
+    )
+
+    credential_recycle_grace = fields.Integer(
+        string="Gracia antes de reciclar (días)",
+        config_parameter=RECYCLE_GRACE_PARAM,
+        default=DEFAULT_RECYCLE_GRACE,
+        help="Días que una credencial expirada espera antes de pasar a pendiente de reinicio "
+             "y entrar al reciclaje automático."
+    )
+
+    def set_values(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        was_enabled = bool(ICP.get_param(STORED_COUNTERS_PARAM))
+        super().set_values()
+        if self.credential_stored_counters and not was_enabled:
+            self.env['product.product']._rebuild_credential_counters()
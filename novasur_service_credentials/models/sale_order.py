@@ -8,6 +8,8 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
+from markupsafe import Markup
+from collections import defaultdict
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -46,11 +48,12 @@ class SaleOrder(models.Model):
         res = super(SaleOrder, self).action_confirm()
         
         # Asignar credenciales después de confirmar
-        for order in self:
-            for line in order.order_line:
-                if line.product_id.is_digital_service:
-                    if line.product_id.auto_assign_credentials and not line.service_credential_id:
-                        line._auto_assign_credential()
+        lines_to_assign = self.order_line.filtered(
+            lambda l: l.product_id.is_digital_service
+            and l.product_id.auto_assign_credentials
+            and l.credential_missing_qty > 0
+        )
+        lines_to_assign._auto_assign_credential()
         
         return res
 
@@ -58,51 +61,101 @@ class SaleOrder(models.Model):
         """
         Valida que haya credenciales disponibles para los servicios digitales.
         Lanza UserError si no hay stock para productos con asignación automática.
+        
+        Las cantidades de un mismo producto se suman entre todas las líneas y
+        órdenes de ``self``, y la disponibilidad se obtiene con una sola consulta
+        agrupada por compañía (el pool de cada orden es el de su compañía).
+        
+        :return: Diccionario {(company_id, product_id): cantidad disponible} consultado
         """
-        for order in self:
-            missing_credentials = []
-            
-            for line in order.order_line:
-                product = line.product_id
-                
-                # Solo validar productos digitales con asignación automática
-                if not (product.is_digital_service and product.auto_assign_credentials):
-                    continue
-                
-                # Contar credenciales disponibles
-                available_count = self.env['service.credentials'].search_count([
-                    ('product_id', '=', product.id),
-                    ('state', '=', 'available'),
-                    ('active', '=', True)
-                ])
-                
-                if available_count < line.product_uom_qty:
-                    missing_credentials.append({
-                        'product': product.display_name,
-                        'needed': int(line.product_uom_qty),
-                        'available': available_count,
-                        'missing': int(line.product_uom_qty - available_count)
-                    })
-            
-            if missing_credentials:
-                # Construir mensaje de error detallado
-                error_lines = [
-                    _("⚠️ No hay suficientes credenciales disponibles:\n")
-                ]
-                for item in missing_credentials:
-                    error_lines.append(
-                        _("  • %s: Necesitas %d, disponibles %d (faltan %d)") % (
-                            item['product'],
-                            item['needed'],
-                            item['available'],
-                            item['missing']
-                        )
-                    )
+        # Sumar la cantidad pendiente por producto (solo digitales con asignación automática)
+        lines = self.order_line.filtered(
+            lambda l: l.product_id.is_digital_service and l.product_id.auto_assign_credentials
+        )
+        needed_by_product = defaultdict(int)
+        for line, qty in lines._get_credential_qty_to_claim().items():
+            if qty > 0:
+                needed_by_product[(line.company_id, line.product_id)] += qty
+        
+        if not needed_by_product:
+            return {}
+        
+        # Contar credenciales disponibles: una consulta agrupada por compañía
+        products_by_company = defaultdict(set)
+        for company, product in needed_by_product:
+            products_by_company[company].add(product.id)
+        available_by_product = {}
+        for company, product_ids in products_by_company.items():
+            counts = self.env['service.credentials']._get_available_counts(
+                product_ids, company_id=company.id
+            )
+            for product_id in product_ids:
+                available_by_product[(company.id, product_id)] = counts.get(product_id, 0)
+        
+        missing_credentials = []
+        for (company, product), needed in needed_by_product.items():
+            available_count = available_by_product[(company.id, product.id)]
+            if available_count < needed:
+                missing_credentials.append({
+                    'product': product.display_name,
+                    'needed': needed,
+                    'available': available_count,
+                    'missing': needed - available_count
+                })
+        
+        if missing_credentials:
+            # Construir mensaje de error detallado
+            error_lines = [
+                _("⚠️ No hay suficientes credenciales disponibles:\n")
+            ]
+            for item in missing_credentials:
                 error_lines.append(
-                    _("\n💡 Por favor, agrega más credenciales en: Servicios Digitales > Credenciales")
+                    _("  • %s: Necesitas %d, disponibles %d (faltan %d)") % (
+                        item['product'],
+                        item['needed'],
+                        item['available'],
+                        item['missing']
+                    )
                 )
-                
-                raise UserError("\n".join(error_lines))
+            error_lines.append(
+                _("\n💡 Por favor, agrega más credenciales en: Servicios Digitales > Credenciales")
+            )
+            
+            raise UserError("\n".join(error_lines))
+        
+        return available_by_product
+
+    def _action_cancel(self):
+        """Al cancelar, devuelve al pool las credenciales de todas las órdenes en bloque"""
+        res = super()._action_cancel()
+        self.order_line._release_credentials('order_cancelled')
+        return res
+
+    def _post_credentials_summary(self, assignments):
+        """
+        Publica en el chatter un único resumen con las credenciales asignadas.
+        
+        :param assignments: Lista de tuplas (línea de venta, credenciales asignadas)
+        """
+        self.ensure_one()
+        items = Markup("").join(
+            Markup("<li><b>%s</b>: %s</li>") % (
+                line.product_id.display_name,
+                ", ".join(credentials.mapped('login'))
+            )
+            for line, credentials in assignments
+        )
+        self.message_post(
+            body=Markup(_(
+                "✅ %s credencial(es) asignada(s) exitosamente al cliente <b>%s</b>:<ul>%s</ul>"
+            )) % (
+                sum(len(credentials) for _line, credentials in assignments),
+                self.partner_id.name,
+                items
+            ),
+            subject=_("Credencial Asignada"),
+            message_type='notification'
+        )
 
 
 class SaleOrderLine(models.Model):
@@ -116,6 +169,20 @@ class SaleOrderLine(models.Model):
         help='Credencial digital entregada al cliente para este servicio.'
     )
     
+    service_credential_ids = fields.One2many(
+        'service.credentials',
+        'sale_line_id',
+        string='Credenciales Asignadas',
+        readonly=True,
+        help='Todas las credenciales entregadas para esta línea (una por unidad vendida).'
+    )
+    
+    credential_missing_qty = fields.Integer(
+        string='Credenciales Pendientes',
+        compute='_compute_credential_missing_qty',
+        help='Cantidad de credenciales que aún faltan por asignar a esta línea.'
+    )
+    
     credential_login = fields.Char(
         string='Usuario',
         related='service_credential_id.login',
@@ -135,126 +202,167 @@ class SaleOrderLine(models.Model):
         readonly=True
     )
 
+    @api.depends('product_id.is_digital_service', 'product_uom_qty', 'service_credential_ids')
+    def _compute_credential_missing_qty(self):
+        """Calcula cuántas credenciales faltan según la cantidad vendida"""
+        for line in self:
+            if not line.product_id.is_digital_service:
+                line.credential_missing_qty = 0
+                continue
+            line.credential_missing_qty = max(
+                int(line.product_uom_qty) - len(line.service_credential_ids), 0
+            )
+
+    def _get_credential_qty_to_claim(self):
+        """
+        Calcula cuántas credenciales debe tomar cada línea del pool disponible.
+        
+        :return: Diccionario {sale.order.line: cantidad}
+        """
+        return {line: line.credential_missing_qty for line in self}
+
     def _auto_assign_credential(self):
         """
         Asigna automáticamente credenciales al confirmar venta.
         Este método se ejecuta DESPUÉS de confirmar la orden.
+        
+        Se asigna una credencial por unidad vendida: las credenciales de cada
+        línea se reservan con una sola consulta y se actualizan con un solo write.
+        
+        Cada línea se asigna dentro de su propio savepoint: si falta stock o la
+        asignación falla, lo pendiente queda en la cola de asignación (que se
+        reintenta sola) y la confirmación de la orden no se revierte.
         """
+        Credentials = self.env['service.credentials']
+        chatter_summary = Credentials._chatter_summary_enabled()
+        assigned_by_order = defaultdict(list)
+        backlog = {}
+        
         for line in self:
             # Skip si no es servicio digital
             if not line.product_id.is_digital_service:
                 continue
             
-            # Skip si ya tiene credencial asignada
-            if line.service_credential_id:
+            # Skip si ya tiene todas sus credenciales asignadas
+            qty_needed = line.credential_missing_qty
+            if qty_needed <= 0:
                 _logger.info(
-                    f"[SALE] Línea {line.id} ya tiene credencial asignada, saltando..."
-                )
-                continue
-            
-            # Buscar credencial disponible
-            credential = self.env['service.credentials'].get_available_credential(
-                line.product_id.id
-            )
-            
-            if not credential:
-                # Esto no debería pasar si la validación previa funcionó
-                error_msg = _(
-                    "⚠️ No hay credenciales disponibles para el producto: <b>%s</b><br/>"
-                    "Por favor, agregue credenciales o asigne manualmente."
-                ) % line.product_id.name
-                
-                line.order_id.message_post(
-                    body=error_msg,
-                    subject=_("Sin Credenciales Disponibles"),
-                    message_type='notification'
-                )
-                
-                _logger.error(
-                    f"[SALE ERROR] No hay credenciales para {line.product_id.name} "
-                    f"en orden {line.order_id.name}. La validación previa debió detectar esto."
+                    f"[SALE] Línea {line.id} ya tiene credenciales asignadas, saltando..."
                 )
-                
-                # Si es crítico, descomentar la siguiente línea:
-                # raise UserError(error_msg)
                 continue
             
-            # Asignar credencial
+            error = False
             try:
-                credential.assign_to_sale_line(line)
-                line.write({'service_credential_id': credential.id})
-                
-                # Mensaje de éxito en chatter
-                line.order_id.message_post(
-                    body=_(
-                        "✅ Credencial asignada exitosamente:<br/>"
-                        "<b>Producto:</b> %s<br/>"
-                        "<b>Usuario:</b> %s<br/>"
-                        "<b>Cliente:</b> %s"
-                    ) % (
-                        line.product_id.display_name,
-                        credential.login,
-                        line.order_id.partner_id.name
-                    ),
-                    subject=_("Credencial Asignada"),
-                    message_type='notification'
-                )
-                
-                _logger.info(
-                    f"[SALE] Credencial {credential.login} asignada exitosamente a "
-                    f"orden {line.order_id.name}, línea {line.id}"
-                )
-                
+                with self.env.cr.savepoint():
+                    credentials = line._assign_missing_credentials(qty_needed)
             except Exception as e:
                 _logger.error(
-                    f"[SALE ERROR] Error al asignar credencial: {e}",
+                    f"[SALE ERROR] Error al asignar credencial en orden {line.order_id.name}, "
+                    f"línea {line.id}: {e}",
                     exc_info=True
                 )
-                line.order_id.message_post(
-                    body=_(
-                        "❌ Error al asignar credencial para: <b>%s</b><br/>"
-                        "Error: %s<br/>"
-                        "<em>Contacte al administrador del sistema.</em>"
-                    ) % (line.product_id.name, str(e)),
-                    subject=_("Error en Asignación"),
-                    message_type='notification'
-                )
-                # Relanzar excepción para que el admin se entere
-                raise UserError(
-                    _("Error al asignar credencial para %s: %s") % 
-                    (line.product_id.name, str(e))
+                credentials = Credentials
+                error = str(e)
+            
+            if credentials:
+                if chatter_summary:
+                    assigned_by_order[line.order_id].append((line, credentials))
+                _logger.info(
+                    f"[SALE] {len(credentials)} credenciales asignadas exitosamente a "
+                    f"orden {line.order_id.name}, línea {line.id}"
                 )
+            
+            # Lo que no se pudo asignar queda en la cola de asignación
+            if error or line.credential_missing_qty > 0:
+                backlog[line] = error
+        
+        if backlog:
+            self.env['service.credentials.assignment.job']._enqueue(backlog)
+        
+        # Resumen opcional en el chatter: un mensaje por orden, no por credencial
+        for order, assignments in assigned_by_order.items():
+            order._post_credentials_summary(assignments)
+
+    def _assign_missing_credentials(self, qty):
+        """
+        Toma del pool hasta ``qty`` credenciales para la línea y las asigna.
+        Si no hay suficientes asigna las que haya, sin lanzar error.
+        
+        :param qty: Unidades pendientes de la línea
+        :return: Recordset de service.credentials asignadas
+        """
+        self.ensure_one()
+        credentials = self.env['service.credentials']._claim_available_credentials(
+            self.product_id.id, limit=qty, company_id=self.company_id.id
+        )
+        if not credentials:
+            return credentials
+        
+        credentials._assign_batch_to_sale_line(self)
+        if not self.service_credential_id:
+            self.write({'service_credential_id': credentials[0].id})
+        return credentials
+
+    def unlink(self):
+        """Las credenciales de líneas eliminadas se liberan antes de borrar la línea"""
+        self._release_credentials('line_removed')
+        return super().unlink()
+
+    def _release_credentials(self, reason):
+        """
+        Libera las credenciales asignadas a las líneas (cancelación o eliminación).
+        
+        Se resuelve con una búsqueda por ``sale_line_id`` y un write agrupado por
+        destino (ver ``service.credentials._release_assignments``), sin importar
+        cuántas órdenes contenga ``self``.
+        
+        :param reason: Motivo guardado en el evento de auditoría
+        """
+        if not self.ids:
+            return
+        
+        credentials = self.env['service.credentials'].sudo().search([
+            ('sale_line_id', 'in', self.ids),
+            ('state', '=', 'assigned'),
+        ])
+        released, to_reset = credentials._release_assignments(reason)
+        
+        # Las líneas dejan de apuntar a credenciales que volvieron al pool
+        lines = self.sudo().filtered(lambda l: l.service_credential_id in released)
+        if lines:
+            lines.write({'service_credential_id': False})
+        
+        if credentials:
+            _logger.info(
+                f"[SALE] Credenciales liberadas ({reason}): {len(released)} disponibles, "
+                f"{len(to_reset)} pendientes de reinicio"
+            )
 
     def action_assign_credential_manually(self):
-        """Permite asignar manualmente una credencial"""
+        """Permite asignar manualmente las credenciales que faltan en la línea"""
         self.ensure_one()
         
         if not self.product_id.is_digital_service:
             raise UserError(_("Este producto no es un servicio digital."))
         
-        if self.service_credential_id:
+        qty_needed = self.credential_missing_qty
+        if qty_needed <= 0:
             raise UserError(_("Esta línea ya tiene una credencial asignada."))
         
-        # Buscar credencial disponible
-        credential = self.env['service.credentials'].get_available_credential(
-            self.product_id.id
-        )
+        # Reservar y asignar las credenciales disponibles
+        credentials = self._assign_missing_credentials(qty_needed)
         
-        if not credential:
+        if not credentials:
             raise UserError(
                 _("No hay credenciales disponibles para el producto: %s") % self.product_id.name
             )
         
-        # Asignar
-        credential.assign_to_sale_line(self)
-        self.service_credential_id = credential.id
-        
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('Credencial Asignada'),
-                'message': _('Se ha asignado la credencial exitosamente.'),
+                'message': _('Se han asignado %d credencial(es) exitosamente.') % len(credentials),
                 'type': 'success',
                 'sticky': False,
             }
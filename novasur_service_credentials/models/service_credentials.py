@@ -4,7 +4,7 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
-import base64
+from odoo.tools import create_index
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -46,6 +46,7 @@ class ServiceCredentials(models.Model):
 
     password_encrypted = fields.Binary(
         string="Contraseña Encriptada",
+        attachment=False,
         groups="base.group_system"
     )
 
@@ -64,6 +65,7 @@ class ServiceCredentials(models.Model):
         ondelete='set null',
         readonly=True,
         tracking=True,
+        index='btree_not_null',
         help="Línea de venta a la que está asignada esta credencial"
     )
     
@@ -72,7 +74,8 @@ class ServiceCredentials(models.Model):
         string="Orden de venta",
         related="sale_line_id.order_id",
         store=True,
-        readonly=True
+        readonly=True,
+        index='btree_not_null'
     )
     
     partner_id = fields.Many2one(
@@ -80,7 +83,8 @@ class ServiceCredentials(models.Model):
         string="Cliente",
         related="sale_order_id.partner_id",
         store=True,
-        readonly=True
+        readonly=True,
+        index='btree_not_null'
     )
 
     ##### Campos de fechas y control #####
@@ -117,25 +121,41 @@ class ServiceCredentials(models.Model):
          'El login debe ser único por servicio.'),
     ]
 
+    ##### Índices #####
+    
+    def init(self):
+        """
+        Crea los índices parciales de las consultas críticas:
+        - Credenciales asignadas por fecha de expiración (crons de expiración y advertencia).
+        Los índices del pool disponible dependen de la estrategia de asignación
+        (ver service_credentials_allocation.py).
+        """
+        super().init()
+        # Reemplazado por los índices por estrategia (producto, compañía, orden)
+        self.env.cr.execute("DROP INDEX IF EXISTS service_credentials_available_pool_idx")
+        create_index(
+            self.env.cr,
+            'service_credentials_assigned_expire_idx',
+            self._table,
+            ['expire_date', 'id'],
+            where="state = 'assigned' AND expire_date IS NOT NULL",
+        )
+
     ##### Métodos de cifrado #####
+    # El cifrado (Fernet) vive en service_credentials_crypto.py
     
     def _compute_password(self):
-        """Desencripta la contraseña para mostrarla"""
-        for rec in self:
-            if rec.password_encrypted:
-                try:
-                    rec.password = base64.b64decode(rec.password_encrypted).decode('utf-8')
-                except Exception as e:
-                    _logger.error(f"Error al desencriptar contraseña: {e}")
-                    rec.password = ''
-            else:
-                rec.password = ''
+        """Desencripta en lote las contraseñas para mostrarlas (vacía si es ilegible)"""
+        passwords = self._decrypt_passwords(self.mapped('password_encrypted'))
+        for rec, password in zip(self, passwords):
+            rec.password = password
 
     def _inverse_password(self):
         """Encripta la contraseña antes de guardarla"""
-        for rec in self:
-            if rec.password:
-                rec.password_encrypted = base64.b64encode(rec.password.encode('utf-8'))
+        records = self.filtered('password')
+        encrypted = self._encrypt_passwords(records.mapped('password'))
+        for rec, value in zip(records, encrypted):
+            rec.password_encrypted = value
 
     ##### Validaciones #####
     
@@ -173,43 +193,63 @@ class ServiceCredentials(models.Model):
         return [(rec.id, f"{rec.product_id.name} - {rec.login}") for rec in self]
 
     ##### Acciones básicas de cambio de estado #####
+    #
+    # Todas las acciones aceptan un modo masivo (contexto ``bulk_mode``), pensado
+    # para la vista de lista y las acciones de servidor: valida con una sola
+    # consulta, aplica un único write sin tracking y registra los eventos de
+    # auditoría con un solo create en lugar de un mensaje por registro.
     
     def action_mark_pending_reset(self):
         """Marca la credencial como pendiente de reinicio"""
+        message = _("Solo se pueden marcar como pendientes de reinicio las credenciales asignadas.")
+        if self._is_bulk_mode():
+            self._check_bulk_precondition([('state', '!=', 'assigned')], message)
+            return self._apply_bulk_transition(
+                'pending_reset', {'state': 'pending_reset'}, _("marcadas como pendientes de reinicio")
+            )
+        
         for rec in self:
             if rec.state != 'assigned':
-                raise UserError(
-                    _("Solo se pueden marcar como pendientes de reinicio las credenciales asignadas.")
-                )
+                raise UserError(message)
             rec.state = 'pending_reset'
             rec.message_post(
                 body=_("Credencial marcada como pendiente de reinicio"),
                 subject=_("Pendiente de Reinicio")
             )
             _logger.info(f"Credencial {rec.login} marcada como pendiente de reinicio")
+        self.env['service.credentials.event']._log('pending_reset', self)
 
     def action_reset_account(self):
         """Reinicia una cuenta para volverla disponible"""
+        message = _("Solo se pueden reiniciar credenciales pendientes de reinicio.")
+        vals = {
+            'state': 'available',
+            'sale_line_id': False,
+            'assign_date': False,
+            'expire_date': False,
+            'last_reset_date': fields.Datetime.now(),
+        }
+        if self._is_bulk_mode():
+            self._check_bulk_precondition([('state', '!=', 'pending_reset')], message)
+            return self._apply_bulk_transition('reset', vals, _("reiniciadas y disponibles"))
+        
         for rec in self:
             if rec.state != 'pending_reset':
-                raise UserError(
-                    _("Solo se pueden reiniciar credenciales pendientes de reinicio.")
-                )
+                raise UserError(message)
             
-            rec.write({
-                'state': 'available',
-                'sale_line_id': False,
-                'assign_date': False,
-                'expire_date': False,
-            })
+            rec.write(vals)
             rec.message_post(
                 body=_("Credencial reiniciada y disponible nuevamente"),
                 subject=_("Cuenta Reiniciada")
             )
             _logger.info(f"Credencial {rec.login} reiniciada y disponible")
+        self.env['service.credentials.event']._log('reset', self)
 
     def action_mark_expired(self):
         """Marca la credencial como expirada"""
+        if self._is_bulk_mode():
+            return self._apply_bulk_transition('expired', {'state': 'expired'}, _("marcadas como expiradas"))
+        
         for rec in self:
             rec.state = 'expired'
             rec.message_post(
@@ -217,20 +257,78 @@ class ServiceCredentials(models.Model):
                 subject=_("Credencial Expirada")
             )
             _logger.info(f"Credencial {rec.login} marcada como expirada")
+        self.env['service.credentials.event']._log('expired', self)
 
     def action_make_available(self):
         """Marca la credencial como disponible (solo si no está asignada)"""
+        message = _("No se puede marcar como disponible una credencial asignada a una venta.")
+        vals = {
+            'state': 'available',
+            'assign_date': False,
+            'expire_date': False,
+        }
+        if self._is_bulk_mode():
+            self._check_bulk_precondition([('sale_line_id', '!=', False)], message)
+            return self._apply_bulk_transition('made_available', vals, _("marcadas como disponibles"))
+        
         for rec in self:
             if rec.sale_line_id:
-                raise UserError(
-                    _("No se puede marcar como disponible una credencial asignada a una venta.")
-                )
-            rec.write({
-                'state': 'available',
-                'assign_date': False,
-                'expire_date': False,
-            })
+                raise UserError(message)
+            rec.write(vals)
             rec.message_post(
                 body=_("Credencial marcada como disponible"),
                 subject=_("Disponible")
             )
+        self.env['service.credentials.event']._log('made_available', self)
+
+    ##### Modo masivo #####
+
+    def _is_bulk_mode(self):
+        """Indica si la acción debe ejecutarse en modo masivo"""
+        return bool(self.env.context.get('bulk_mode'))
+
+    def _check_bulk_precondition(self, invalid_domain, message):
+        """
+        Valida la precondición de una acción masiva con una sola consulta.
+        
+        :param invalid_domain: Dominio que identifica los registros que NO cumplen
+        :param message: Mensaje de error a mostrar
+        """
+        invalid_count = self.with_context(active_test=False).search_count(
+            [('id', 'in', self.ids)] + invalid_domain
+        )
+        if invalid_count:
+            raise UserError(
+                message + "\n" + _("%d de las %d credenciales seleccionadas no cumplen la condición.")
+                % (invalid_count, len(self))
+            )
+
+    def _apply_bulk_transition(self, event_type, vals, description):
+        """
+        Aplica un cambio de estado masivo con un único write sin tracking y
+        registra un evento de auditoría por credencial (un solo ``create``).
+        
+        :param event_type: Tipo de evento de service.credentials.event
+        :param vals: Valores a escribir en todas las credenciales
+        :param description: Texto para el log y la notificación
+        :return: Acción de notificación para el cliente web
+        """
+        if not self:
+            return True
+        
+        # Antes del write: el evento conserva la orden de venta de cada credencial
+        self.env['service.credentials.event']._log(event_type, self, payload={'bulk': True})
+        self.with_context(tracking_disable=True).write(vals)
+        _logger.info(f"[BULK] {len(self)} credenciales {description}")
+        
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Acción Masiva'),
+                'message': _('%d credenciales %s.') % (len(self), description),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
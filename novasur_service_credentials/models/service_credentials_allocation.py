@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define las estrategias de asignación del pool de credenciales.
+##### Cada estrategia es un ORDER BY respaldado por su propio índice parcial
+##### (producto, compañía, orden), de modo que tomar N credenciales sigue siendo
+##### una lectura de índice con FOR UPDATE SKIP LOCKED, nunca un ordenamiento en Python.
+
+from odoo import models, fields, api, _
+from odoo.tools import SQL, create_index
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Condición del pool disponible (compartida por consultas e índices)
+AVAILABLE_POOL_WHERE = "state = 'available' AND active"
+
+# Stock vendible para reportes y pronóstico: además, con asientos libres
+# (``has_free_seats`` excluye las cuentas llenas y las marcadas para reinicio)
+AVAILABLE_STOCK_WHERE = AVAILABLE_POOL_WHERE + " AND has_free_seats"
+
+# Campos que deben estar en la base antes de bloquear filas del pool
+ALLOCATION_FIELDS = [
+    'product_id', 'company_id', 'state', 'active',
+    'last_reset_date', 'provider_expire_date', 'batch_ref',
+]
+
+# Último lote entregado por (base, producto, compañía) para la rotación entre lotes.
+# Vive en cada worker: la rotación no necesita una fila compartida que bloquear.
+_ROTATION_CURSORS = {}
+
+
+class ServiceCredentialsAllocation(models.Model):
+    _inherit = "service.credentials"
+
+    last_reset_date = fields.Datetime(
+        string="Último reinicio",
+        readonly=True,
+        copy=False,
+        help="Fecha en que la cuenta se reinició por última vez (estrategia LRU)"
+    )
+
+    provider_expire_date = fields.Datetime(
+        string="Vencimiento en el proveedor",
+        help="Fecha en que vence la cuenta en el proveedor (estrategia por vencimiento)"
+    )
+
+    batch_ref = fields.Char(
+        string="Lote del proveedor",
+        help="Lote o cuenta del proveedor de la que proviene la credencial (estrategia de rotación)"
+    )
+
+    def init(self):
+        """Un índice parcial por estrategia: (producto, compañía, columnas del ORDER BY)"""
+        super().init()
+        for key, strategy in self._get_allocation_strategies().items():
+            create_index(
+                self.env.cr,
+                f'service_credentials_alloc_{key}_idx',
+                self._table,
+                ['product_id', 'company_id'] + strategy['order'],
+                where=AVAILABLE_POOL_WHERE,
+            )
+
+    ##### Registro de estrategias #####
+
+    @api.model
+    def _get_allocation_strategies(self):
+        """
+        Registro de estrategias de asignación. Otros módulos pueden extenderlo.
+
+        Cada estrategia define:
+        - ``name``: Etiqueta para el producto
+        - ``order``: Columnas del ORDER BY (también forman su índice)
+        - ``rotate_by``: Columna opcional por la que se rota entre grupos
+
+        :return: Diccionario {clave: estrategia}
+        """
+        return {
+            'fifo': {
+                'name': _("FIFO (orden de carga)"),
+                'order': ['id'],
+            },
+            'lru': {
+                'name': _("Menos usada recientemente"),
+                'order': ['last_reset_date ASC NULLS FIRST', 'id'],
+            },
+            'expiry': {
+                'name': _("Próxima a vencer en el proveedor"),
+                'order': ['provider_expire_date ASC NULLS LAST', 'id'],
+            },
+            'round_robin': {
+                'name': _("Rotación entre lotes del proveedor"),
+                'order': ['batch_ref', 'id'],
+                'rotate_by': 'batch_ref',
+            },
+        }
+
+    @api.model
+    def _get_allocation_strategy(self, product_id):
+        """Estrategia configurada en el producto (FIFO si no existe)"""
+        strategies = self._get_allocation_strategies()
+        key = self.env['product.product'].browse(product_id).credential_allocation_strategy
+        return strategies.get(key) or strategies['fifo']
+
+    ##### Consultas del pool #####
+
+    @api.model
+    def _lock_pool_rows(self, product_id, company_id, limit):
+        """
+        Bloquea hasta ``limit`` credenciales disponibles del producto y compañía
+        siguiendo la estrategia del producto.
+
+        Con rotación, primero se toman filas del grupo siguiente al último entregado
+        y, si no alcanzan, se vuelve al inicio.
+
+        :return: Lista de IDs bloqueados
+        """
+        self.flush_model(ALLOCATION_FIELDS)
+        strategy = self._get_allocation_strategy(product_id)
+        rotate_by = strategy.get('rotate_by')
+        cursor_key = (self.env.cr.dbname, product_id, company_id)
+        cursor = _ROTATION_CURSORS.get(cursor_key) if rotate_by else None
+
+        rows = []
+        if cursor is not None:
+            rows = self._select_pool_rows(
+                product_id, company_id, limit, strategy,
+                SQL("%s > %s", SQL.identifier(rotate_by), cursor),
+            )
+        if len(rows) < limit:
+            extra = SQL("id != ALL(%s)", [row[0] for row in rows]) if rows else None
+            rows += self._select_pool_rows(product_id, company_id, limit - len(rows), strategy, extra)
+
+        if rotate_by and rows and rows[-1][1] is not None:
+            _ROTATION_CURSORS[cursor_key] = rows[-1][1]
+        return [row[0] for row in rows]
+
+    @api.model
+    def _select_pool_rows(self, product_id, company_id, limit, strategy, extra_where=None):
+        """
+        Ejecuta la consulta indexada de la estrategia con ``FOR UPDATE SKIP LOCKED``.
+
+        :return: Lista de tuplas (id, valor de rotación)
+        """
+        rotate_by = strategy.get('rotate_by')
+        self.env.cr.execute(SQL(
+            """
+            SELECT id, %(rotate)s
+              FROM service_credentials
+             WHERE product_id = %(product_id)s
+               AND company_id = %(company_id)s
+               AND %(pool)s
+               AND %(extra)s
+          ORDER BY %(order)s
+             LIMIT %(limit)s
+               FOR UPDATE SKIP LOCKED
+            """,
+            rotate=SQL.identifier(rotate_by) if rotate_by else SQL("NULL"),
+            product_id=product_id,
+            company_id=company_id,
+            pool=SQL(AVAILABLE_POOL_WHERE),
+            extra=extra_where or SQL("TRUE"),
+            order=SQL(", ".join(strategy['order'])),
+            limit=limit,
+        ))
+        return self.env.cr.fetchall()
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    credential_allocation_strategy = fields.Selection(
+        selection='_selection_credential_allocation_strategy',
+        string="Estrategia de Asignación",
+        default='fifo',
+        required=True,
+        help="Orden en que se toman las credenciales disponibles del servicio"
+    )
+
+    @api.model
+    def _selection_credential_allocation_strategy(self):
+        strategies = self.env['service.credentials']._get_allocation_strategies()
+        return [(key, strategy['name']) for key, strategy in strategies.items()]
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    credential_allocation_strategy = fields.Selection(
+        string="Estrategia de Asignación",
+        related='product_variant_id.credential_allocation_strategy',
+        readonly=False
+    )
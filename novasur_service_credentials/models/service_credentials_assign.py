@@ -15,25 +15,79 @@ class ServiceCredentialsAssign(models.Model):
     @api.model
     def get_available_credential(self, product_id):
         """
-        Busca la primera credencial disponible para un producto específico.
+        Busca y bloquea la primera credencial disponible para un producto específico.
+        
+        La credencial queda bloqueada (FOR UPDATE) hasta el fin de la transacción,
+        por lo que confirmaciones concurrentes del mismo producto obtienen
+        credenciales distintas en vez de competir por la misma fila.
         
         :param product_id: ID del producto
-        :return: Recordset de service.credentials o False
+        :return: Recordset de service.credentials (vacío si no hay stock)
         """
-        credential = self.search([
-            ('product_id', '=', product_id),
-            ('state', '=', 'available'),
-            ('active', '=', True)
-        ], limit=1, order='id asc')
+        credential = self._claim_available_credentials(product_id, limit=1)
         
         if not credential:
             _logger.warning(f"No hay credenciales disponibles para el producto ID {product_id}")
         
         return credential
 
+    @api.model
+    def _get_available_counts(self, product_ids, company_id=None):
+        """
+        Cuenta las credenciales disponibles de varios productos con una sola consulta agrupada.
+        
+        :param product_ids: Lista de IDs de productos
+        :param company_id: Compañía del pool (opcional; por defecto todas)
+        :return: Diccionario {product_id: cantidad disponible}
+        """
+        if not product_ids:
+            return {}
+        
+        groups = self._read_group(
+            self._get_available_pool_domain(product_ids, company_id),
+            groupby=['product_id'],
+            aggregates=['__count'],
+        )
+        return {product.id: count for product, count in groups}
+
+    @api.model
+    def _get_available_pool_domain(self, product_ids, company_id=None):
+        """Dominio del pool disponible de los productos (y compañía, si se indica)"""
+        domain = [
+            ('product_id', 'in', list(product_ids)),
+            ('state', '=', 'available'),
+            ('active', '=', True),
+        ]
+        if company_id:
+            domain.append(('company_id', '=', company_id))
+        return domain
+
+    @api.model
+    def _claim_available_credentials(self, product_id, limit=1, company_id=None):
+        """
+        Reserva atómicamente hasta ``limit`` credenciales disponibles en una sola consulta.
+        
+        Usa ``FOR UPDATE SKIP LOCKED``: las filas ya bloqueadas por otra transacción
+        se saltan en lugar de esperar, de modo que N workers confirmando ventas
+        del mismo producto reciben cada uno credenciales diferentes. El orden lo
+        define la estrategia de asignación del producto (ver
+        service_credentials_allocation.py) y el pool siempre se limita a una compañía.
+        
+        :param product_id: ID del producto
+        :param limit: Cantidad máxima de credenciales a reservar
+        :param company_id: Compañía del pool (por defecto la compañía actual)
+        :return: Recordset de service.credentials bloqueadas (puede tener menos de ``limit``)
+        """
+        if limit <= 0:
+            return self.browse()
+        
+        return self.browse(self._lock_pool_rows(
+            product_id, company_id or self.env.company.id, limit
+        ))
+
     def assign_to_sale_line(self, sale_line, expire_date=False):
         """
-        Asigna una credencial a una línea de venta y envía correo al cliente.
+        Asigna una credencial a una línea de venta y encola el correo al cliente.
         
         :param sale_line: Recordset de sale.order.line
         :param expire_date: Fecha de expiración opcional (datetime)
@@ -41,39 +95,116 @@ class ServiceCredentialsAssign(models.Model):
         """
         self.ensure_one()
         
-        # Validar que la credencial esté disponible
-        if self.state != 'available':
+        self._assign_batch_to_sale_line(sale_line, expire_date=expire_date)
+
+        # Registrar en el chatter (opcional; el historial queda en el registro de eventos)
+        if self._chatter_summary_enabled():
+            self.message_post(
+                body=_("Credencial asignada a la orden %s para el cliente %s") % (
+                    sale_line.order_id.name,
+                    self.partner_id.name
+                ),
+                subject=_("Credencial Asignada")
+            )
+        
+        _logger.info(
+            f"Credencial {self.login} asignada exitosamente a la orden {sale_line.order_id.name}"
+        )
+        
+        return True
+
+    def _assign_batch_to_sale_line(self, sale_line, expire_date=False):
+        """
+        Asigna todas las credenciales del recordset a una misma línea de venta.
+        
+        Los cambios de estado se aplican con un único ``write`` sobre el lote,
+        sin mensajes de tracking, y se registra un evento 'assigned' por
+        credencial en service.credentials.event. El correo al cliente no se
+        envía aquí: se encola en service.credentials.delivery.
+        
+        :param sale_line: Recordset de sale.order.line
+        :param expire_date: Fecha de expiración opcional (datetime)
+        :return: Recordset de credenciales asignadas
+        """
+        if not self:
+            return self
+        
+        # Validar que todas las credenciales estén disponibles
+        assignable_states = self._get_assignable_states()
+        if any(state not in assignable_states for state in self.mapped('state')):
             raise UserError(_("Solo se pueden asignar credenciales disponibles."))
 
-        # Preparar valores para actualizar
+        vals = self._prepare_assignment_vals(sale_line, expire_date=expire_date)
+        self.with_context(tracking_disable=True).write(vals)
+        self.env['service.credentials.event']._log(
+            'assigned', self, sale_order=sale_line.order_id
+        )
+
+        # Encolar el correo con credenciales (lo envía el worker de entregas)
+        self.env['service.credentials.delivery']._enqueue(self)
+        
+        return self
+
+    @api.model
+    def _get_assignable_states(self):
+        """Estados desde los que una credencial puede pasar a 'assigned'"""
+        return ('available',)
+
+    def _prepare_assignment_vals(self, sale_line, expire_date=False):
+        """
+        Prepara los valores que se escriben al asignar el lote a una línea de venta.
+        
+        :param sale_line: Recordset de sale.order.line
+        :param expire_date: Fecha de expiración opcional (datetime)
+        :return: Diccionario de valores para ``write``
+        """
         vals = {
             'state': 'assigned',
             'sale_line_id': sale_line.id,
             'assign_date': fields.Datetime.now(),
+            'delivery_state': 'queued',
         }
         
         if expire_date:
             vals['expire_date'] = expire_date
+        
+        return vals
 
-        self.write(vals)
-
-        # Enviar correo con credenciales al cliente
-        self._send_credential_email()
-
-        # Registrar en el chatter
-        self.message_post(
-            body=_("Credencial asignada a la orden %s para el cliente %s") % (
-                sale_line.order_id.name,
-                self.partner_id.name
-            ),
-            subject=_("Credencial Asignada")
-        )
+    def _release_assignments(self, reason):
+        """
+        Devuelve las credenciales de ventas canceladas o líneas eliminadas.
         
-        _logger.info(
-            f"Credencial {self.login} asignada exitosamente a la orden {sale_line.order_id.name}"
-        )
+        - Las que el cliente nunca recibió vuelven a 'available' y se cancela su correo en cola.
+        - Las ya entregadas pasan a 'pending_reset' (hay que cambiar la contraseña).
         
-        return True
+        Cada grupo se actualiza con un único ``write`` sin tracking y un evento por credencial.
+        
+        :param reason: Motivo guardado en el evento de auditoría
+        :return: Tupla (credenciales liberadas, credenciales a reiniciar)
+        """
+        delivered = self.filtered(lambda c: c.delivery_state == 'sent')
+        released = self - delivered
+        Event = self.env['service.credentials.event']
+        
+        if released:
+            self.env['service.credentials.delivery'].sudo().search([
+                ('credential_id', 'in', released.ids),
+                ('state', '=', 'queued'),
+            ]).write({'state': 'cancelled'})
+            Event._log('released', released, payload={'reason': reason})
+            released.with_context(tracking_disable=True).write({
+                'state': 'available',
+                'sale_line_id': False,
+                'assign_date': False,
+                'expire_date': False,
+                'delivery_state': 'none',
+            })
+        
+        if delivered:
+            delivered.with_context(tracking_disable=True).write({'state': 'pending_reset'})
+            Event._log('pending_reset', delivered, payload={'reason': reason})
+        
+        return released, delivered
 
     def _send_credential_email(self):
         """
@@ -99,17 +230,22 @@ class ServiceCredentialsAssign(models.Model):
             
             # Enviar email
             template.send_mail(self.id, force_send=True)
+            self.delivery_state = 'sent'
             
             _logger.info(
                 f"Correo de credenciales enviado exitosamente a {self.partner_id.email} "
                 f"para el servicio {self.product_id.name}"
             )
             
-            # Registrar envío en el chatter
-            self.message_post(
-                body=_("✅ Email enviado a %s con las credenciales de acceso") % self.partner_id.email,
-                subject=_("Email Enviado")
+            # Registrar envío
+            self.env['service.credentials.event']._log(
+                'delivered', self, payload={'email': self.partner_id.email, 'manual': True}
             )
+            if self._chatter_summary_enabled():
+                self.message_post(
+                    body=_("✅ Email enviado a %s con las credenciales de acceso") % self.partner_id.email,
+                    subject=_("Email Enviado")
+                )
             
             return True
             
@@ -119,7 +255,10 @@ class ServiceCredentialsAssign(models.Model):
                 exc_info=True
             )
             
-            # Registrar fallo en el chatter
+            # Registrar fallo (siempre visible en el chatter: requiere acción manual)
+            self.env['service.credentials.event']._log(
+                'delivery_failed', self, payload={'error': str(e), 'manual': True}
+            )
             self.message_post(
                 body=_("⚠️ No se pudo enviar el email con las credenciales: %s") % str(e),
                 subject=_("Error en Envío de Email")
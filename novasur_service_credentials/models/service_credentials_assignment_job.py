@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define la cola de asignación de credenciales (backorders digitales).
+##### Lo que no se puede asignar al confirmar (falta de stock o error) queda como
+##### trabajo pendiente en lugar de revertir la confirmación; un cron lo reintenta con
+##### backoff exponencial y la llegada de stock (importación, reinicio, liberación)
+##### despierta de inmediato los trabajos del producto.
+
+from odoo import models, fields, api, _
+from odoo.tools import create_index
+from markupsafe import Markup
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+BACKORDER_PARAM = 'novasur_service_credentials.backorder'
+JOB_BATCH_SIZE = 100
+JOB_MAX_ATTEMPTS = 8  # intentos con error antes de fallar definitivamente
+JOB_MAX_BACKOFF = 360  # minutos
+
+
+class ServiceCredentialsAssignmentJob(models.Model):
+    _name = "service.credentials.assignment.job"
+    _description = "Cola de asignación de credenciales"
+    _order = "id"
+    _rec_name = "sale_line_id"
+
+    sale_line_id = fields.Many2one(
+        "sale.order.line",
+        string="Línea de venta",
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    sale_order_id = fields.Many2one(
+        "sale.order",
+        string="Orden de venta",
+        related="sale_line_id.order_id",
+        store=True,
+        index=True
+    )
+
+    partner_id = fields.Many2one(
+        "res.partner",
+        string="Cliente",
+        related="sale_line_id.order_id.partner_id",
+        readonly=True
+    )
+
+    product_id = fields.Many2one(
+        "product.product",
+        string="Servicio",
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    company_id = fields.Many2one(
+        "res.company",
+        string="Compañía",
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    qty_pending = fields.Integer(string="Unidades pendientes", readonly=True)
+
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Cumplido'),
+        ('failed', 'Fallido'),
+        ('cancelled', 'Cancelado'),
+    ], string="Estado", default='pending', required=True, index=True)
+
+    attempt_count = fields.Integer(string="Intentos", default=0, readonly=True)
+
+    next_attempt_date = fields.Datetime(
+        string="Próximo intento",
+        default=fields.Datetime.now,
+        readonly=True
+    )
+
+    done_date = fields.Datetime(string="Fecha de cumplimiento", readonly=True)
+
+    latency_minutes = fields.Float(
+        string="Latencia (min)",
+        compute='_compute_latency_minutes',
+        store=True,
+        aggregator='avg',
+        help="Minutos entre la entrada en la cola y la asignación completa"
+    )
+
+    last_error = fields.Text(string="Último error", readonly=True)
+
+    def init(self):
+        """Índice parcial de la cola viva: despertar por producto y buscar vencidos"""
+        create_index(
+            self.env.cr,
+            'service_credentials_assignment_job_pending_idx',
+            self._table,
+            ['product_id', 'next_attempt_date'],
+            where="state = 'pending'",
+        )
+
+    @api.depends('done_date')
+    def _compute_latency_minutes(self):
+        for job in self:
+            if job.done_date and job.create_date:
+                job.latency_minutes = (job.done_date - job.create_date).total_seconds() / 60
+            else:
+                job.latency_minutes = 0.0
+
+    ##### Encolado #####
+
+    @api.model
+    def _backorder_enabled(self):
+        """Si está activo, la venta se confirma aunque falte stock (lo faltante va a la cola)"""
+        return bool(self.env['ir.config_parameter'].sudo().get_param(BACKORDER_PARAM))
+
+    @api.model
+    def _enqueue(self, backlog):
+        """
+        Registra en la cola lo que falta asignar en las líneas. Una línea tiene a
+        lo sumo un trabajo pendiente: si ya existe se actualiza y se adelanta.
+
+        :param backlog: Diccionario {sale.order.line: mensaje de error o False}
+        :return: Recordset de trabajos pendientes de las líneas
+        """
+        if not backlog:
+            return self.browse()
+
+        lines = self.env['sale.order.line'].browse([line.id for line in backlog])
+        existing = self.sudo().search([('state', '=', 'pending'), ('sale_line_id', 'in', lines.ids)])
+        job_by_line = {job.sale_line_id: job for job in existing}
+
+        now = fields.Datetime.now()
+        for line, job in job_by_line.items():
+            job.write({
+                'qty_pending': line.credential_missing_qty,
+                'next_attempt_date': now,
+                'last_error': backlog[line] or job.last_error,
+            })
+
+        # Registro técnico: se crea con sudo para no depender de los permisos del vendedor
+        jobs = existing | self.sudo().create([{
+            'sale_line_id': line.id,
+            'product_id': line.product_id.id,
+            'company_id': line.company_id.id,
+            'qty_pending': line.credential_missing_qty,
+            'last_error': backlog[line] or False,
+        } for line in lines if line not in job_by_line])
+
+        # Un aviso por orden en el chatter
+        jobs_by_order = defaultdict(list)
+        for job in jobs:
+            jobs_by_order[job.sale_order_id].append(job)
+        for order, order_jobs in jobs_by_order.items():
+            items = Markup("").join(
+                Markup("<li>%s: %d</li>") % (job.product_id.display_name, job.qty_pending)
+                for job in order_jobs
+            )
+            order.message_post(
+                body=Markup("%s<ul>%s</ul>") % (
+                    _("⏳ Credenciales pendientes en la cola de asignación. "
+                      "Se asignarán y enviarán automáticamente al ingresar stock:"),
+                    items,
+                ),
+                subject=_("Credenciales en Cola"),
+                message_type='notification'
+            )
+
+        _logger.warning(
+            f"[COLA] {len(jobs)} líneas en cola de asignación "
+            f"({sum(jobs.mapped('qty_pending'))} unidades pendientes)"
+        )
+        self._trigger_worker()
+        return jobs
+
+    @api.model
+    def _trigger_worker(self):
+        """Despierta al worker de la cola apenas termine la transacción actual"""
+        cron = self.env.ref(
+            'novasur_service_credentials.ir_cron_process_assignment_jobs',
+            raise_if_not_found=False
+        )
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _wake(self, product_ids):
+        """
+        Adelanta los trabajos pendientes de los productos que recibieron stock
+        y despierta al worker.
+        """
+        if not product_ids:
+            return
+        jobs = self.sudo().search([
+            ('state', '=', 'pending'),
+            ('product_id', 'in', list(product_ids)),
+        ])
+        if not jobs:
+            return
+        now = fields.Datetime.now()
+        jobs.filtered(lambda j: j.next_attempt_date > now).write({'next_attempt_date': now})
+        self._trigger_worker()
+
+    ##### Worker #####
+
+    @api.model
+    def cron_process_assignment_jobs(self, batch_size=JOB_BATCH_SIZE):
+        """
+        Reintenta los trabajos pendientes cuyo próximo intento ya venció, en orden
+        de llegada. Si quedan trabajos vencidos, vuelve a programarse de inmediato.
+
+        :param batch_size: Cantidad máxima de trabajos por ejecución
+        :return: Número de trabajos procesados
+        """
+        jobs = self.search([
+            ('state', '=', 'pending'),
+            ('next_attempt_date', '<=', fields.Datetime.now()),
+        ], limit=batch_size)
+
+        if not jobs:
+            return 0
+
+        jobs._process()
+
+        if len(jobs) == batch_size:
+            self._trigger_worker()
+
+        metrics = self._get_queue_metrics()
+        _logger.info(
+            f"[COLA] Profundidad: {metrics['depth']} trabajos / {metrics['units']} unidades; "
+            f"latencia media 24h: {metrics['avg_latency']:.1f} min"
+        )
+        return len(jobs)
+
+    def _process(self):
+        """
+        Intenta cumplir los trabajos del recordset. El stock se consulta una vez por
+        compañía y los productos sin stock se reprograman sin tocar el pool.
+        """
+        Credentials = self.env['service.credentials']
+
+        # Órdenes canceladas o líneas que ya no son digitales: no hay nada que asignar
+        obsolete = self.filtered(
+            lambda j: j.sale_line_id.order_id.state != 'sale'
+            or not j.sale_line_id.product_id.is_digital_service
+        )
+        obsolete.write({'state': 'cancelled', 'qty_pending': 0})
+        jobs = self - obsolete
+
+        available = {}
+        for company, company_jobs in jobs.grouped('company_id').items():
+            counts = Credentials._get_available_counts(company_jobs.product_id.ids, company_id=company.id)
+            for product in company_jobs.product_id:
+                available[(company.id, product.id)] = counts.get(product.id, 0)
+
+        chatter_summary = Credentials._chatter_summary_enabled()
+        assigned_by_order = defaultdict(list)
+        done = self.browse()
+        retry = self.browse()
+        errors = {}
+
+        for job in jobs:
+            line = job.sale_line_id
+            key = (job.company_id.id, job.product_id.id)
+            qty = line.credential_missing_qty
+            if qty > 0 and available[key] > 0:
+                try:
+                    with self.env.cr.savepoint():
+                        credentials = line._assign_missing_credentials(min(qty, available[key]))
+                except Exception as e:
+                    _logger.error(f"[COLA] Error al asignar la línea {line.id}: {e}", exc_info=True)
+                    credentials = Credentials
+                    errors[job] = str(e)
+                available[key] = max(available[key] - (qty - line.credential_missing_qty), 0)
+                if credentials and chatter_summary:
+                    assigned_by_order[line.order_id].append((line, credentials))
+
+            remaining = line.credential_missing_qty
+            if remaining <= 0:
+                done |= job
+            else:
+                if remaining != job.qty_pending:
+                    job.qty_pending = remaining
+                retry |= job
+
+        if done:
+            done.write({
+                'state': 'done',
+                'qty_pending': 0,
+                'done_date': fields.Datetime.now(),
+                'last_error': False,
+            })
+        retry._schedule_retry(errors)
+
+        for order, assignments in assigned_by_order.items():
+            order._post_credentials_summary(assignments)
+
+        _logger.info(
+            f"[COLA] Lote procesado: {len(done)} cumplidos, {len(retry)} pendientes, "
+            f"{len(obsolete)} cancelados"
+        )
+
+    def _schedule_retry(self, errors=None):
+        """
+        Reprograma los trabajos con backoff exponencial (1, 2, 4, 8... minutos,
+        con un máximo de JOB_MAX_BACKOFF). La falta de stock espera indefinidamente;
+        los errores fallan de forma definitiva al agotar JOB_MAX_ATTEMPTS.
+
+        :param errors: Diccionario {trabajo: mensaje de error} del intento actual
+        """
+        if not self:
+            return
+        errors = errors or {}
+        now = fields.Datetime.now()
+
+        # Agrupar por (intento, error) para escribir todos los del mismo grupo a la vez
+        groups = defaultdict(lambda: self.browse())
+        for job in self:
+            groups[(job.attempt_count + 1, errors.get(job))] |= job
+
+        for (attempt, error), jobs in groups.items():
+            if error and attempt >= JOB_MAX_ATTEMPTS:
+                jobs.write({'attempt_count': attempt, 'state': 'failed', 'last_error': error})
+                _logger.warning(f"[COLA] {len(jobs)} trabajos de asignación fallaron definitivamente")
+                continue
+            vals = {
+                'attempt_count': attempt,
+                'next_attempt_date': now + timedelta(minutes=min(2 ** (attempt - 1), JOB_MAX_BACKOFF)),
+            }
+            if error:
+                vals['last_error'] = error
+            jobs.write(vals)
+
+    ##### Métricas #####
+
+    @api.model
+    def _get_queue_metrics(self):
+        """
+        Profundidad de la cola y latencia de cumplimiento (últimas 24 horas),
+        con dos lecturas agrupadas.
+
+        :return: Diccionario con depth, units, oldest, fulfilled y avg_latency/max_latency en minutos
+        """
+        [(depth, units, oldest)] = self.sudo()._read_group(
+            [('state', '=', 'pending')], [], ['__count', 'qty_pending:sum', 'create_date:min'],
+        )
+        [(fulfilled, avg_latency, max_latency)] = self.sudo()._read_group(
+            [('state', '=', 'done'), ('done_date', '>=', fields.Datetime.now() - timedelta(days=1))],
+            [], ['__count', 'latency_minutes:avg', 'latency_minutes:max'],
+        )
+        return {
+            'depth': depth,
+            'units': units or 0,
+            'oldest': oldest,
+            'fulfilled': fulfilled,
+            'avg_latency': avg_latency or 0.0,
+            'max_latency': max_latency or 0.0,
+        }
+
+    ##### Acciones #####
+
+    def action_retry(self):
+        """Vuelve a encolar trabajos fallidos o cancelados (los pendientes y cumplidos no se tocan)"""
+        jobs = self.filtered(lambda j: j.state in ('failed', 'cancelled'))
+        if not jobs:
+            return
+        jobs.write({
+            'state': 'pending',
+            'attempt_count': 0,
+            'next_attempt_date': fields.Datetime.now(),
+        })
+        jobs._trigger_worker()
+
+    def action_cancel(self):
+        """Saca los trabajos de la cola (por ejemplo, si se reembolsó la venta)"""
+        self.filtered(lambda j: j.state in ('pending', 'failed')).write({'state': 'cancelled'})
+
+
+class ServiceCredentials(models.Model):
+    _inherit = "service.credentials"
+
+    ##### Llegada de stock #####
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['service.credentials.assignment.job']._wake(
+            set(records.filtered(lambda c: c.state == 'available').product_id.ids)
+        )
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Solo los cambios que devuelven stock al pool (reinicio, liberación, asientos)
+        if vals.get('state') == 'available' or vals.get('active') or 'seat_capacity' in vals:
+            self.env['service.credentials.assignment.job']._wake(set(self.product_id.ids))
+        return res
+
+    @api.model
+    def _release_seat_counters(self, released_by_credential):
+        """Los asientos liberados también pueden cumplir trabajos pendientes"""
+        super()._release_seat_counters(released_by_credential)
+        if released_by_credential:
+            self.env['service.credentials.assignment.job']._wake(
+                set(self.browse(list(released_by_credential)).product_id.ids)
+            )
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    assignment_job_count = fields.Integer(
+        string="Credenciales en Cola",
+        compute='_compute_assignment_job_count'
+    )
+
+    def _compute_assignment_job_count(self):
+        counts = dict(self.env['service.credentials.assignment.job'].sudo()._read_group(
+            [('sale_order_id', 'in', self.ids), ('state', '=', 'pending')],
+            ['sale_order_id'], ['__count'],
+        ))
+        for order in self:
+            order.assignment_job_count = counts.get(order, 0)
+
+    def _validate_credentials_availability(self):
+        """Con backorders activos la falta de stock no bloquea la confirmación"""
+        if self.env['service.credentials.assignment.job']._backorder_enabled():
+            return {}
+        return super()._validate_credentials_availability()
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    def _release_credentials(self, reason):
+        """Al cancelar o eliminar la línea, lo pendiente sale de la cola"""
+        super()._release_credentials(reason)
+        self.env['service.credentials.assignment.job'].sudo().search([
+            ('state', 'in', ('pending', 'failed')),
+            ('sale_line_id', 'in', self.ids),
+        ]).write({'state': 'cancelled'})
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+##### Este archivo mantiene los contadores almacenados de credenciales en product.product.
+##### Solo actúa si el modo de contadores almacenados está activado en la configuración:
+##### cada transición de estado inserta un delta (+1 / -1) en una tabla de solo inserción
+##### en vez de recontar el pool. Un cron suma los deltas pendientes a product.product;
+##### hasta entonces, la lectura de estadísticas los agrega al vuelo.
+#####
+##### Así la confirmación de ventas nunca actualiza la fila del producto (una fila caliente
+##### que serializaría todas las confirmaciones concurrentes del mismo servicio).
+#####
+##### Una credencial 'available' sin asientos libres no cuenta como disponible; los
+##### cambios de asientos por SQL registran sus propios deltas (service_credentials_seat.py).
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from collections import Counter
+import logging
+
+_logger = logging.getLogger(__name__)
+
+STORED_COUNTERS_PARAM = 'novasur_service_credentials.stored_counters'
+
+# Campos de service.credentials que afectan los contadores
+# (``seat_capacity`` y ``reset_required`` cambian ``has_free_seats``: una credencial llena
+# o marcada para reinicio no cuenta como disponible)
+COUNTER_FIELDS = ('product_id', 'state', 'active', 'seat_capacity', 'reset_required')
+
+
+class ServiceCredentialsCounters(models.Model):
+    _inherit = "service.credentials"
+
+    ##### Helpers #####
+
+    @api.model
+    def _stored_counters_enabled(self):
+        """Indica si el modo de contadores almacenados está activo"""
+        return bool(self.env['ir.config_parameter'].sudo().get_param(STORED_COUNTERS_PARAM))
+
+    def _get_counter_buckets(self):
+        """
+        Agrupa el recordset en los contadores que le corresponden.
+        
+        :return: Counter {(product_id, 'total'|'available'|'assigned'): cantidad}
+        """
+        buckets = Counter()
+        for rec in self:
+            if not rec.active or not rec.product_id:
+                continue
+            buckets[(rec.product_id.id, 'total')] += 1
+            if rec.state == 'assigned' or (rec.state == 'available' and rec.has_free_seats):
+                buckets[(rec.product_id.id, rec.state)] += 1
+        return buckets
+
+    @api.model
+    def _apply_counter_deltas(self, deltas):
+        """
+        Registra los deltas en la tabla de deltas pendientes con un solo INSERT.
+        No toca product.product: el cron ``cron_fold_credential_counters`` los consolida.
+        
+        :param deltas: Counter {(product_id, bucket): delta}
+        """
+        by_product = {}
+        for (product_id, bucket), delta in deltas.items():
+            if delta:
+                by_product.setdefault(product_id, Counter())[bucket] += delta
+        if not by_product:
+            return
+        
+        values = SQL(", ").join(
+            SQL("(%s, %s, %s, %s)", product_id, counts['total'], counts['available'], counts['assigned'])
+            for product_id, counts in by_product.items()
+        )
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO service_credentials_counter_delta (product_id, total, available, assigned)
+            VALUES %s
+            """,
+            values,
+        ))
+        self.env['service.credentials.counter.delta'].invalidate_model()
+        self.env['product.product'].browse(list(by_product)).invalidate_recordset([
+            'credential_count',
+            'available_credential_count',
+            'assigned_credential_count',
+        ])
+
+    ##### Mantenimiento incremental #####
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        if records._stored_counters_enabled():
+            records._apply_counter_deltas(records._get_counter_buckets())
+        return records
+
+    def write(self, vals):
+        if not any(field in vals for field in COUNTER_FIELDS) or not self._stored_counters_enabled():
+            return super().write(vals)
+        
+        before = self._get_counter_buckets()
+        res = super().write(vals)
+        after = self._get_counter_buckets()
+        after.subtract(before)
+        self._apply_counter_deltas(after)
+        return res
+
+    def unlink(self):
+        if not self._stored_counters_enabled():
+            return super().unlink()
+        
+        deltas = Counter()
+        deltas.subtract(self._get_counter_buckets())
+        res = super().unlink()
+        self._apply_counter_deltas(deltas)
+        return res
+
+
+class ServiceCredentialsCounterDelta(models.Model):
+    """Deltas de contadores pendientes de consolidar (solo inserción)"""
+    _name = "service.credentials.counter.delta"
+    _description = "Delta de contadores de credenciales"
+    _log_access = False
+
+    product_id = fields.Many2one(
+        "product.product",
+        string="Producto",
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    total = fields.Integer(string="Total", readonly=True)
+    available = fields.Integer(string="Disponibles", readonly=True)
+    assigned = fields.Integer(string="Asignadas", readonly=True)
+
+    @api.model
+    def _get_pending(self, product_ids):
+        """
+        Suma los deltas aún no consolidados de los productos indicados.
+        
+        :param product_ids: Lista de IDs de productos
+        :return: Diccionario {product_id: {'total', 'available', 'assigned'}}
+        """
+        if not product_ids:
+            return {}
+        groups = self._read_group(
+            [('product_id', 'in', product_ids)],
+            groupby=['product_id'],
+            aggregates=['total:sum', 'available:sum', 'assigned:sum'],
+        )
+        return {
+            product.id: {'total': total or 0, 'available': available or 0, 'assigned': assigned or 0}
+            for product, total, available, assigned in groups
+        }
+
+    @api.model
+    def cron_fold_credential_counters(self):
+        """
+        Cron: suma los deltas pendientes a los contadores de product.product y los borra,
+        en una sola sentencia (DELETE ... RETURNING agrupado y UPDATE).
+        Cada producto se actualiza una vez por ejecución, no una vez por venta.
+        """
+        self.flush_model()
+        self.env.cr.execute(SQL(
+            """
+            WITH moved AS (
+                DELETE FROM service_credentials_counter_delta
+                RETURNING product_id, total, available, assigned
+            ), sums AS (
+                SELECT product_id,
+                       SUM(total) AS total,
+                       SUM(available) AS available,
+                       SUM(assigned) AS assigned
+                  FROM moved
+              GROUP BY product_id
+            )
+            UPDATE product_product p
+               SET credential_total_counter = COALESCE(p.credential_total_counter, 0) + s.total,
+                   credential_available_counter = COALESCE(p.credential_available_counter, 0) + s.available,
+                   credential_assigned_counter = COALESCE(p.credential_assigned_counter, 0) + s.assigned
+              FROM sums s
+             WHERE p.id = s.product_id
+            """
+        ))
+        folded = self.env.cr.rowcount
+        self.invalidate_model()
+        self.env['product.product'].invalidate_model([
+            'credential_total_counter',
+            'credential_available_counter',
+            'credential_assigned_counter',
+        ])
+        if folded:
+            _logger.info(f"[CRON] Contadores consolidados de {folded} productos")
+        return folded
@@ -3,60 +3,191 @@
 ##### que revisa credenciales expiradas y las marca como "Expiradas".
 
 from odoo import models, fields, api, _
+from markupsafe import Markup
+from collections import Counter
+import threading
 import logging
 
 _logger = logging.getLogger(__name__)
 
+EXPIRY_CHUNK_SIZE = 500
+EXPIRY_WATERMARK_PARAM = 'novasur_service_credentials.expiry_watermark'
+
 
 class ServiceCredentialsCron(models.Model):
     _inherit = "service.credentials"
 
     @api.model
-    def cron_check_expired_credentials(self):
+    def cron_check_expired_credentials(self, chunk_size=EXPIRY_CHUNK_SIZE):
         """
-        Revisa diariamente credenciales asignadas cuya fecha de expiración ya pasó.
-        Marca automáticamente como 'expired' las credenciales vencidas.
+        Revisa credenciales en uso (ver ``_get_expirable_domain``) cuya fecha de
+        expiración ya pasó y las marca como 'expired'.
+        
+        Procesa bloques de ``chunk_size`` credenciales (ordenadas por id) con un
+        solo write por bloque y confirma la transacción entre bloques. Cuando hay
+        más de un bloque guarda una marca de agua (último id procesado), de modo
+        que una ejecución interrumpida continúa donde quedó en lugar de empezar
+        de cero. Al terminar envía una sola notificación resumida.
         
+        :param chunk_size: Cantidad de credenciales por bloque
         :return: Número de credenciales marcadas como expiradas
         """
         now = fields.Datetime.now()
+        ICP = self.env['ir.config_parameter'].sudo()
+        watermark = int(ICP.get_param(EXPIRY_WATERMARK_PARAM, 0) or 0)
+        if watermark:
+            _logger.info(f"[CRON] Reanudando barrido de expiración desde el id {watermark}")
         
-        # Buscar credenciales asignadas con fecha de expiración pasada
-        expired_credentials = self.search([
-            ('state', '=', 'assigned'),
+        domain = self._get_expirable_domain() + [
             ('expire_date', '!=', False),
             ('expire_date', '<', now),
-        ])
+        ]
+        
+        total = 0
+        expired_by_product = Counter()
+        first_expired = self.browse()
+        
+        while True:
+            # Buscar el siguiente bloque de credenciales vencidas
+            chunk = self.search(domain + [('id', '>', watermark)], order='id', limit=chunk_size)
+            if not chunk:
+                break
+            
+            # Marcar como expiradas con un solo write por bloque
+            chunk.with_context(tracking_disable=True).write({'state': 'expired'})
+            chunk._after_expire()
+            self.env['service.credentials.event']._log('expired', chunk, payload={'source': 'cron'})
+            
+            for cred in chunk:
+                expired_by_product[cred.product_id.display_name] += 1
+            
+            total += len(chunk)
+            first_expired = first_expired or chunk[0]
+            watermark = chunk[-1].id
+            
+            if len(chunk) < chunk_size:
+                break
+            
+            # Quedan bloques: persistir la marca de agua y confirmar
+            ICP.set_param(EXPIRY_WATERMARK_PARAM, watermark)
+            self._cron_commit()
+            self.env.invalidate_all()
         
-        if not expired_credentials:
+        # Barrido completo: reiniciar la marca de agua
+        if ICP.get_param(EXPIRY_WATERMARK_PARAM):
+            ICP.set_param(EXPIRY_WATERMARK_PARAM, False)
+        
+        # Programar la próxima ejecución para el siguiente vencimiento
+        self._schedule_expiry_check()
+        
+        if not total:
             _logger.info("[CRON] No se encontraron credenciales expiradas en esta ejecución.")
             return 0
         
-        # Marcar como expiradas
-        expired_credentials.action_mark_expired()
-        
         # Log consolidado
         _logger.info(
-            f"[CRON] Se marcaron {len(expired_credentials)} credenciales como expiradas:\n"
-            + "\n".join([
-                f"  - {cred.product_id.name} ({cred.login}) - Cliente: {cred.partner_id.name}"
-                for cred in expired_credentials
-            ])
+            f"[CRON] Se marcaron {total} credenciales como expiradas: "
+            + ", ".join(f"{name}: {count}" for name, count in expired_by_product.most_common())
         )
         
         # Enviar notificación al administrador (opcional)
-        self._notify_admin_expired_credentials(expired_credentials)
+        self._notify_admin_expired_credentials(first_expired, expired_by_product)
         
-        return len(expired_credentials)
+        return total
 
-    def _notify_admin_expired_credentials(self, expired_credentials):
+    @api.model
+    def _get_expirable_domain(self):
+        """
+        Dominio de las credenciales en uso que vencen con su fecha de expiración.
+        Otros módulos lo extienden (credenciales compartidas por asientos).
+        """
+        return [('state', '=', 'assigned')]
+
+    def _after_expire(self):
+        """Hook tras marcar el recordset como 'expired' (para extensiones)"""
+        return None
+
+    ##### Programación por eventos #####
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._schedule_expiry_for_records()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        if vals.get('expire_date') or vals.get('state') == 'assigned':
+            self._schedule_expiry_for_records()
+        return res
+
+    def _schedule_expiry_for_records(self):
+        """Programa el cron de expiración para el vencimiento más próximo del recordset"""
+        expire_dates = [
+            rec.expire_date for rec in self.filtered_domain(self._get_expirable_domain())
+            if rec.expire_date
+        ]
+        if expire_dates:
+            self._schedule_expiry_check(min(expire_dates))
+
+    @api.model
+    def _schedule_expiry_check(self, at=None):
+        """
+        Dispara el cron de expiración en el momento exacto del próximo vencimiento,
+        en vez de esperar a la ejecución diaria.
+        
+        No crea un disparador nuevo si ya hay uno (o la ejecución periódica)
+        programado para esa fecha o antes.
+        
+        :param at: Fecha del vencimiento; si es None se busca el próximo en la base
+        """
+        # Se llama desde la asignación en el entorno del vendedor: ir.cron solo es
+        # legible para administradores, todos sus campos se leen con sudo
+        cron = self.env.ref(
+            'novasur_service_credentials.ir_cron_check_expired_credentials',
+            raise_if_not_found=False
+        )
+        cron = cron and cron.sudo()
+        if not cron or not cron.active:
+            return
+        
+        if at is None:
+            next_credential = self.sudo().search(self._get_expirable_domain() + [
+                ('expire_date', '!=', False),
+            ], order='expire_date', limit=1)
+            if not next_credential:
+                return
+            at = next_credential.expire_date
+        
+        # Solo cuentan las ejecuciones futuras: las vencidas corresponden a la
+        # ejecución en curso y se descartan al terminar
+        now = fields.Datetime.now()
+        if cron.nextcall and now < cron.nextcall <= at:
+            return
+        if self.env['ir.cron.trigger'].sudo().search_count([
+            ('cron_id', '=', cron.id),
+            ('call_at', '>', now),
+            ('call_at', '<=', at),
+        ], limit=1):
+            return
+        
+        cron._trigger(at)
+        _logger.info(f"[CRON] Revisión de expiración programada para {at}")
+
+    def _cron_commit(self):
+        """Confirma la transacción del cron (no durante los tests)"""
+        if not getattr(threading.current_thread(), 'testing', False):
+            self.env.cr.commit()
+
+    def _notify_admin_expired_credentials(self, reference_credential, expired_by_product):
         """
         Notifica a los administradores sobre credenciales que expiraron.
-        Crea una actividad o envía un email según configuración.
+        Publica un único resumen con la cantidad de credenciales por servicio.
         
-        :param expired_credentials: Recordset de credenciales expiradas
+        :param reference_credential: Credencial en cuyo chatter se publica el resumen
+        :param expired_by_product: Counter {nombre del servicio: cantidad expirada}
         """
-        if not expired_credentials:
+        if not reference_credential or not expired_by_product:
             return
         
         try:
@@ -67,23 +198,22 @@ class ServiceCredentialsCron(models.Model):
                 _logger.warning("No se encontraron usuarios administradores para notificar")
                 return
             
-            # Crear mensaje para el chatter del primer registro (como referencia)
-            body = _(
+            total = sum(expired_by_product.values())
+            body = Markup(_(
                 "<h3>⚠️ Credenciales Expiradas Automáticamente</h3>"
-                "<p>Las siguientes <strong>%s credenciales</strong> han sido marcadas como expiradas:</p>"
+                "<p><strong>%s credenciales</strong> han sido marcadas como expiradas:</p>"
                 "<ul>%s</ul>"
                 "<p><em>Revise si necesitan reinicio o reemplazo.</em></p>"
-            ) % (
-                len(expired_credentials),
-                "".join([
-                    f"<li><strong>{cred.product_id.name}</strong> - {cred.login} "
-                    f"(Cliente: {cred.partner_id.name})</li>"
-                    for cred in expired_credentials
-                ])
+            )) % (
+                total,
+                Markup("").join(
+                    Markup("<li><strong>%s</strong>: %s</li>") % (name, count)
+                    for name, count in expired_by_product.most_common()
+                )
             )
             
-            # Publicar en el primer registro
-            expired_credentials[0].message_post(
+            # Publicar en el registro de referencia
+            reference_credential.message_post(
                 body=body,
                 subject=_("Notificación Automática: Credenciales Expiradas"),
                 partner_ids=admin_users.partner_id.ids,
@@ -120,33 +250,52 @@ class ServiceCredentialsCron(models.Model):
             )
             return 0
         
+        activity_type = self.env.ref(
+            'novasur_service_credentials.mail_activity_type_credential_expiring',
+            raise_if_not_found=False
+        ) or self.env.ref('mail.mail_activity_data_todo')
+        
+        # Omitir credenciales que ya tienen una advertencia abierta (una sola consulta)
+        Activity = self.env['mail.activity']
+        already_warned = {
+            activity.res_id for activity in Activity.search_fetch([
+                ('res_model', '=', self._name),
+                ('res_id', 'in', expiring_soon.ids),
+                ('activity_type_id', '=', activity_type.id),
+            ], ['res_id'])
+        }
+        to_warn = expiring_soon.filtered(lambda cred: cred.id not in already_warned)
+        
         _logger.warning(
-            f"[CRON] ⚠️ {len(expiring_soon)} credenciales expirarán en los próximos {days_before} días:\n"
-            + "\n".join([
-                f"  - {cred.product_id.name} ({cred.login}) - "
-                f"Expira: {cred.expire_date.strftime('%Y-%m-%d %H:%M')}"
-                for cred in expiring_soon
-            ])
+            f"[CRON] ⚠️ {len(expiring_soon)} credenciales expirarán en los próximos {days_before} días "
+            f"({len(to_warn)} advertencias nuevas, {len(already_warned)} ya advertidas)."
         )
         
-        # Crear actividades para seguimiento
-        for cred in expiring_soon:
-            cred.activity_schedule(
-                'mail.mail_activity_data_todo',
-                summary=_('Credencial próxima a expirar'),
-                note=_(
-                    'La credencial <strong>%s</strong> del servicio <strong>%s</strong> '
-                    'expirará el <strong>%s</strong>.<br/>'
-                    'Cliente: <strong>%s</strong><br/>'
-                    'Considere preparar un reemplazo o renovación.'
-                ) % (
-                    cred.login,
-                    cred.product_id.name,
-                    cred.expire_date.strftime('%d/%m/%Y %H:%M'),
-                    cred.partner_id.name
-                ),
-                date_deadline=cred.expire_date.date(),
-                user_id=self.env.ref('base.user_admin').id
-            )
+        if not to_warn:
+            return len(expiring_soon)
+        
+        # Crear todas las actividades de seguimiento en un solo create
+        res_model_id = self.env['ir.model']._get_id(self._name)
+        user_id = self.env.ref('base.user_admin').id
+        note = Markup(_(
+            'La credencial <strong>%s</strong> del servicio <strong>%s</strong> '
+            'expirará el <strong>%s</strong>.<br/>'
+            'Cliente: <strong>%s</strong><br/>'
+            'Considere preparar un reemplazo o renovación.'
+        ))
+        Activity.create([{
+            'res_model_id': res_model_id,
+            'res_id': cred.id,
+            'activity_type_id': activity_type.id,
+            'summary': _('Credencial próxima a expirar'),
+            'note': note % (
+                cred.login,
+                cred.product_id.name,
+                cred.expire_date.strftime('%d/%m/%Y %H:%M'),
+                cred.partner_id.name or '',
+            ),
+            'date_deadline': cred.expire_date.date(),
+            'user_id': user_id,
+        } for cred in to_warn])
         
         return len(expiring_soon)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+##### Este archivo contiene el cifrado autenticado (Fernet / AES-128-CBC + HMAC-SHA256)
+##### de las contraseñas y la tarea de rotación de claves.
+#####
+##### Las claves se leen de la configuración del servidor (odoo.conf):
+#####     service_credentials_keys = <clave_nueva>,<clave_anterior>
+##### La primera clave cifra; todas descifran (permite rotar sin cortar el servicio).
+#####
+##### La opción es obligatoria para cifrar: sin ella se rechaza guardar contraseñas.
+##### La clave derivada de database.secret (usada por versiones anteriores) queda siempre
+##### al final de la lista solo para descifrar, y la rotación migra esos datos a la
+##### clave configurada.
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL, config
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+import threading
+import hashlib
+import base64
+import logging
+
+_logger = logging.getLogger(__name__)
+
+CIPHER_KEYS_OPTION = 'service_credentials_keys'
+ROTATION_CHUNK_SIZE = 500
+
+# Prefijo de todo token Fernet (byte de versión 0x80 en base64 urlsafe)
+FERNET_TOKEN_PREFIX = b'gAAAAA'
+
+# Cifradores por juego de claves: se construyen una vez por proceso, no por registro
+_CIPHERS = {}
+
+
+class ServiceCredentialsCrypto(models.Model):
+    _inherit = "service.credentials"
+
+    password_key_id = fields.Char(
+        string="Huella de la clave de cifrado",
+        readonly=True,
+        copy=False,
+        groups="base.group_system",
+        help="Identifica la clave con la que está cifrada la contraseña (vacío: formato base64 anterior)"
+    )
+
+    password_invalid = fields.Boolean(
+        string="Contraseña ilegible",
+        readonly=True,
+        copy=False,
+        help="La contraseña no se pudo descifrar con ninguna clave configurada: "
+             "no se entrega ni se rota hasta que se cargue una nueva"
+    )
+
+    ##### Claves y cifrador #####
+
+    @api.model
+    def _get_configured_password_keys(self):
+        """
+        Devuelve las claves Fernet de odoo.conf (la primera es la activa).
+        
+        :return: Tupla de claves en base64 urlsafe (vacía si la opción no está configurada)
+        """
+        return tuple(
+            key.strip() for key in (config.get(CIPHER_KEYS_OPTION) or '').split(',') if key.strip()
+        )
+
+    @api.model
+    def _get_legacy_password_key(self):
+        """Clave derivada de database.secret con la que cifraban las versiones anteriores"""
+        secret = self.env['ir.config_parameter'].sudo().get_param('database.secret') or ''
+        derived = hashlib.sha256(f"service.credentials:{secret}".encode('utf-8')).digest()
+        return base64.urlsafe_b64encode(derived).decode('ascii')
+
+    @api.model
+    def _get_password_keys(self):
+        """
+        Devuelve las claves con las que se descifra: las configuradas y, al final,
+        la clave derivada anterior (los datos ya cifrados con ella siguen legibles).
+        
+        :return: Tupla de claves en base64 urlsafe
+        """
+        keys = self._get_configured_password_keys()
+        legacy = self._get_legacy_password_key()
+        if legacy in keys:
+            return keys
+        return keys + (legacy,)
+
+    @api.model
+    def _get_active_password_key(self):
+        """
+        Devuelve la clave con la que se cifra.
+        
+        :raises UserError: Si la opción ``service_credentials_keys`` no está configurada
+        """
+        keys = self._get_configured_password_keys()
+        if not keys:
+            raise UserError(_(
+                "No hay claves de cifrado configuradas para las credenciales.\n"
+                "Agregue la opción '%s' en el archivo de configuración del servidor (odoo.conf) "
+                "con una clave generada por Fernet.generate_key().",
+                CIPHER_KEYS_OPTION,
+            ))
+        return keys[0]
+
+    @api.model
+    def _get_password_cipher(self):
+        """Devuelve el cifrador (MultiFernet) del juego de claves actual, cacheado por proceso"""
+        keys = self._get_password_keys()
+        cipher = _CIPHERS.get(keys)
+        if cipher is None:
+            cipher = _CIPHERS[keys] = MultiFernet([Fernet(key) for key in keys])
+        return cipher
+
+    @api.model
+    def _get_password_key_fingerprint(self):
+        """Huella corta de la clave activa (no revela la clave)"""
+        return hashlib.sha256(self._get_active_password_key().encode('ascii')).hexdigest()[:16]
+
+    def _register_hook(self):
+        """Avisa en el log al cargar el registro si falta la clave de cifrado"""
+        res = super()._register_hook()
+        if not self._get_configured_password_keys():
+            _logger.error(
+                f"[CIFRADO] La opción '{CIPHER_KEYS_OPTION}' no está configurada: "
+                f"no se podrán guardar contraseñas de credenciales"
+            )
+        return res
+
+    ##### Cifrado en lote #####
+
+    @api.model
+    def _encrypt_passwords(self, passwords):
+        """
+        Encripta una lista de contraseñas en lote.
+        
+        :param passwords: Lista de contraseñas en texto plano
+        :return: Lista de valores para ``password_encrypted`` (mismo orden)
+        :raises UserError: Si no hay una clave configurada
+        """
+        self._get_active_password_key()
+        cipher = self._get_password_cipher()
+        return [
+            base64.b64encode(cipher.encrypt(password.encode('utf-8')))
+            for password in passwords
+        ]
+
+    @api.model
+    def _decrypt_passwords(self, values):
+        """
+        Desencripta en lote valores de ``password_encrypted``.
+        Acepta también el formato anterior (contraseña solo en base64).
+        
+        :param values: Lista de valores almacenados (base64)
+        :return: Lista de contraseñas en texto plano ('' si no hay valor,
+                 None si no se pudo desencriptar)
+        """
+        cipher = self._get_password_cipher()
+        passwords = []
+        for value in values:
+            if not value:
+                passwords.append('')
+                continue
+            try:
+                raw = base64.b64decode(value)
+                if raw.startswith(FERNET_TOKEN_PREFIX):
+                    passwords.append(cipher.decrypt(raw).decode('utf-8'))
+                else:
+                    # Formato anterior: la contraseña solo estaba codificada en base64
+                    passwords.append(raw.decode('utf-8'))
+            except (InvalidToken, ValueError) as e:
+                _logger.error(f"[CIFRADO] Error al desencriptar contraseña: {e!r}")
+                passwords.append(None)
+        return passwords
+
+    def _get_undecryptable(self):
+        """
+        Devuelve las credenciales del recordset cuya contraseña no se puede descifrar
+        y las marca como ilegibles. Reutiliza la caché de ``password``, por lo que
+        el correo que se renderiza después no vuelve a descifrar.
+        
+        :return: Recordset de credenciales ilegibles
+        """
+        records = self.sudo()
+        invalid = records.filtered(lambda c: c.password_invalid or (c.password_encrypted and not c.password))
+        newly = invalid.filtered(lambda c: not c.password_invalid)
+        if newly:
+            newly.write({'password_invalid': True})
+            _logger.error(f"[CIFRADO] {len(newly)} credenciales con contraseña ilegible: {newly.ids}")
+        return self.browse(invalid.ids)
+
+    ##### Huella de la clave #####
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        fingerprint = None
+        for vals in vals_list:
+            if vals.get('password_encrypted') and 'password_key_id' not in vals:
+                fingerprint = fingerprint or self._get_password_key_fingerprint()
+                vals['password_key_id'] = fingerprint
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if vals.get('password_encrypted') and 'password_key_id' not in vals:
+            vals = dict(vals, password_key_id=self._get_password_key_fingerprint())
+        if vals.get('password_encrypted') and 'password_invalid' not in vals:
+            # Una contraseña nueva reemplaza a la ilegible
+            vals = dict(vals, password_invalid=False)
+        return super().write(vals)
+
+    ##### Rotación de claves #####
+
+    @api.model
+    def cron_rotate_password_encryption(self, chunk_size=ROTATION_CHUNK_SIZE, max_chunks=20):
+        """
+        Re-encripta con la clave activa las contraseñas cifradas con claves
+        anteriores (o en el formato base64 anterior).
+        
+        Cada bloque se toma con FOR UPDATE SKIP LOCKED y se confirma por
+        separado, por lo que varios workers pueden rotar en paralelo sin
+        pisarse. Si quedan pendientes, el cron vuelve a programarse.
+        Las contraseñas que ninguna clave descifra se marcan como ilegibles
+        y se saltan (no detienen la rotación).
+        
+        :param chunk_size: Credenciales por bloque
+        :param max_chunks: Bloques máximos por ejecución
+        :return: Número de credenciales procesadas
+        """
+        if not self._get_configured_password_keys():
+            _logger.error(f"[CIFRADO] Rotación omitida: la opción '{CIPHER_KEYS_OPTION}' no está configurada")
+            return 0
+        
+        total = 0
+        for _chunk in range(max_chunks):
+            rotated = self._rotate_password_chunk(chunk_size)
+            total += rotated
+            if rotated < chunk_size:
+                break
+            if not getattr(threading.current_thread(), 'testing', False):
+                self.env.cr.commit()
+        else:
+            self.env.ref('novasur_service_credentials.ir_cron_rotate_password_encryption')._trigger()
+        
+        _logger.info(f"[CIFRADO] {total} contraseñas procesadas con la clave activa")
+        return total
+
+    @api.model
+    def _rotate_password_chunk(self, limit):
+        """
+        Re-encripta un bloque de credenciales cuya huella no es la de la clave activa.
+        El descifrado se hace en memoria y el bloque se guarda con un solo
+        ``UPDATE ... FROM (VALUES ...)``.
+        
+        :param limit: Tamaño del bloque
+        :return: Número de credenciales procesadas (re-encriptadas o marcadas ilegibles)
+        """
+        fingerprint = self._get_password_key_fingerprint()
+        Credentials = self.sudo().with_context(active_test=False)
+        Credentials.flush_model(['password_encrypted', 'password_key_id', 'password_invalid'])
+        
+        self.env.cr.execute(SQL(
+            """
+            SELECT id, password_encrypted
+              FROM service_credentials
+             WHERE password_key_id IS DISTINCT FROM %s
+               AND password_invalid IS NOT TRUE
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+            """,
+            fingerprint, limit,
+        ))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return 0
+        
+        cipher = self._get_password_cipher()
+        values = []
+        invalid_ids = []
+        for credential_id, value in rows:
+            if not value:
+                values.append(SQL("(%s, NULL::bytea)", credential_id))
+                continue
+            try:
+                raw = base64.b64decode(bytes(value))
+                if raw.startswith(FERNET_TOKEN_PREFIX):
+                    token = cipher.rotate(raw)
+                else:
+                    token = cipher.encrypt(raw)
+            except (InvalidToken, ValueError) as e:
+                _logger.error(f"[CIFRADO] Credencial {credential_id} ilegible, se omite en la rotación: {e!r}")
+                invalid_ids.append(credential_id)
+                continue
+            values.append(SQL("(%s, %s::bytea)", credential_id, base64.b64encode(token)))
+        
+        if values:
+            self.env.cr.execute(SQL(
+                """
+                UPDATE service_credentials c
+                   SET password_encrypted = COALESCE(v.value, c.password_encrypted),
+                       password_key_id = %s
+                  FROM (VALUES %s) AS v(id, value)
+                 WHERE c.id = v.id
+                """,
+                fingerprint, SQL(", ").join(values),
+            ))
+        if invalid_ids:
+            self.env.cr.execute(SQL(
+                "UPDATE service_credentials SET password_invalid = TRUE WHERE id = ANY(%s)",
+                invalid_ids,
+            ))
+        Credentials.invalidate_model(['password', 'password_encrypted', 'password_key_id', 'password_invalid'])
+        return len(rows)
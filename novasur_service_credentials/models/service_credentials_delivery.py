@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define la bandeja de salida (outbox) de correos de credenciales.
+##### La confirmación de la venta solo encola la entrega; un cron renderiza y envía
+##### los correos en lotes, con reintentos y estado de entrega por credencial.
+
+from odoo import models, fields, api, _
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+DELIVERY_BATCH_SIZE = 100
+DELIVERY_MAX_ATTEMPTS = 5
+
+# Plantilla de correo por tipo de entrega
+DELIVERY_TEMPLATES = {
+    'assigned': 'novasur_service_credentials.email_template_credential_assigned',
+    'renewed': 'novasur_service_credentials.email_template_credential_renewed',
+    'seat': 'novasur_service_credentials.email_template_credential_seat_assigned',
+}
+
+# Tipos de entrega que envían los datos de acceso: siguen ``delivery_state`` de la credencial
+ACCESS_DELIVERY_TYPES = ('assigned', 'seat')
+
+
+class ServiceCredentialsDelivery(models.Model):
+    _name = "service.credentials.delivery"
+    _description = "Entrega de credenciales por email"
+    _order = "next_attempt_date, id"
+    _rec_name = "credential_id"
+
+    credential_id = fields.Many2one(
+        "service.credentials",
+        string="Credencial",
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+
+    sale_line_id = fields.Many2one(
+        "sale.order.line",
+        string="Línea de venta",
+        ondelete='set null'
+    )
+
+    seat_id = fields.Many2one(
+        "service.credentials.seat",
+        string="Asiento",
+        index='btree_not_null',
+        ondelete='cascade',
+        readonly=True
+    )
+
+    partner_id = fields.Many2one(
+        "res.partner",
+        string="Cliente",
+        compute="_compute_partner_id",
+        search="_search_partner_id"
+    )
+
+    delivery_type = fields.Selection([
+        ('assigned', 'Credenciales'),
+        ('renewed', 'Renovación'),
+        ('seat', 'Asiento compartido'),
+    ], string="Tipo", default='assigned', required=True, readonly=True,
+        help="Credenciales: envía login y contraseña. Renovación: avisa la nueva fecha de expiración. "
+             "Asiento compartido: envía el acceso al cliente del asiento")
+
+    state = fields.Selection([
+        ('queued', 'En cola'),
+        ('sent', 'Enviado'),
+        ('failed', 'Fallido'),
+        ('cancelled', 'Cancelado'),
+    ], string="Estado", default='queued', required=True, index=True)
+
+    attempt_count = fields.Integer(string="Intentos", default=0, readonly=True)
+
+    next_attempt_date = fields.Datetime(
+        string="Próximo intento",
+        default=fields.Datetime.now,
+        index=True
+    )
+
+    sent_date = fields.Datetime(string="Fecha de envío", readonly=True)
+
+    mail_id = fields.Many2one("mail.mail", string="Correo", readonly=True, ondelete='set null')
+
+    last_error = fields.Text(string="Último error", readonly=True)
+
+    @api.depends('seat_id.partner_id', 'credential_id.partner_id')
+    def _compute_partner_id(self):
+        """El cliente del asiento, o el de la credencial"""
+        for delivery in self:
+            delivery.partner_id = delivery.seat_id.partner_id or delivery.credential_id.partner_id
+
+    def _search_partner_id(self, operator, value):
+        return [
+            '|',
+            '&', ('seat_id', '!=', False), ('seat_id.partner_id', operator, value),
+            '&', ('seat_id', '=', False), ('credential_id.partner_id', operator, value),
+        ]
+
+    ##### Encolado #####
+
+    @api.model
+    def _enqueue(self, credentials, delivery_type='assigned', sale_line_by_credential=None):
+        """
+        Encola la entrega por email de un lote de credenciales.
+        
+        :param credentials: Recordset de service.credentials asignadas
+        :param delivery_type: Tipo de entrega (ver ``DELIVERY_TEMPLATES``)
+        :param sale_line_by_credential: Diccionario opcional {credential_id: línea de venta};
+                                        por defecto la línea de cada credencial
+        :return: Recordset de entregas creadas
+        """
+        if not credentials:
+            return self.browse()
+        
+        sale_line_by_credential = sale_line_by_credential or {}
+        # Registro técnico: se crea con sudo para no depender de los permisos del vendedor
+        deliveries = self.sudo().create([{
+            'credential_id': credential.id,
+            'delivery_type': delivery_type,
+            'sale_line_id': sale_line_by_credential.get(credential.id, credential.sale_line_id).id,
+        } for credential in credentials])
+        self._trigger_worker()
+        return deliveries
+
+    @api.model
+    def _enqueue_seats(self, seats):
+        """
+        Encola la entrega del acceso de asientos compartidos (un correo por asiento).
+        La credencial pasa a 'En cola' salvo que ya se haya entregado a otro asiento.
+        
+        :param seats: Recordset de service.credentials.seat
+        :return: Recordset de entregas creadas
+        """
+        if not seats:
+            return self.browse()
+        
+        deliveries = self.sudo().create([{
+            'credential_id': seat.credential_id.id,
+            'seat_id': seat.id,
+            'delivery_type': 'seat',
+            'sale_line_id': seat.sale_line_id.id,
+        } for seat in seats])
+        deliveries._write_credential_delivery_state('queued')
+        self._trigger_worker()
+        return deliveries
+
+    @api.model
+    def _trigger_worker(self):
+        """Despierta al worker apenas termine la transacción actual"""
+        cron = self.env.ref(
+            'novasur_service_credentials.ir_cron_process_credential_deliveries',
+            raise_if_not_found=False
+        )
+        if cron:
+            cron.sudo()._trigger()
+
+    ##### Worker #####
+
+    @api.model
+    def cron_process_credential_deliveries(self, batch_size=DELIVERY_BATCH_SIZE):
+        """
+        Renderiza y envía en lote las entregas pendientes cuyo próximo intento ya venció.
+        Si quedan entregas pendientes, vuelve a programarse de inmediato.
+        
+        :param batch_size: Cantidad máxima de entregas por ejecución
+        :return: Número de entregas procesadas
+        """
+        deliveries = self.search([
+            ('state', '=', 'queued'),
+            ('next_attempt_date', '<=', fields.Datetime.now()),
+        ], limit=batch_size)
+        
+        if not deliveries:
+            return 0
+        
+        deliveries._process()
+        
+        if len(deliveries) == batch_size:
+            self.env.ref('novasur_service_credentials.ir_cron_process_credential_deliveries')._trigger()
+        
+        return len(deliveries)
+
+    def _process(self):
+        """Envía las entregas del recordset: un lote por tipo (una plantilla por tipo)"""
+        for delivery_type, deliveries in self.grouped('delivery_type').items():
+            deliveries._process_batch(delivery_type)
+
+    def _process_batch(self, delivery_type):
+        """Envía entregas de un mismo tipo y registra el resultado en bloque"""
+        template = self.env.ref(DELIVERY_TEMPLATES[delivery_type], raise_if_not_found=False)
+        if not template:
+            _logger.warning(f"No se encontró la plantilla de email para entregas '{delivery_type}'")
+            return
+        
+        # Entregas imposibles: credencial no asignada (o asiento liberado) o cliente sin email
+        invalid = self.filtered(lambda d: not d._is_deliverable())
+        if invalid:
+            invalid._mark_failed(_("Credencial no asignada o cliente sin email configurado."), retry=False)
+        
+        # Contraseñas que no se pueden descifrar: nunca se envía un correo sin contraseña
+        unreadable = self.browse()
+        if delivery_type in ACCESS_DELIVERY_TYPES:
+            undecryptable = (self - invalid).credential_id._get_undecryptable()
+            unreadable = (self - invalid).filtered(lambda d: d.credential_id in undecryptable)
+        if unreadable:
+            unreadable._mark_failed(_("No se pudo descifrar la contraseña de la credencial."), retry=False)
+            invalid |= unreadable
+        
+        deliveries = self - invalid
+        if not deliveries:
+            return
+        
+        # La plantilla de asientos se renderiza sobre el asiento (cliente de su orden)
+        record_field = 'seat_id' if delivery_type == 'seat' else 'credential_id'
+        try:
+            with self.env.cr.savepoint():
+                mails = template.send_mail_batch(deliveries[record_field].ids, force_send=False)
+                mails.send(raise_exception=False)
+        except Exception as e:
+            _logger.error(f"[ENTREGAS] Error al renderizar/enviar el lote de credenciales: {e}", exc_info=True)
+            deliveries._mark_failed(str(e))
+            return
+        
+        mail_by_record = {mail.res_id: mail for mail in mails}
+        sent = self.browse()
+        for delivery in deliveries:
+            mail = mail_by_record.get(delivery[record_field].id)
+            if mail and mail.state != 'exception':
+                sent |= delivery
+                delivery.mail_id = mail
+        
+        if sent:
+            now = fields.Datetime.now()
+            sent.write({
+                'state': 'sent',
+                'sent_date': now,
+                'attempt_count': 0,
+                'last_error': False,
+            })
+            sent._write_credential_delivery_state('sent')
+            self.env['service.credentials.event']._log(
+                'delivered', sent.credential_id,
+                payload={'type': delivery_type} if delivery_type != 'assigned' else None,
+            )
+        
+        failed = deliveries - sent
+        for delivery in failed:
+            mail = mail_by_record.get(delivery[record_field].id)
+            delivery.last_error = mail.failure_reason if mail else _("No se generó el correo.")
+        failed._mark_failed()
+        
+        _logger.info(f"[ENTREGAS] Lote procesado: {len(sent)} enviadas, {len(failed) + len(invalid)} con error")
+
+    def _is_deliverable(self):
+        """La credencial (o el asiento) sigue en uso y el cliente tiene email"""
+        self.ensure_one()
+        if self.delivery_type == 'seat':
+            in_use = self.seat_id.state == 'active'
+        else:
+            in_use = self.credential_id.state == 'assigned'
+        return in_use and bool(self.partner_id.email)
+
+    def _write_credential_delivery_state(self, state):
+        """
+        Refleja el resultado en ``delivery_state`` de la credencial. Solo cuentan las
+        entregas con datos de acceso; un asiento nunca degrada una credencial que ya
+        se entregó a otro asiento.
+        
+        :param state: Nuevo estado de entrega ('queued', 'sent' o 'failed')
+        """
+        credentials = self.filtered(lambda d: d.delivery_type == 'assigned').credential_id
+        seat_credentials = self.filtered(lambda d: d.delivery_type == 'seat').credential_id
+        if state != 'sent':
+            seat_credentials = seat_credentials.filtered(lambda c: c.delivery_state != 'sent')
+        (credentials | seat_credentials).write({'delivery_state': state})
+
+    def _mark_failed(self, error=None, retry=True):
+        """
+        Registra un intento fallido. Reprograma con backoff exponencial
+        (1, 2, 4, 8... minutos) hasta agotar los intentos.
+        
+        :param error: Mensaje de error a guardar (opcional)
+        :param retry: Si es False la entrega falla de forma definitiva
+        """
+        if not self:
+            return
+        
+        now = fields.Datetime.now()
+        vals = {'last_error': error} if error else {}
+        
+        # Agrupar por número de intento para escribir todas las del mismo grupo a la vez
+        by_attempt = {}
+        for delivery in self:
+            by_attempt.setdefault(delivery.attempt_count + 1, self.browse())
+            by_attempt[delivery.attempt_count + 1] |= delivery
+        
+        exhausted = self.browse()
+        for attempt, deliveries in by_attempt.items():
+            if not retry or attempt >= DELIVERY_MAX_ATTEMPTS:
+                exhausted |= deliveries
+                deliveries.write(dict(vals, attempt_count=attempt, state='failed'))
+            else:
+                deliveries.write(dict(
+                    vals,
+                    attempt_count=attempt,
+                    next_attempt_date=now + timedelta(minutes=2 ** (attempt - 1)),
+                ))
+        
+        if exhausted:
+            # El estado de entrega de la credencial solo sigue al correo con sus datos de acceso
+            exhausted._write_credential_delivery_state('failed')
+            self.env['service.credentials.event']._log(
+                'delivery_failed', exhausted.credential_id, payload={'error': error} if error else None
+            )
+            _logger.warning(f"[ENTREGAS] {len(exhausted)} entregas fallaron definitivamente")
+
+    ##### Acciones #####
+
+    def action_retry(self):
+        """Vuelve a encolar entregas fallidas o canceladas"""
+        self.write({
+            'state': 'queued',
+            'attempt_count': 0,
+            'next_attempt_date': fields.Datetime.now(),
+        })
+        self._write_credential_delivery_state('queued')
+        self.env.ref('novasur_service_credentials.ir_cron_process_credential_deliveries')._trigger()
+
+
+class ServiceCredentials(models.Model):
+    _inherit = "service.credentials"
+
+    delivery_state = fields.Selection([
+        ('none', 'Sin envío'),
+        ('queued', 'En cola'),
+        ('sent', 'Enviado'),
+        ('failed', 'Fallido'),
+    ], string="Estado de entrega", default='none', readonly=True, copy=False,
+        help="Estado del envío por email de las credenciales al cliente")
+
+    delivery_ids = fields.One2many(
+        "service.credentials.delivery",
+        "credential_id",
+        string="Entregas"
+    )
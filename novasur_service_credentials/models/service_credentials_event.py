@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define el registro de eventos de credenciales (append-only).
+##### Reemplaza los múltiples mensajes de chatter por asignación con filas compactas
+##### escritas en lote; el chatter queda como resumen opcional.
+
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+CHATTER_SUMMARY_PARAM = 'novasur_service_credentials.chatter_summary'
+
+
+class ServiceCredentialsEvent(models.Model):
+    _name = "service.credentials.event"
+    _description = "Evento de credencial"
+    _order = "date desc, id desc"
+    _log_access = False
+
+    credential_id = fields.Many2one(
+        "service.credentials",
+        string="Credencial",
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    event_type = fields.Selection([
+        ('assigned', 'Asignada'),
+        ('delivered', 'Email enviado'),
+        ('delivery_failed', 'Error de envío'),
+        ('expired', 'Expirada'),
+        ('pending_reset', 'Pendiente de reinicio'),
+        ('reset', 'Reiniciada'),
+        ('made_available', 'Disponible'),
+        ('reserved', 'Reservada'),
+        ('reservation_released', 'Reserva liberada'),
+        ('seat_assigned', 'Asiento asignado'),
+        ('seat_released', 'Asiento liberado'),
+        ('released', 'Liberada (venta cancelada)'),
+        ('renewed', 'Renovada'),
+        ('renewal_reverted', 'Renovación revertida'),
+        ('reset_failed', 'Error de reinicio'),
+    ], string="Evento", required=True, readonly=True)
+
+    sale_order_id = fields.Many2one(
+        "sale.order",
+        string="Orden de venta",
+        index='btree_not_null',
+        ondelete='set null',
+        readonly=True
+    )
+
+    date = fields.Datetime(
+        string="Fecha",
+        required=True,
+        default=fields.Datetime.now,
+        index=True,
+        readonly=True
+    )
+
+    user_id = fields.Many2one(
+        "res.users",
+        string="Usuario",
+        default=lambda self: self.env.uid,
+        ondelete='set null',
+        readonly=True
+    )
+
+    payload = fields.Json(string="Datos", readonly=True)
+
+    @api.model
+    def _log(self, event_type, credentials, payload=None, sale_order=None, payload_by_credential=None):
+        """
+        Registra un evento por credencial con un solo ``create``.
+        
+        :param event_type: Tipo de evento (ver ``event_type``)
+        :param credentials: Recordset de service.credentials
+        :param payload: Diccionario opcional con datos adicionales
+        :param sale_order: Orden de venta; por defecto la de cada credencial
+        :param payload_by_credential: Diccionario opcional {credential_id: datos propios},
+                                      combinado con ``payload``
+        :return: Recordset de eventos creados
+        """
+        if not credentials:
+            return self.browse()
+        
+        now = fields.Datetime.now()
+        payload_by_credential = payload_by_credential or {}
+        return self.sudo().create([{
+            'credential_id': credential.id,
+            'event_type': event_type,
+            'sale_order_id': (sale_order or credential.sale_order_id).id,
+            'date': now,
+            'payload': (
+                dict(payload or {}, **payload_by_credential[credential.id])
+                if credential.id in payload_by_credential else payload
+            ),
+        } for credential in credentials])
+
+
+class ServiceCredentials(models.Model):
+    _inherit = "service.credentials"
+
+    event_ids = fields.One2many(
+        "service.credentials.event",
+        "credential_id",
+        string="Historial"
+    )
+
+    @api.model
+    def _chatter_summary_enabled(self):
+        """Indica si además del registro de eventos se publican resúmenes en el chatter"""
+        return bool(self.env['ir.config_parameter'].sudo().get_param(CHATTER_SUMMARY_PARAM))
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define el pronóstico de quiebre de stock de credenciales.
+##### Un cron calcula con una sola consulta agregada el consumo promedio (media móvil)
+##### de cada servicio, proyecta la fecha de quiebre y abre una única actividad de
+##### reposición por producto cuando la cobertura cae bajo su umbral.
+
+from odoo import models, fields, api, _
+from odoo.tools import SQL
+from markupsafe import Markup
+from collections import defaultdict
+from datetime import timedelta
+from .service_credentials_allocation import AVAILABLE_STOCK_WHERE
+import logging
+
+_logger = logging.getLogger(__name__)
+
+FORECAST_WINDOW_PARAM = 'novasur_service_credentials.forecast_window'
+DEFAULT_FORECAST_WINDOW = 14  # días
+DEFAULT_COVER_THRESHOLD = 7  # días
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    credential_cover_threshold = fields.Integer(
+        string="Alerta de Cobertura (días)",
+        default=DEFAULT_COVER_THRESHOLD,
+        help="Se abre una actividad de reposición cuando el stock proyectado alcanza para menos "
+             "de estos días. Con 0 no se generan alertas."
+    )
+
+    credential_daily_consumption = fields.Float(
+        string="Consumo Diario Promedio",
+        readonly=True,
+        copy=False,
+        help="Media móvil de unidades asignadas por día (actualizada por el pronóstico)"
+    )
+
+    credential_cover_days = fields.Float(
+        string="Cobertura (días)",
+        readonly=True,
+        copy=False,
+        help="Días que alcanza el stock disponible al consumo promedio, en la compañía "
+             "con menor cobertura"
+    )
+
+    credential_stockout_date = fields.Datetime(
+        string="Quiebre de Stock Estimado",
+        readonly=True,
+        copy=False
+    )
+
+    ##### CRON #####
+
+    @api.model
+    def _get_forecast_window(self):
+        """Días de historia usados para la media móvil (configurable en Ajustes de Ventas)"""
+        days = self.env['ir.config_parameter'].sudo().get_param(FORECAST_WINDOW_PARAM)
+        try:
+            return max(int(days), 1) if days else DEFAULT_FORECAST_WINDOW
+        except ValueError:
+            return DEFAULT_FORECAST_WINDOW
+
+    @api.model
+    def cron_forecast_credential_stockout(self):
+        """
+        CRON: Pronostica el quiebre de stock de los servicios digitales.
+
+        1. Actualiza las asignaciones por día de la ventana (tabla de reporte; si el
+           cron de reportes la está recalculando en paralelo, se usa tal como está).
+        2. Una consulta agregada calcula, por producto y compañía, el consumo
+           promedio y las unidades vendibles (el stock de una compañía no cubre a
+           otra); por producto devuelve el consumo total y la menor cobertura.
+        3. El pronóstico de todos los productos se guarda con un solo UPDATE.
+        4. Los productos bajo su umbral reciben una actividad de reposición (una sola
+           por producto: si ya hay una abierta no se duplica) y las de los productos
+           repuestos se cierran.
+
+        :return: Número de productos en alerta
+        """
+        window = self._get_forecast_window()
+        today = fields.Date.today()
+        since = today - timedelta(days=window)
+
+        products = self.search([('is_digital_service', '=', True)])
+        if not products:
+            return 0
+
+        self.env.flush_all()
+        self.env['service.credentials.assignment.report']._refresh(since)
+        self.env.cr.execute(SQL(
+            """
+            WITH consumption AS (
+                SELECT product_id, company_id, sum(assigned_count)::float / %(window)s AS daily_rate
+                  FROM service_credentials_assignment_report
+                 WHERE day >= %(since)s AND day < %(today)s
+                   AND product_id = ANY(%(product_ids)s)
+              GROUP BY product_id, company_id
+                HAVING sum(assigned_count) > 0
+            ), stock AS (
+                SELECT product_id, company_id, sum(seat_capacity - seats_used) AS units
+                  FROM service_credentials
+                 WHERE %(stock)s
+                   AND product_id = ANY(%(product_ids)s) AND company_id IS NOT NULL
+              GROUP BY product_id, company_id
+            )
+            SELECT k.product_id, sum(k.daily_rate), min(COALESCE(s.units, 0) / k.daily_rate)
+              FROM consumption k
+         LEFT JOIN stock s ON s.product_id = k.product_id AND s.company_id = k.company_id
+          GROUP BY k.product_id
+            """,
+            window=window, since=since, today=today, product_ids=products.ids,
+            stock=SQL(AVAILABLE_STOCK_WHERE),
+        ))
+        forecast = {product_id: (rate, cover) for product_id, rate, cover in self.env.cr.fetchall()}
+
+        now = fields.Datetime.now()
+        at_risk = self.browse()
+        values = []
+        for product in products:
+            rate, cover = forecast.get(product.id, (0.0, 0.0))
+            # Los servicios sin consumo que ya estaban en cero no se reescriben
+            if rate or product.credential_daily_consumption:
+                values.append(SQL(
+                    "(%s, %s::float8, %s::float8, %s::timestamp)",
+                    product.id, rate, cover, now + timedelta(days=cover) if rate else None,
+                ))
+            if rate and product.credential_cover_threshold and cover < product.credential_cover_threshold:
+                at_risk |= product
+        self._write_forecast(values)
+
+        self._sync_stockout_alerts(at_risk, products - at_risk)
+        _logger.info(
+            f"[CRON] Pronóstico de stock: {len(forecast)} servicios con consumo, {len(at_risk)} en alerta"
+        )
+        return len(at_risk)
+
+    @api.model
+    def _write_forecast(self, values):
+        """
+        Guarda el pronóstico de todos los productos con una sola sentencia UPDATE.
+
+        :param values: Lista de SQL ``(id, consumo, cobertura, quiebre)``
+        """
+        if not values:
+            return
+        self.flush_model([
+            'credential_daily_consumption', 'credential_cover_days', 'credential_stockout_date',
+        ])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE product_product p
+               SET credential_daily_consumption = v.rate,
+                   credential_cover_days = v.cover,
+                   credential_stockout_date = v.stockout,
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(id, rate, cover, stockout)
+             WHERE p.id = v.id
+            """,
+            self.env.uid, SQL(", ").join(values),
+        ))
+        self.invalidate_model([
+            'credential_daily_consumption', 'credential_cover_days', 'credential_stockout_date',
+            'write_uid', 'write_date',
+        ])
+
+    @api.model
+    def _sync_stockout_alerts(self, at_risk, recovered):
+        """
+        Abre una actividad por producto en riesgo (sin duplicar las abiertas) y
+        cierra las de los productos que ya no lo están. Una búsqueda y un create.
+
+        :param at_risk: Productos con cobertura bajo el umbral
+        :param recovered: Productos sin riesgo
+        """
+        activity_type = self.env.ref(
+            'novasur_service_credentials.mail_activity_type_credential_stockout',
+            raise_if_not_found=False
+        )
+        if not activity_type:
+            return
+
+        Activity = self.env['mail.activity'].sudo()
+        templates = (at_risk | recovered).product_tmpl_id
+        open_by_template = defaultdict(lambda: Activity)
+        for activity in Activity.search([
+            ('res_model', '=', 'product.template'),
+            ('res_id', 'in', templates.ids),
+            ('activity_type_id', '=', activity_type.id),
+        ]):
+            open_by_template[activity.res_id] |= activity
+
+        # Cerrar las alertas de productos repuestos
+        closed = Activity
+        for template in recovered.product_tmpl_id - at_risk.product_tmpl_id:
+            closed |= open_by_template[template.id]
+        if closed:
+            closed.action_feedback(feedback=_("Cobertura repuesta"))
+
+        to_alert = at_risk.filtered(lambda p: not open_by_template[p.product_tmpl_id.id])
+        if not to_alert:
+            return
+
+        res_model_id = self.env['ir.model']._get_id('product.template')
+        user_id = self.env.ref('base.user_admin').id
+        note = Markup(_(
+            'El servicio <strong>%s</strong> consume <strong>%.1f</strong> credenciales por día '
+            'y su stock alcanza para <strong>%.1f</strong> días (umbral: %d).<br/>'
+            'Quiebre estimado: <strong>%s</strong>. Importe nuevas credenciales.'
+        ))
+        Activity.create([{
+            'res_model_id': res_model_id,
+            'res_id': product.product_tmpl_id.id,
+            'activity_type_id': activity_type.id,
+            'summary': _('Reponer credenciales'),
+            'note': note % (
+                product.display_name,
+                product.credential_daily_consumption,
+                product.credential_cover_days,
+                product.credential_cover_threshold,
+                product.credential_stockout_date.strftime('%d/%m/%Y %H:%M'),
+            ),
+            'date_deadline': product.credential_stockout_date.date(),
+            'user_id': user_id,
+        } for product in to_alert])
+
+        _logger.warning(f"[CRON] ⚠️ {len(to_alert)} servicios con riesgo de quiebre de stock de credenciales")
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    credential_cover_threshold = fields.Integer(
+        string="Alerta de Cobertura (días)",
+        related='product_variant_id.credential_cover_threshold',
+        readonly=False
+    )
+
+    credential_daily_consumption = fields.Float(
+        string="Consumo Diario Promedio",
+        related='product_variant_id.credential_daily_consumption'
+    )
+
+    credential_cover_days = fields.Float(
+        string="Cobertura (días)",
+        related='product_variant_id.credential_cover_days'
+    )
+
+    credential_stockout_date = fields.Datetime(
+        string="Quiebre de Stock Estimado",
+        related='product_variant_id.credential_stockout_date'
+    )
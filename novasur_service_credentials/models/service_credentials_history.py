@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define el archivo histórico (datos fríos) de credenciales.
+##### Las credenciales expiradas o archivadas más antiguas que la retención se mueven,
+##### junto con sus eventos, a service.credentials.history en bloques confirmados por
+##### separado, de modo que service.credentials solo contenga el pool vivo.
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from datetime import timedelta
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+ARCHIVE_RETENTION_PARAM = 'novasur_service_credentials.archive_retention_days'
+DEFAULT_ARCHIVE_RETENTION = 180  # días
+ARCHIVE_BATCH_SIZE = 1000
+
+
+class ServiceCredentialsHistory(models.Model):
+    _name = "service.credentials.history"
+    _description = "Histórico de credenciales archivadas"
+    _order = "archived_date desc, id desc"
+    _rec_name = "login"
+    _log_access = False
+
+    original_id = fields.Integer(string="ID original", index=True, readonly=True)
+
+    product_id = fields.Many2one(
+        "product.product",
+        string="Servicio",
+        index=True,
+        ondelete='set null',
+        readonly=True
+    )
+
+    login = fields.Char(string="Correo / Usuario", readonly=True)
+
+    final_state = fields.Selection(
+        selection='_selection_final_state',
+        string="Estado final",
+        readonly=True
+    )
+
+    active_at_archive = fields.Boolean(string="Activa al archivar", readonly=True)
+
+    partner_id = fields.Many2one("res.partner", string="Cliente", ondelete='set null', readonly=True)
+
+    sale_order_id = fields.Many2one("sale.order", string="Orden de venta", ondelete='set null', readonly=True)
+
+    company_id = fields.Many2one("res.company", string="Compañía", ondelete='set null', readonly=True)
+
+    batch_ref = fields.Char(string="Lote del proveedor", readonly=True)
+
+    assign_date = fields.Datetime(string="Fecha de asignación", readonly=True)
+
+    expire_date = fields.Datetime(string="Fecha de expiración", readonly=True)
+
+    archived_date = fields.Datetime(string="Fecha de archivo", index=True, readonly=True)
+
+    events = fields.Json(string="Eventos", readonly=True)
+
+    events_text = fields.Text(string="Detalle de eventos", compute='_compute_events_text')
+
+    @api.model
+    def _selection_final_state(self):
+        return self.env['service.credentials']._fields['state']._description_selection(self.env)
+
+    @api.depends('events')
+    def _compute_events_text(self):
+        """Muestra los eventos archivados como texto legible (uno por línea)"""
+        labels = dict(self.env['service.credentials.event']._fields['event_type']._description_selection(self.env))
+        for rec in self:
+            rec.events_text = "\n".join(
+                f"{event.get('date') or ''}  {labels.get(event.get('type'), event.get('type'))}"
+                + (f"  {json.dumps(event['payload'], ensure_ascii=False)}" if event.get('payload') else "")
+                for event in rec.events or []
+            )
+
+
+class ServiceCredentials(models.Model):
+    _inherit = "service.credentials"
+
+    @api.model
+    def _get_archive_retention_days(self):
+        """Días que una credencial expirada o archivada permanece en la tabla viva"""
+        days = self.env['ir.config_parameter'].sudo().get_param(ARCHIVE_RETENTION_PARAM)
+        try:
+            return int(days) if days else DEFAULT_ARCHIVE_RETENTION
+        except ValueError:
+            return DEFAULT_ARCHIVE_RETENTION
+
+    ##### CRON #####
+
+    @api.model
+    def cron_archive_credentials(self, batch_size=ARCHIVE_BATCH_SIZE, max_batches=50):
+        """
+        CRON: Mueve al histórico las credenciales expiradas o archivadas cuya
+        última modificación es anterior a la retención.
+
+        Cada bloque es un ``INSERT ... SELECT`` (con los eventos agregados en JSON)
+        seguido del borrado en la tabla viva, y se confirma por separado. Si quedan
+        pendientes, el cron vuelve a programarse.
+
+        :param batch_size: Credenciales por bloque
+        :param max_batches: Bloques máximos por ejecución
+        :return: Número de credenciales archivadas
+        """
+        cutoff = fields.Datetime.now() - timedelta(days=self._get_archive_retention_days())
+        total = 0
+        for _batch in range(max_batches):
+            archived = self._archive_credentials_batch(cutoff, batch_size)
+            total += archived
+            if archived < batch_size:
+                break
+            self._cron_commit()
+            self.env.invalidate_all()
+        else:
+            self.env.ref('novasur_service_credentials.ir_cron_archive_credentials')._trigger()
+
+        _logger.info(f"[CRON] {total} credenciales movidas al histórico")
+        return total
+
+    @api.model
+    def _archive_credentials_batch(self, cutoff, limit):
+        """
+        Archiva un bloque: copia credenciales y eventos al histórico con una sola
+        sentencia y elimina las filas de la tabla viva.
+
+        :return: Número de credenciales archivadas
+        """
+        self.env.flush_all()
+        self.env.cr.execute(SQL(
+            """
+            WITH batch AS (
+                SELECT c.id
+                  FROM service_credentials c
+                 WHERE (c.state = 'expired' OR NOT c.active)
+                   AND c.write_date < %(cutoff)s
+                   AND NOT EXISTS (
+                        SELECT 1 FROM service_credentials_seat s
+                         WHERE s.credential_id = c.id AND s.state = 'active'
+                   )
+              ORDER BY c.id
+                 LIMIT %(limit)s
+                   FOR UPDATE SKIP LOCKED
+            )
+            INSERT INTO service_credentials_history (
+                original_id, product_id, login, final_state, active_at_archive,
+                partner_id, sale_order_id, company_id, batch_ref,
+                assign_date, expire_date, archived_date, events
+            )
+            SELECT c.id, c.product_id, c.login, c.state, c.active,
+                   c.partner_id, c.sale_order_id, c.company_id, c.batch_ref,
+                   c.assign_date, c.expire_date, (now() at time zone 'UTC'),
+                   (SELECT jsonb_agg(jsonb_build_object(
+                                'type', e.event_type,
+                                'date', e.date,
+                                'sale_order_id', e.sale_order_id,
+                                'user_id', e.user_id,
+                                'payload', e.payload
+                           ) ORDER BY e.date, e.id)
+                      FROM service_credentials_event e
+                     WHERE e.credential_id = c.id)
+              FROM service_credentials c
+              JOIN batch b ON b.id = c.id
+         RETURNING original_id
+            """,
+            cutoff=cutoff, limit=limit,
+        ))
+        credential_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not credential_ids:
+            return 0
+
+        # El borrado pasa por el ORM (contadores, chatter, entregas); los eventos caen en cascada
+        self.with_context(active_test=False).browse(credential_ids).sudo().unlink()
+        return len(credential_ids)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+##### Este archivo contiene la API de importación masiva de credenciales.
+##### Procesa las filas en bloques: valida en memoria, detecta colisiones con
+##### el pool existente con una consulta por bloque e inserta en lote sin tracking.
+
+from odoo import models, api, _
+from odoo.tools import SQL
+from itertools import islice
+import logging
+
+_logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 20
+
+
+class ServiceCredentialsImport(models.Model):
+    _inherit = "service.credentials"
+
+    @api.model
+    def _import_credentials(self, rows, default_product=None, chunk_size=IMPORT_CHUNK_SIZE,
+                            default_batch_ref=False):
+        """
+        Importa credenciales de forma masiva.
+        
+        Cada fila es un diccionario con ``login``, ``password`` y opcionalmente
+        ``product`` (referencia interna o ID del producto), ``notes``, ``seats``
+        (asientos de una cuenta compartida, 1 por defecto) y ``batch`` (lote del
+        proveedor). Las filas
+        se consumen en bloques, por lo que ``rows`` puede ser un generador.
+        
+        :param rows: Iterable de diccionarios
+        :param default_product: Producto a usar si la fila no indica uno
+        :param chunk_size: Cantidad de filas por bloque
+        :param default_batch_ref: Lote del proveedor si la fila no indica uno
+        :return: Diccionario con el resumen de la importación
+        """
+        summary = {
+            'created': 0,
+            'skipped_existing': 0,
+            'skipped_duplicate': 0,
+            'errors': [],
+            'error_count': 0,
+        }
+        product_cache = {}
+        seen = set()
+        first_created = self.browse()
+        
+        Credentials = self.with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_create_nosubscribe=True,
+        )
+        
+        rows = iter(rows)
+        line_number = 1
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            
+            # 1) Normalizar y validar en memoria
+            candidates = []
+            self._resolve_import_products(chunk, product_cache)
+            for row in chunk:
+                line_number += 1
+                login = (row.get('login') or '').strip()
+                password = row.get('password') or ''
+                product_key = (row.get('product') or '').strip()
+                product_id = product_cache.get(product_key) if product_key else (
+                    default_product.id if default_product else False
+                )
+                
+                error = None
+                seats = (row.get('seats') or '1').strip()
+                if not login:
+                    error = _("el login/correo está vacío")
+                elif not password:
+                    error = _("la contraseña está vacía")
+                elif not product_id:
+                    error = _("producto '%s' no encontrado") % product_key if product_key else _("sin producto")
+                elif not seats.isdigit() or int(seats) < 1:
+                    error = _("cantidad de asientos inválida: '%s'") % seats
+                if error:
+                    summary['error_count'] += 1
+                    if len(summary['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+                        summary['errors'].append(_("Línea %d: %s") % (line_number, error))
+                    continue
+                
+                if (product_id, login) in seen:
+                    summary['skipped_duplicate'] += 1
+                    continue
+                seen.add((product_id, login))
+                candidates.append((
+                    product_id, login, password, row.get('notes') or False, int(seats),
+                    (row.get('batch') or '').strip() or default_batch_ref,
+                ))
+            
+            if not candidates:
+                continue
+            
+            # 2) Colisiones con el pool existente: una consulta por bloque
+            existing = self._get_existing_logins(
+                [c[0] for c in candidates], [c[1] for c in candidates]
+            )
+            new_rows = [c for c in candidates if (c[0], c[1]) not in existing]
+            summary['skipped_existing'] += len(candidates) - len(new_rows)
+            if not new_rows:
+                continue
+            
+            # 3) Encriptar en lote e insertar
+            encrypted = self._encrypt_passwords([c[2] for c in new_rows])
+            records = Credentials.create([{
+                'product_id': product_id,
+                'login': login,
+                'password_encrypted': password_encrypted,
+                'notes': notes,
+                'seat_capacity': seats,
+                'batch_ref': batch_ref,
+            } for (product_id, login, _password, notes, seats, batch_ref), password_encrypted
+                in zip(new_rows, encrypted)])
+            
+            summary['created'] += len(records)
+            first_created = first_created or records[:1]
+            
+            # Liberar memoria del bloque ya insertado
+            self.env.flush_all()
+            self.env.invalidate_all()
+        
+        _logger.info(
+            f"[IMPORT] Credenciales importadas: {summary['created']} creadas, "
+            f"{summary['skipped_existing']} ya existentes, {summary['skipped_duplicate']} duplicadas, "
+            f"{summary['error_count']} con error"
+        )
+        
+        # Un solo mensaje resumen por importación
+        if first_created:
+            first_created.message_post(
+                body=_(
+                    "Importación masiva: %(created)s credenciales creadas, "
+                    "%(existing)s ya existentes, %(duplicate)s duplicadas en el archivo, "
+                    "%(errors)s filas con error.",
+                    created=summary['created'],
+                    existing=summary['skipped_existing'],
+                    duplicate=summary['skipped_duplicate'],
+                    errors=summary['error_count'],
+                ),
+                subject=_("Importación de Credenciales")
+            )
+        
+        return summary
+
+    @api.model
+    def _resolve_import_products(self, chunk, product_cache):
+        """
+        Resuelve en una sola consulta los productos del bloque que aún no están en caché.
+        Acepta la referencia interna (default_code) o el ID del producto.
+        
+        :param chunk: Lista de filas del bloque
+        :param product_cache: Diccionario {clave: product_id} compartido entre bloques
+        """
+        keys = {
+            (row.get('product') or '').strip() for row in chunk
+        } - set(product_cache) - {''}
+        if not keys:
+            return
+        
+        ids = [int(key) for key in keys if key.isdigit()]
+        products = self.env['product.product'].search_fetch(
+            ['|', ('default_code', 'in', list(keys)), ('id', 'in', ids)],
+            ['default_code'],
+        )
+        for product in products:
+            if product.default_code in keys:
+                product_cache[product.default_code] = product.id
+            if str(product.id) in keys:
+                product_cache.setdefault(str(product.id), product.id)
+        for key in keys:
+            product_cache.setdefault(key, False)
+
+    @api.model
+    def _get_existing_logins(self, product_ids, logins):
+        """
+        Devuelve los pares (product_id, login) que ya existen en el pool,
+        incluyendo credenciales archivadas (la restricción única las considera).
+        
+        :param product_ids: Lista de IDs de productos
+        :param logins: Lista de logins (mismo orden que ``product_ids``)
+        :return: Conjunto de tuplas (product_id, login)
+        """
+        self.flush_model(['product_id', 'login'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT c.product_id, c.login
+              FROM service_credentials c
+              JOIN unnest(%s::int[], %s::varchar[]) AS n(product_id, login)
+                ON c.product_id = n.product_id AND c.login = n.login
+            """,
+            list(product_ids), list(logins),
+        ))
+        return set(self.env.cr.fetchall())
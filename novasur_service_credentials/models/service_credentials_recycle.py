@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+##### Este archivo implementa el reciclaje automático de credenciales.
+##### Las credenciales expiradas pasan a "pendiente de reinicio" tras un período de
+##### gracia; un cron ejecuta el reinicio de cada cuenta con el proveedor configurado
+##### en su producto (hilos acotados y límite de llamadas por proveedor) y devuelve
+##### las reiniciadas al pool en bloque. Los reinicios fallidos se reintentan con
+##### backoff y, agotados los intentos, quedan en la cola de fallas.
+#####
+##### El script de reinicio se configura en el servidor (odoo.conf):
+#####     service_credentials_reset_script = /ruta/al/script
+##### Se invoca como ``script <proveedor> <login>`` con los datos de la cuenta en JSON
+##### por stdin; si imprime ``{"password": "..."}`` la contraseña se actualiza.
+
+from odoo import models, fields, api, _
+from odoo.tools import config, SQL
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from datetime import timedelta
+import functools
+import subprocess
+import threading
+import json
+import time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+RECYCLE_GRACE_PARAM = 'novasur_service_credentials.recycle_grace_days'
+DEFAULT_RECYCLE_GRACE = 3  # días
+RESET_SCRIPT_OPTION = 'service_credentials_reset_script'
+RESET_SCRIPT_TIMEOUT = 60  # segundos
+RECYCLE_BATCH_SIZE = 200
+RECYCLE_MAX_WORKERS = 8
+RECYCLE_RUN_MINUTES = 5  # cada ejecución procesa a lo sumo lo que el límite permite en este tiempo
+RECYCLE_MAX_ATTEMPTS = 5
+
+# Limitadores por (base, proveedor): viven en el worker y se comparten entre ejecuciones
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+class _RateLimiter:
+    """Espaciado mínimo entre llamadas a un proveedor, compartido entre hilos"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _get_rate_limiter(key, per_minute):
+    with _RATE_LIMITERS_LOCK:
+        limiter = _RATE_LIMITERS.get(key)
+        if limiter is None or limiter.interval != (60.0 / per_minute if per_minute else 0.0):
+            limiter = _RATE_LIMITERS[key] = _RateLimiter(per_minute)
+        return limiter
+
+
+def _run_reset_script(script, provider, payload):
+    """
+    Hook de reinicio por script externo. Corre en un hilo sin acceso a la base.
+
+    :return: Diccionario con la nueva ``password`` (opcional)
+    """
+    result = subprocess.run(
+        [script, provider, payload['login']],
+        input=json.dumps(payload),
+        capture_output=True,
+        text=True,
+        timeout=RESET_SCRIPT_TIMEOUT,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError((result.stderr or result.stdout or f"código {result.returncode}").strip()[:500])
+    output = result.stdout.strip()
+    return json.loads(output) if output.startswith('{') else {}
+
+
+class ServiceCredentialsResetRun(models.Model):
+    _name = "service.credentials.reset.run"
+    _description = "Ejecución del reciclaje de credenciales"
+    _order = "date desc, id desc"
+    _rec_name = "date"
+    _log_access = False
+
+    date = fields.Datetime(string="Fecha", required=True, default=fields.Datetime.now, index=True, readonly=True)
+    provider = fields.Char(string="Proveedor", readonly=True)
+    processed_count = fields.Integer(string="Procesadas", readonly=True)
+    success_count = fields.Integer(string="Reiniciadas", readonly=True)
+    failure_count = fields.Integer(string="Con error", readonly=True)
+    duration = fields.Float(string="Duración (s)", readonly=True)
+    throughput = fields.Float(
+        string="Reinicios por minuto",
+        readonly=True,
+        aggregator='avg'
+    )
+
+
+class ServiceCredentialsRecycle(models.Model):
+    _inherit = "service.credentials"
+
+    reset_attempts = fields.Integer(string="Intentos de reinicio", readonly=True, copy=False)
+
+    reset_next_attempt = fields.Datetime(string="Próximo intento de reinicio", readonly=True, copy=False)
+
+    reset_error = fields.Text(string="Error de reinicio", readonly=True, copy=False)
+
+    reset_failed = fields.Boolean(
+        string="Reinicio fallido",
+        readonly=True,
+        copy=False,
+        help="El reinicio automático agotó sus intentos: la cuenta espera revisión manual"
+    )
+
+    def write(self, vals):
+        # Cada paso a "pendiente de reinicio" empieza con los intentos en cero
+        if vals.get('state') == 'pending_reset':
+            vals = dict(vals, reset_attempts=0, reset_next_attempt=False, reset_error=False, reset_failed=False)
+        return super().write(vals)
+
+    ##### Registro de proveedores #####
+
+    @api.model
+    def _get_reset_providers(self):
+        """
+        Registro de proveedores de reinicio. Otros módulos pueden extenderlo.
+
+        Cada proveedor define:
+        - ``name``: Etiqueta para el producto
+        - ``hook``: Callable ``hook(payload) -> dict`` o None (reinicio manual). Corre en
+          un hilo sin acceso a la base: solo recibe ``payload`` (id, login, password,
+          product, batch_ref) y puede devolver ``{'password': nueva}``; si falla, lanza
+          una excepción
+        - ``rate_limit``: Llamadas por minuto (0 sin límite)
+        - ``max_workers``: Hilos simultáneos
+
+        :return: Diccionario {clave: proveedor}
+        """
+        script = config.get(RESET_SCRIPT_OPTION)
+        return {
+            'manual': {
+                'name': _("Manual"),
+                'hook': None,
+                'rate_limit': 0,
+                'max_workers': 1,
+            },
+            'script': {
+                'name': _("Script del servidor"),
+                'hook': functools.partial(_run_reset_script, script, 'script') if script else None,
+                'rate_limit': 30,
+                'max_workers': 4,
+            },
+        }
+
+    @api.model
+    def _get_recycle_grace_days(self):
+        """Días que una credencial expirada espera antes de pasar a reinicio"""
+        days = self.env['ir.config_parameter'].sudo().get_param(RECYCLE_GRACE_PARAM)
+        try:
+            return int(days) if days else DEFAULT_RECYCLE_GRACE
+        except ValueError:
+            return DEFAULT_RECYCLE_GRACE
+
+    ##### CRON #####
+
+    @api.model
+    def cron_recycle_credentials(self, batch_size=RECYCLE_BATCH_SIZE):
+        """
+        CRON: Pipeline de reciclaje.
+
+        1. Las expiradas con más días que la gracia pasan a 'pending_reset' (un write).
+        2. Las pendientes cuyo producto tiene proveedor automático se reinician en
+           hilos (por proveedor, con su límite de llamadas).
+        3. Las reiniciadas vuelven a 'available' en bloque; las fallidas se reprograman
+           o pasan a la cola de fallas.
+
+        :param batch_size: Credenciales máximas por proveedor y ejecución
+        :return: Número de credenciales reiniciadas
+        """
+        self._promote_expired_to_reset()
+        self._cron_commit()
+
+        providers = self._get_reset_providers()
+        automatic = {key: provider for key, provider in providers.items() if provider['hook']}
+        if not automatic:
+            return 0
+
+        now = fields.Datetime.now()
+        pending = self.search([
+            ('state', '=', 'pending_reset'),
+            ('reset_failed', '=', False),
+            ('product_id.credential_reset_provider', 'in', list(automatic)),
+            '|', ('reset_next_attempt', '=', False), ('reset_next_attempt', '<=', now),
+        ], order='id')
+
+        by_provider = defaultdict(lambda: self.browse())
+        for credential in pending:
+            by_provider[credential.product_id.credential_reset_provider] |= credential
+
+        total = 0
+        backlog = False
+        for key, credentials in by_provider.items():
+            provider = automatic[key]
+            limit = batch_size
+            if provider['rate_limit']:
+                limit = min(limit, provider['rate_limit'] * RECYCLE_RUN_MINUTES)
+            backlog = backlog or len(credentials) > limit
+            total += self._run_reset_provider(key, provider, credentials[:limit])
+            self._cron_commit()
+
+        if backlog:
+            self.env.ref('novasur_service_credentials.ir_cron_recycle_credentials')._trigger()
+        return total
+
+    @api.model
+    def _promote_expired_to_reset(self):
+        """Pasa a 'pending_reset' las expiradas cuya gracia terminó (un solo write)"""
+        cutoff = fields.Datetime.now() - timedelta(days=self._get_recycle_grace_days())
+        expired = self.search([
+            ('state', '=', 'expired'),
+            ('expire_date', '!=', False),
+            ('expire_date', '<', cutoff),
+        ])
+        if expired:
+            expired.with_context(tracking_disable=True).write({'state': 'pending_reset'})
+            self.env['service.credentials.event']._log(
+                'pending_reset', expired, payload={'reason': 'grace_period'}
+            )
+            _logger.info(f"[RECICLAJE] {len(expired)} credenciales expiradas pasan a reinicio")
+        return expired
+
+    def _run_reset_provider(self, key, provider, credentials):
+        """
+        Ejecuta el hook del proveedor para las credenciales con un pool de hilos
+        acotado y aplica los resultados en bloque.
+
+        El lote se bloquea antes de llamar a los hooks: mientras el proveedor reinicia
+        las cuentas, ningún reinicio manual ni reasignación puede tocar esas filas.
+
+        :return: Número de credenciales reiniciadas
+        """
+        credentials = self._claim_pending_reset(credentials)
+        if not credentials:
+            return 0
+
+        # Los datos se leen aquí: los hilos no tocan la base
+        payloads = [{
+            'id': credential.id,
+            'login': credential.login,
+            'password': credential.password,
+            'product': credential.product_id.display_name,
+            'batch_ref': credential.batch_ref or '',
+        } for credential in credentials]
+
+        hook = provider['hook']
+        limiter = _get_rate_limiter((self.env.cr.dbname, key), provider['rate_limit'])
+
+        def reset(payload):
+            limiter.wait()
+            try:
+                return payload['id'], hook(payload) or {}, None
+            except Exception as e:
+                return payload['id'], None, str(e) or e.__class__.__name__
+
+        started = time.monotonic()
+        workers = max(min(provider['max_workers'], RECYCLE_MAX_WORKERS, len(payloads)), 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'credential_reset_{key}') as executor:
+            results = list(executor.map(reset, payloads))
+        duration = time.monotonic() - started
+
+        succeeded = {credential_id: result for credential_id, result, error in results if error is None}
+        errors = {credential_id: error for credential_id, _result, error in results if error is not None}
+
+        self._apply_reset_results(succeeded, errors)
+
+        self.env['service.credentials.reset.run'].sudo().create({
+            'provider': key,
+            'processed_count': len(results),
+            'success_count': len(succeeded),
+            'failure_count': len(errors),
+            'duration': duration,
+            'throughput': len(succeeded) / (duration / 60) if duration else 0.0,
+        })
+        _logger.info(
+            f"[RECICLAJE] Proveedor {key}: {len(succeeded)} reiniciadas, {len(errors)} con error "
+            f"en {duration:.1f} s"
+        )
+        return len(succeeded)
+
+    def _claim_pending_reset(self, credentials):
+        """
+        Bloquea las credenciales que siguen en 'pending_reset' con
+        ``FOR UPDATE SKIP LOCKED``; las tomadas por otra transacción o que ya
+        cambiaron de estado quedan fuera.
+
+        :return: Credenciales bloqueadas (en orden de id)
+        """
+        if not credentials:
+            return self.browse()
+        self.flush_model(['state'])
+        self.env.cr.execute(SQL(
+            """
+            SELECT id FROM service_credentials
+             WHERE id = ANY(%s) AND state = 'pending_reset'
+          ORDER BY id
+               FOR UPDATE SKIP LOCKED
+            """,
+            credentials.ids,
+        ))
+        claimed = self.browse([row[0] for row in self.env.cr.fetchall()])
+        # El estado en caché puede ser anterior al bloqueo
+        claimed.invalidate_recordset()
+        return claimed
+
+    @api.model
+    def _apply_reset_results(self, succeeded, errors):
+        """
+        Aplica el resultado de los reinicios:
+        - Nuevas contraseñas: un write por credencial (cada valor se cifra distinto),
+          solo si la credencial sigue en 'pending_reset', y se confirman antes de la
+          transición: el proveedor ya las aplicó y no deben perderse si algo falla después.
+        - Reiniciadas: vuelven a 'available' con un solo write y un evento por credencial.
+        - Con error: backoff exponencial agrupado por intento; agotados, a la cola de fallas.
+
+        :param succeeded: Diccionario {credential_id: resultado del hook}
+        :param errors: Diccionario {credential_id: mensaje de error}
+        """
+        pending = self.browse(list(succeeded)).filtered(lambda c: c.state == 'pending_reset')
+        for credential in pending:
+            if succeeded[credential.id].get('password'):
+                credential.write({'password': succeeded[credential.id]['password']})
+        self._cron_commit()
+
+        # La confirmación libera los bloqueos: se vuelve a tomar el lote antes de la transición
+        claimed = self._claim_pending_reset(pending | self.browse(list(errors)))
+        reset = claimed.filtered(lambda c: c.id in succeeded)
+        if reset:
+            reset.with_context(bulk_mode=True).action_reset_account()
+
+        failed = claimed.filtered(lambda c: c.id in errors)
+        if not failed:
+            return
+
+        now = fields.Datetime.now()
+        by_attempt = defaultdict(lambda: self.browse())
+        for credential in failed:
+            by_attempt[credential.reset_attempts + 1] |= credential
+
+        exhausted = self.browse()
+        for attempt, credentials in by_attempt.items():
+            if attempt >= RECYCLE_MAX_ATTEMPTS:
+                exhausted |= credentials
+                credentials.write({'reset_attempts': attempt, 'reset_failed': True})
+            else:
+                credentials.write({
+                    'reset_attempts': attempt,
+                    'reset_next_attempt': now + timedelta(minutes=5 * 2 ** (attempt - 1)),
+                })
+        self._write_reset_errors({credential.id: errors[credential.id] for credential in failed})
+
+        self.env['service.credentials.event']._log(
+            'reset_failed', failed, payload={'exhausted': exhausted.ids}
+        )
+        if exhausted:
+            _logger.warning(f"[RECICLAJE] {len(exhausted)} credenciales pasan a la cola de fallas de reinicio")
+
+    @api.model
+    def _write_reset_errors(self, errors):
+        """
+        Guarda el mensaje de error de cada credencial con una sola sentencia UPDATE.
+
+        :param errors: Diccionario {credential_id: mensaje de error}
+        """
+        if not errors:
+            return
+        self.flush_model(['reset_error'])
+        self.env.cr.execute(SQL(
+            """
+            UPDATE service_credentials c
+               SET reset_error = v.error
+              FROM (VALUES %s) AS v(id, error)
+             WHERE c.id = v.id
+            """,
+            SQL(", ").join(SQL("(%s, %s)", credential_id, error) for credential_id, error in errors.items()),
+        ))
+        self.browse(list(errors)).invalidate_recordset(['reset_error'])
+
+    ##### Acciones #####
+
+    def action_retry_reset(self):
+        """Devuelve credenciales de la cola de fallas al reciclaje automático"""
+        self.filtered(lambda c: c.state == 'pending_reset').write({
+            'reset_attempts': 0,
+            'reset_next_attempt': False,
+            'reset_error': False,
+            'reset_failed': False,
+        })
+        self.env.ref('novasur_service_credentials.ir_cron_recycle_credentials')._trigger()
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    credential_reset_provider = fields.Selection(
+        selection='_selection_credential_reset_provider',
+        string="Reinicio de Cuentas",
+        default='manual',
+        required=True,
+        help="Cómo se reinician las cuentas pendientes de reinicio de este servicio"
+    )
+
+    @api.model
+    def _selection_credential_reset_provider(self):
+        providers = self.env['service.credentials']._get_reset_providers()
+        return [(key, provider['name']) for key, provider in providers.items()]
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    credential_reset_provider = fields.Selection(
+        string="Reinicio de Cuentas",
+        related='product_variant_id.credential_reset_provider',
+        readonly=False
+    )
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define los modelos de análisis del pool de credenciales.
+##### Son tablas de reporte que un cron mantiene con INSERT ... SELECT agrupados:
+##### las asignaciones por día se recalculan solo para los días recientes y la salud
+##### del pool solo para los productos que cambiaron desde la última actualización.
+##### Los tableros leen estas tablas y nunca agrupan service.credentials en vivo.
+
+from odoo import models, fields, api
+from odoo.tools import SQL, create_index
+from datetime import timedelta
+from psycopg2 import errors as pg_errors
+from .service_credentials_allocation import AVAILABLE_STOCK_WHERE
+import logging
+
+_logger = logging.getLogger(__name__)
+
+REPORT_REFRESH_PARAM = 'novasur_service_credentials.report_last_refresh'
+REPORT_FULL_REFRESH_PARAM = 'novasur_service_credentials.report_last_full_refresh'
+REPORT_HISTORY_DAYS = 90
+REPORT_DEPLETION_WINDOW = 30  # días usados para la tasa de consumo
+REPORT_REFRESH_OVERLAP = 10  # minutos que se vuelven a mirar por transacciones en curso
+
+# Candado consultivo compartido por todos los que recalculan las asignaciones por día
+# (cron de reportes y pronóstico de quiebre)
+ASSIGNMENT_REPORT_LOCK = 0x4E565343  # 'NVSC'
+
+
+class ServiceCredentialsAssignmentReport(models.Model):
+    _name = "service.credentials.assignment.report"
+    _description = "Asignaciones de credenciales por día"
+    _order = "day desc, product_id"
+    _rec_name = "product_id"
+    _log_access = False
+
+    day = fields.Date(string="Día", required=True, index=True, readonly=True)
+
+    product_id = fields.Many2one(
+        "product.product",
+        string="Servicio",
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    company_id = fields.Many2one(
+        "res.company",
+        string="Compañía",
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    assigned_count = fields.Integer(string="Asignadas", readonly=True)
+
+    _sql_constraints = [
+        ('day_product_company_unique',
+         'UNIQUE(day, product_id, company_id)',
+         'Solo puede haber una fila por día, servicio y compañía.'),
+    ]
+
+    @api.model
+    def _refresh(self, since_day, purge_before=None):
+        """
+        Recalcula las filas desde ``since_day`` con una sola sentencia: cuenta las
+        asignaciones completas (eventos 'assigned') y los asientos ocupados.
+
+        Todos los llamadores comparten un candado consultivo: si otro proceso está
+        recalculando, o confirmó un recálculo después de que empezó esta transacción
+        (choque con ``day_product_company_unique``), se omite y las filas quedan como están.
+
+        :param since_day: Primer día a recalcular (date)
+        :param purge_before: Si se indica, también borra los días anteriores a esta fecha
+        :return: True si se recalculó, False si lo está haciendo otro proceso
+        """
+        self.env.cr.execute(SQL("SELECT pg_try_advisory_xact_lock(%s)", ASSIGNMENT_REPORT_LOCK))
+        if not self.env.cr.fetchone()[0]:
+            _logger.info("[CRON] Otro proceso está recalculando las asignaciones por día; se omite")
+            return False
+        try:
+            with self.env.cr.savepoint():
+                self._refresh_rows(since_day, purge_before)
+        except (pg_errors.UniqueViolation, pg_errors.SerializationFailure):
+            _logger.info("[CRON] Asignaciones por día recalculadas por otro proceso en paralelo; se omite")
+            return False
+        return True
+
+    @api.model
+    def _refresh_rows(self, since_day, purge_before=None):
+        """DELETE + INSERT ... SELECT de las filas desde ``since_day`` (ver ``_refresh``)"""
+        if purge_before:
+            self.env.cr.execute(SQL(
+                "DELETE FROM service_credentials_assignment_report WHERE day < %s", purge_before,
+            ))
+        self.env.cr.execute(SQL(
+            "DELETE FROM service_credentials_assignment_report WHERE day >= %s", since_day,
+        ))
+        self.env.cr.execute(SQL(
+            """
+            INSERT INTO service_credentials_assignment_report (day, product_id, company_id, assigned_count)
+            SELECT a.day, a.product_id, a.company_id, count(*)
+              FROM (
+                    SELECT e.date::date AS day, c.product_id, c.company_id
+                      FROM service_credentials_event e
+                      JOIN service_credentials c ON c.id = e.credential_id
+                     WHERE e.event_type = 'assigned'
+                       AND e.date >= %(since)s
+                 UNION ALL
+                    SELECT s.assign_date::date, c.product_id, c.company_id
+                      FROM service_credentials_seat s
+                      JOIN service_credentials c ON c.id = s.credential_id
+                     WHERE s.assign_date >= %(since)s
+                   ) a
+             WHERE a.product_id IS NOT NULL AND a.company_id IS NOT NULL
+          GROUP BY a.day, a.product_id, a.company_id
+            """,
+            since=since_day,
+        ))
+
+
+class ServiceCredentialsPoolReport(models.Model):
+    _name = "service.credentials.pool.report"
+    _description = "Salud del pool de credenciales"
+    _order = "days_of_stock, product_id"
+    _rec_name = "product_id"
+    _log_access = False
+
+    product_id = fields.Many2one(
+        "product.product",
+        string="Servicio",
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    company_id = fields.Many2one(
+        "res.company",
+        string="Compañía",
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    available_count = fields.Integer(string="Disponibles", readonly=True)
+    available_units = fields.Integer(
+        string="Unidades disponibles",
+        readonly=True,
+        help="Unidades vendibles: credenciales disponibles más asientos libres de cuentas compartidas"
+    )
+    reserved_count = fields.Integer(string="Reservadas", readonly=True)
+    assigned_count = fields.Integer(string="Asignadas", readonly=True)
+    expired_count = fields.Integer(string="Expiradas", readonly=True)
+    pending_reset_count = fields.Integer(string="Pendientes de reinicio", readonly=True)
+
+    assigned_window = fields.Integer(
+        string="Asignadas (30 días)",
+        readonly=True
+    )
+
+    depletion_rate = fields.Float(
+        string="Consumo diario",
+        readonly=True,
+        help="Promedio de unidades asignadas por día en los últimos 30 días"
+    )
+
+    days_of_stock = fields.Float(
+        string="Días de stock",
+        readonly=True,
+        aggregator='min',
+        help="Unidades disponibles divididas por el consumo diario (vacío si no hay consumo)"
+    )
+
+    refresh_date = fields.Datetime(string="Actualizado", readonly=True)
+
+    _sql_constraints = [
+        ('product_company_unique',
+         'UNIQUE(product_id, company_id)',
+         'Solo puede haber una fila por servicio y compañía.'),
+    ]
+
+    @api.model
+    def _refresh(self, product_ids=None):
+        """
+        Recalcula la salud del pool de los productos indicados (todos si es None)
+        con un solo ``INSERT ... SELECT`` agrupado.
+
+        :param product_ids: Lista de IDs de productos o None
+        """
+        product_filter = SQL("product_id = ANY(%s)", list(product_ids)) if product_ids is not None else SQL("TRUE")
+        window_start = fields.Date.today() - timedelta(days=REPORT_DEPLETION_WINDOW)
+
+        self.env.cr.execute(SQL(
+            "DELETE FROM service_credentials_pool_report WHERE %s", product_filter,
+        ))
+        self.env.cr.execute(SQL(
+            """
+            WITH pool AS (
+                SELECT product_id, company_id,
+                       count(*) FILTER (WHERE %(stock)s) AS available_count,
+                       COALESCE(sum(seat_capacity - seats_used) FILTER (WHERE %(stock)s), 0) AS available_units,
+                       count(*) FILTER (WHERE state = 'reserved') AS reserved_count,
+                       count(*) FILTER (WHERE state = 'assigned') AS assigned_count,
+                       count(*) FILTER (WHERE state = 'expired') AS expired_count,
+                       count(*) FILTER (WHERE state = 'pending_reset') AS pending_reset_count
+                  FROM service_credentials
+                 WHERE active AND %(product_filter)s
+                   AND product_id IS NOT NULL AND company_id IS NOT NULL
+              GROUP BY product_id, company_id
+            ), consumption AS (
+                SELECT product_id, company_id, sum(assigned_count) AS assigned_window
+                  FROM service_credentials_assignment_report
+                 WHERE day >= %(window_start)s AND %(product_filter)s
+              GROUP BY product_id, company_id
+            )
+            INSERT INTO service_credentials_pool_report (
+                product_id, company_id, available_count, available_units, reserved_count,
+                assigned_count, expired_count, pending_reset_count,
+                assigned_window, depletion_rate, days_of_stock, refresh_date
+            )
+            SELECT p.product_id, p.company_id, p.available_count, p.available_units, p.reserved_count,
+                   p.assigned_count, p.expired_count, p.pending_reset_count,
+                   COALESCE(k.assigned_window, 0),
+                   COALESCE(k.assigned_window, 0)::float / %(window)s,
+                   CASE WHEN k.assigned_window > 0
+                        THEN p.available_units / (k.assigned_window::float / %(window)s)
+                   END,
+                   (now() at time zone 'UTC')
+              FROM pool p
+         LEFT JOIN consumption k ON k.product_id = p.product_id AND k.company_id = p.company_id
+            """,
+            product_filter=product_filter,
+            stock=SQL(AVAILABLE_STOCK_WHERE),
+            window_start=window_start,
+            window=REPORT_DEPLETION_WINDOW,
+        ))
+
+    ##### CRON #####
+
+    @api.model
+    def cron_refresh_pool_report(self):
+        """
+        CRON: Actualiza los reportes del pool.
+
+        - Una vez al día (o en la primera ejecución) recalcula todo, porque la
+          ventana de consumo avanza aunque no haya cambios.
+        - El resto de las ejecuciones recalculan los días recientes y solo los
+          productos cuyas credenciales o asientos cambiaron desde la última vez.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        now = fields.Datetime.now()
+        today = fields.Date.today()
+        last_refresh = fields.Datetime.to_datetime(ICP.get_param(REPORT_REFRESH_PARAM) or False)
+        last_full = fields.Date.to_date(ICP.get_param(REPORT_FULL_REFRESH_PARAM) or False)
+
+        self.env.flush_all()
+        if not last_refresh or not last_full or last_full < today:
+            self.env['service.credentials.assignment.report']._refresh(
+                today - timedelta(days=REPORT_HISTORY_DAYS),
+                purge_before=today - timedelta(days=REPORT_HISTORY_DAYS),
+            )
+            self._refresh()
+            ICP.set_param(REPORT_FULL_REFRESH_PARAM, fields.Date.to_string(today))
+            _logger.info("[CRON] Reportes del pool recalculados por completo")
+        else:
+            since = last_refresh - timedelta(minutes=REPORT_REFRESH_OVERLAP)
+            self.env['service.credentials.assignment.report']._refresh(since.date())
+            product_ids = self._get_touched_products(since)
+            if product_ids:
+                self._refresh(product_ids)
+            _logger.info(f"[CRON] Reportes del pool actualizados ({len(product_ids)} productos con cambios)")
+
+        ICP.set_param(REPORT_REFRESH_PARAM, fields.Datetime.to_string(now))
+        self.env.invalidate_all()
+        return True
+
+    @api.model
+    def _get_touched_products(self, since):
+        """
+        Productos con credenciales o asientos modificados desde ``since``
+        (las credenciales movidas al histórico también cuentan).
+
+        :return: Lista de IDs de productos
+        """
+        self.env.cr.execute(SQL(
+            """
+            SELECT product_id FROM service_credentials
+             WHERE write_date >= %(since)s AND product_id IS NOT NULL
+             UNION
+            SELECT c.product_id FROM service_credentials_seat s
+              JOIN service_credentials c ON c.id = s.credential_id
+             WHERE s.write_date >= %(since)s
+             UNION
+            SELECT product_id FROM service_credentials_history
+             WHERE archived_date >= %(since)s AND product_id IS NOT NULL
+            """,
+            since=since,
+        ))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def action_refresh(self):
+        """Fuerza una actualización completa desde la vista"""
+        self.env['ir.config_parameter'].sudo().set_param(REPORT_FULL_REFRESH_PARAM, False)
+        self.cron_refresh_pool_report()
+        return {'type': 'ir.actions.client', 'tag': 'reload'}
+
+
+class ServiceCredentials(models.Model):
+    _inherit = "service.credentials"
+
+    def init(self):
+        """Índice por fecha de modificación (productos con cambios para los reportes)"""
+        super().init()
+        create_index(
+            self.env.cr,
+            'service_credentials_write_date_idx',
+            self._table,
+            ['write_date'],
+        )
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+##### Este archivo implementa la reserva temporal de credenciales (carrito / presupuesto).
+##### Una credencial reservada queda fuera del pool disponible hasta que la orden se
+##### confirma (la reserva pasa a asignación sin buscar en el pool) o vence su TTL,
+##### en cuyo caso el cron de limpieza la libera en bloque.
+
+from odoo import models, fields, api, _
+from odoo.tools import create_index
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+RESERVATION_TTL_PARAM = 'novasur_service_credentials.reservation_ttl'
+DEFAULT_RESERVATION_TTL = 15  # minutos
+
+# Estados de orden en los que se mantienen reservas
+RESERVABLE_ORDER_STATES = ('draft', 'sent')
+
+
+class ServiceCredentialsReservation(models.Model):
+    _inherit = "service.credentials"
+
+    state = fields.Selection(
+        selection_add=[('available',), ('reserved', 'Reservado')],
+        ondelete={'reserved': 'set default'},
+    )
+
+    reserved_line_id = fields.Many2one(
+        "sale.order.line",
+        string="Reservada para",
+        ondelete='set null',
+        readonly=True,
+        index='btree_not_null',
+        help="Línea de presupuesto o carrito que mantiene la reserva de esta credencial"
+    )
+
+    reserved_until = fields.Datetime(
+        string="Reserva hasta",
+        readonly=True,
+        help="Fecha en que vence la reserva si la orden no se confirma"
+    )
+
+    def init(self):
+        """Índice parcial de reservas por vencimiento (cron de limpieza)"""
+        super().init()
+        create_index(
+            self.env.cr,
+            'service_credentials_reserved_until_idx',
+            self._table,
+            ['reserved_until'],
+            where="state = 'reserved'",
+        )
+
+    ##### Helpers #####
+
+    @api.model
+    def _get_reservation_ttl(self):
+        """Duración de una reserva en minutos (configurable en Ajustes de Ventas)"""
+        ttl = self.env['ir.config_parameter'].sudo().get_param(RESERVATION_TTL_PARAM)
+        try:
+            return int(ttl) if ttl else DEFAULT_RESERVATION_TTL
+        except ValueError:
+            return DEFAULT_RESERVATION_TTL
+
+    @api.model
+    def _get_assignable_states(self):
+        """Una reserva se convierte directamente en asignación"""
+        return super()._get_assignable_states() + ('reserved',)
+
+    def _prepare_assignment_vals(self, sale_line, expire_date=False):
+        """La asignación consume la reserva"""
+        vals = super()._prepare_assignment_vals(sale_line, expire_date=expire_date)
+        vals.update({
+            'reserved_line_id': False,
+            'reserved_until': False,
+        })
+        return vals
+
+    def _release_reservations(self, reason):
+        """
+        Devuelve las credenciales reservadas al pool con un único write sin tracking
+        y registra un evento por credencial.
+
+        :param reason: Motivo guardado en el payload del evento
+        :return: Recordset de credenciales liberadas
+        """
+        if not self:
+            return self
+
+        self.with_context(tracking_disable=True).write({
+            'state': 'available',
+            'reserved_line_id': False,
+            'reserved_until': False,
+        })
+        self.env['service.credentials.event']._log(
+            'reservation_released', self, payload={'reason': reason}
+        )
+        return self
+
+    ##### CRON #####
+
+    @api.model
+    def cron_release_expired_reservations(self):
+        """
+        CRON: Libera las reservas vencidas o huérfanas (línea eliminada).
+        Se resuelve con una búsqueda sobre el índice parcial y un solo write.
+        """
+        expired = self.search([
+            ('state', '=', 'reserved'),
+            '|',
+            ('reserved_until', '<', fields.Datetime.now()),
+            ('reserved_line_id', '=', False),
+        ])
+
+        if not expired:
+            _logger.info("[CRON] No hay reservas de credenciales vencidas")
+            return True
+
+        expired._release_reservations('ttl')
+        _logger.info(f"[CRON] {len(expired)} reservas de credenciales liberadas")
+        return True
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    def action_reserve_credentials(self):
+        """Reserva (o renueva) las credenciales de los servicios digitales del presupuesto"""
+        reserved, missing = self.order_line._reserve_credentials()
+
+        message = _("%d credencial(es) reservada(s) por %d minutos.") % (
+            reserved, self.env['service.credentials']._get_reservation_ttl()
+        )
+        if missing:
+            message += " " + _("Faltan %d credencial(es) sin stock.") % missing
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Reserva de Credenciales'),
+                'message': message,
+                'type': 'warning' if missing else 'success',
+                'sticky': False,
+            }
+        }
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    reserved_credential_ids = fields.One2many(
+        'service.credentials',
+        'reserved_line_id',
+        string='Credenciales Reservadas',
+        readonly=True
+    )
+
+    def _get_held_credentials(self):
+        """
+        Obtiene las reservas de las líneas con una sola búsqueda por el índice
+        de ``reserved_line_id`` (no consulta el pool disponible).
+
+        :return: Diccionario {sale.order.line: recordset de credenciales reservadas}
+        """
+        held_by_line = defaultdict(lambda: self.env['service.credentials'])
+        if not self.ids:
+            return held_by_line
+
+        held = self.env['service.credentials'].sudo().search(
+            [('state', '=', 'reserved'), ('reserved_line_id', 'in', self.ids)],
+            order='id',
+        )
+        for credential in held:
+            held_by_line[credential.reserved_line_id] |= credential
+        return held_by_line
+
+    def _get_credential_qty_to_claim(self):
+        """Las unidades ya reservadas no se vuelven a pedir al pool"""
+        qty_by_line = super()._get_credential_qty_to_claim()
+        held_by_line = self._get_held_credentials()
+        return {
+            line: max(qty - len(held_by_line[line]), 0)
+            for line, qty in qty_by_line.items()
+        }
+
+    def _reserve_credentials(self):
+        """
+        Reserva credenciales para las líneas digitales de presupuestos y carritos.
+
+        - Las reservas existentes se renuevan con un solo write.
+        - Las que sobran (la cantidad bajó) se liberan.
+        - Lo que falta se toma del pool con ``FOR UPDATE SKIP LOCKED``.
+
+        :return: Tupla (credenciales reservadas en total, unidades sin stock)
+        """
+        Credentials = self.env['service.credentials'].sudo()
+        lines = self.filtered(
+            lambda l: l.order_id.state in RESERVABLE_ORDER_STATES
+            and l.product_id.is_digital_service
+            and l.product_id.auto_assign_credentials
+        )
+        if not lines:
+            return 0, 0
+
+        until = fields.Datetime.now() + timedelta(minutes=Credentials._get_reservation_ttl())
+        held_by_line = lines._get_held_credentials()
+        to_renew = Credentials.browse()
+        to_release = Credentials.browse()
+        reserved_count = missing = 0
+
+        for line in lines:
+            wanted = line.credential_missing_qty
+            holds = held_by_line[line]
+            if len(holds) > wanted:
+                to_release |= holds[wanted:]
+                holds = holds[:wanted]
+            to_renew |= holds
+            reserved_count += len(holds)
+
+            qty_needed = wanted - len(holds)
+            if qty_needed <= 0:
+                continue
+
+            claimed = Credentials._claim_available_credentials(
+                line.product_id.id, limit=qty_needed, company_id=line.company_id.id
+            )
+            missing += qty_needed - len(claimed)
+            if not claimed:
+                continue
+
+            claimed.with_context(tracking_disable=True).write({
+                'state': 'reserved',
+                'reserved_line_id': line.id,
+                'reserved_until': until,
+            })
+            self.env['service.credentials.event']._log('reserved', claimed, sale_order=line.order_id)
+            reserved_count += len(claimed)
+
+        if to_renew:
+            to_renew.write({'reserved_until': until})
+        to_release._release_reservations('qty_decreased')
+
+        return reserved_count, missing
+
+    def _release_credentials(self, reason):
+        """Además de las asignaciones, libera las reservas de las líneas"""
+        super()._release_credentials(reason)
+        held = self.env['service.credentials'].sudo().browse()
+        for holds in self._get_held_credentials().values():
+            held |= holds
+        held._release_reservations(reason)
+
+    def _auto_assign_credential(self):
+        """
+        Convierte primero las reservas de las líneas en asignaciones
+        (un write por línea, sin consultar el pool) y luego asigna lo que falte.
+        """
+        self._convert_credential_reservations()
+        return super()._auto_assign_credential()
+
+    def _convert_credential_reservations(self):
+        """Asigna a cada línea las credenciales que tiene reservadas"""
+        Credentials = self.env['service.credentials']
+        chatter_summary = Credentials._chatter_summary_enabled()
+        assigned_by_order = defaultdict(list)
+        surplus = Credentials.sudo().browse()
+
+        for line, holds in self._get_held_credentials().items():
+            # Respetar la cantidad final de la línea; el excedente vuelve al pool
+            wanted = line.credential_missing_qty
+            surplus |= holds[wanted:]
+            holds = holds[:wanted]
+            if not holds:
+                continue
+
+            holds._assign_batch_to_sale_line(line)
+            if not line.service_credential_id:
+                line.write({'service_credential_id': holds[0].id})
+            if chatter_summary:
+                assigned_by_order[line.order_id].append((line, holds))
+
+            _logger.info(
+                f"[SALE] {len(holds)} reservas convertidas en asignación para "
+                f"orden {line.order_id.name}, línea {line.id}"
+            )
+
+        surplus._release_reservations('qty_decreased')
+
+        for order, assignments in assigned_by_order.items():
+            order._post_credentials_summary(assignments)
@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+##### Este archivo implementa las credenciales compartidas por asientos (planes familiares,
+##### cuentas de equipo). Una credencial de N asientos es una sola fila con un contador
+##### ``seats_used`` que se incrementa atómicamente; cada asiento vendido queda en
+##### service.credentials.seat enlazado a su línea de venta.
+#####
+##### Una credencial sin asientos libres sigue en 'available' (sus asientos están en uso)
+##### pero ``has_free_seats`` la saca del pool: todos los conteos de disponibles lo usan.
+##### Las credenciales con asientos en uso vencen con su fecha de expiración, y el correo
+##### de cada asiento pasa por la bandeja de entregas (tipo 'seat').
+#####
+##### Liberar un asiento cuyo correo ya se envió expone la contraseña: la credencial queda
+##### marcada ``reset_required`` (fuera del pool) y pasa a 'pending_reset' cuando ya no
+##### tiene asientos en uso.
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.osv import expression
+from odoo.tools import SQL, create_index
+from collections import Counter
+
+from .service_credentials_allocation import ALLOCATION_FIELDS
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ServiceCredentialsSeat(models.Model):
+    _name = "service.credentials.seat"
+    _description = "Asiento de credencial compartida"
+    _order = "assign_date desc, id desc"
+    _rec_name = "credential_id"
+
+    credential_id = fields.Many2one(
+        "service.credentials",
+        string="Credencial",
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    sale_line_id = fields.Many2one(
+        "sale.order.line",
+        string="Línea de venta",
+        index='btree_not_null',
+        ondelete='set null',
+        readonly=True
+    )
+
+    sale_order_id = fields.Many2one(
+        "sale.order",
+        string="Orden de venta",
+        related="sale_line_id.order_id",
+        store=True,
+        index='btree_not_null'
+    )
+
+    partner_id = fields.Many2one(
+        "res.partner",
+        string="Cliente",
+        related="sale_order_id.partner_id",
+        store=True
+    )
+
+    state = fields.Selection([
+        ('active', 'En uso'),
+        ('released', 'Liberado'),
+        ('expired', 'Expirado'),
+    ], string="Estado", default='active', required=True, readonly=True)
+
+    assign_date = fields.Datetime(
+        string="Fecha de asignación",
+        default=fields.Datetime.now,
+        readonly=True
+    )
+
+    release_date = fields.Datetime(string="Fecha de liberación", readonly=True)
+
+    # Campos de la credencial para la plantilla de email
+    product_id = fields.Many2one(related="credential_id.product_id", string="Servicio")
+    login = fields.Char(related="credential_id.login", string="Correo / Usuario")
+    password = fields.Char(
+        related="credential_id.password",
+        string="Contraseña",
+        groups="base.group_system"
+    )
+    expire_date = fields.Datetime(related="credential_id.expire_date", string="Fecha de expiración")
+    company_id = fields.Many2one(related="credential_id.company_id", string="Compañía")
+
+    ##### Liberación #####
+
+    def action_release(self):
+        """
+        Libera los asientos en uso: el contador de cada credencial se decrementa
+        con una sola sentencia UPDATE para todo el lote.
+
+        Si el cliente del asiento ya recibió el acceso, la credencial queda marcada
+        para reinicio (no se venden más asientos) y, sin asientos en uso, pasa a
+        'pending_reset'.
+        """
+        seats = self.filtered(lambda s: s.state == 'active')
+        if not seats:
+            return True
+
+        delivered = seats._get_delivered()
+        released_by_credential = Counter(seat.credential_id.id for seat in seats)
+        seats.write({'state': 'released', 'release_date': fields.Datetime.now()})
+        self.env['service.credentials.delivery'].sudo().search([
+            ('seat_id', 'in', seats.ids),
+            ('state', '=', 'queued'),
+        ]).write({'state': 'cancelled'})
+
+        exposed = delivered.credential_id.filtered(lambda c: not c.reset_required)
+        if exposed:
+            exposed.with_context(tracking_disable=True).write({'reset_required': True})
+        self.env['service.credentials']._release_seat_counters(released_by_credential)
+        self.env['service.credentials.event']._log('seat_released', seats.credential_id)
+
+        to_reset = delivered.credential_id.filtered(
+            lambda c: c.state == 'available' and not c.seats_used
+        )
+        if to_reset:
+            to_reset.with_context(tracking_disable=True).write({'state': 'pending_reset'})
+            self.env['service.credentials.event']._log(
+                'pending_reset', to_reset, payload={'reason': 'seat_released'}
+            )
+
+        _logger.info(
+            f"{len(seats)} asientos de credenciales liberados, "
+            f"{len(delivered.credential_id)} credenciales marcadas para reinicio"
+        )
+        return True
+
+    def _get_delivered(self):
+        """
+        Asientos cuyo cliente ya recibió el acceso: hay una entrega enviada de la misma
+        credencial para la misma línea de venta (se envía un correo por credencial y línea).
+        """
+        deliveries = self.env['service.credentials.delivery'].sudo().search([
+            ('credential_id', 'in', self.credential_id.ids),
+            ('delivery_type', '=', 'seat'),
+            ('state', '=', 'sent'),
+        ])
+        sent = {(d.credential_id.id, d.sale_line_id.id) for d in deliveries}
+        return self.filtered(lambda s: (s.credential_id.id, s.sale_line_id.id) in sent)
+
+
+class ServiceCredentials(models.Model):
+    _inherit = "service.credentials"
+
+    seat_capacity = fields.Integer(
+        string="Asientos",
+        default=1,
+        required=True,
+        tracking=True,
+        help="Cantidad de usuarios simultáneos que admite la cuenta (planes familiares o de equipo)"
+    )
+
+    seats_used = fields.Integer(
+        string="Asientos ocupados",
+        default=0,
+        readonly=True,
+        copy=False
+    )
+
+    has_free_seats = fields.Boolean(
+        string="Con asientos libres",
+        compute='_compute_has_free_seats',
+        store=True,
+        help="La credencial admite al menos un usuario más. Las que no tienen asientos "
+             "libres siguen 'Disponibles' pero no cuentan como stock"
+    )
+
+    reset_required = fields.Boolean(
+        string="Requiere reinicio",
+        readonly=True,
+        copy=False,
+        help="Se liberó un asiento cuyo cliente ya recibió la contraseña: no se venden más "
+             "asientos y la cuenta pasa a reinicio cuando se liberen los restantes"
+    )
+
+    seat_ids = fields.One2many(
+        "service.credentials.seat",
+        "credential_id",
+        string="Asientos"
+    )
+
+    _sql_constraints = [
+        ('seat_capacity_positive',
+         'CHECK(seat_capacity >= 1)',
+         'La cantidad de asientos debe ser al menos 1.'),
+        ('seats_used_within_capacity',
+         'CHECK(seats_used >= 0 AND seats_used <= seat_capacity)',
+         'Los asientos ocupados no pueden superar la capacidad de la credencial.'),
+    ]
+
+    def init(self):
+        """
+        Índices parciales de credenciales con asientos libres (asignación por asientos)
+        y de credenciales con asientos en uso que vencen (cron de expiración)
+        """
+        super().init()
+        create_index(
+            self.env.cr,
+            'service_credentials_free_seats_idx',
+            self._table,
+            ['product_id', 'company_id', 'id'],
+            where="state = 'available' AND active AND seats_used < seat_capacity",
+        )
+        create_index(
+            self.env.cr,
+            'service_credentials_seat_expiry_idx',
+            self._table,
+            ['expire_date'],
+            where="state = 'available' AND seats_used > 0 AND expire_date IS NOT NULL",
+        )
+
+    @api.depends('seats_used', 'seat_capacity', 'reset_required')
+    def _compute_has_free_seats(self):
+        for rec in self:
+            rec.has_free_seats = rec.seats_used < rec.seat_capacity and not rec.reset_required
+
+    def write(self, vals):
+        """Al volver al pool (reinicio) la credencial deja de requerir reinicio"""
+        if vals.get('state') == 'available' and 'reset_required' not in vals:
+            vals = dict(vals, reset_required=False)
+        return super().write(vals)
+
+    ##### Disponibilidad #####
+
+    @api.model
+    def _get_available_pool_domain(self, product_ids, company_id=None):
+        """Las credenciales sin asientos libres no forman parte del pool"""
+        return super()._get_available_pool_domain(product_ids, company_id) + [
+            ('has_free_seats', '=', True),
+        ]
+
+    @api.model
+    def _get_available_counts(self, product_ids, company_id=None):
+        """
+        Cuenta unidades disponibles como asientos libres: una credencial de N asientos
+        aporta N - ocupados (una credencial individual aporta 1).
+        Sigue siendo una sola consulta agrupada.
+        """
+        if not product_ids:
+            return {}
+
+        groups = self._read_group(
+            self._get_available_pool_domain(product_ids, company_id),
+            groupby=['product_id'],
+            aggregates=['seat_capacity:sum', 'seats_used:sum'],
+        )
+        return {product.id: capacity - used for product, capacity, used in groups}
+
+    ##### Reserva atómica de asientos #####
+
+    @api.model
+    def _claim_seats(self, product_id, qty, company_id=None):
+        """
+        Ocupa ``qty`` asientos del producto. Cada credencial se toma con un único
+        ``UPDATE ... WHERE seats_used < seat_capacity RETURNING``: la fila se bloquea
+        con ``SKIP LOCKED`` y se ocupan de una vez todos los asientos que quepan.
+        Las credenciales se recorren en el orden de la estrategia del producto.
+
+        :param product_id: ID del producto
+        :param qty: Cantidad de asientos a ocupar
+        :param company_id: Compañía del pool (por defecto la compañía actual)
+        :return: Lista de tuplas (credencial, asientos tomados)
+        """
+        self.flush_model(ALLOCATION_FIELDS + ['seat_capacity', 'seats_used', 'reset_required'])
+        order = SQL(", ".join(self._get_allocation_strategy(product_id)['order']))
+        company_id = company_id or self.env.company.id
+
+        claims = []
+        filled = []
+        remaining = qty
+        while remaining > 0:
+            self.env.cr.execute(SQL(
+                """
+                WITH target AS (
+                    SELECT id, LEAST(seat_capacity - seats_used, %(qty)s) AS taken
+                      FROM service_credentials
+                     WHERE product_id = %(product_id)s
+                       AND company_id = %(company_id)s
+                       AND state = 'available'
+                       AND active
+                       AND seats_used < seat_capacity
+                       AND NOT reset_required
+                  ORDER BY %(order)s
+                     LIMIT 1
+                       FOR UPDATE SKIP LOCKED
+                )
+                UPDATE service_credentials c
+                   SET seats_used = c.seats_used + t.taken,
+                       has_free_seats = c.seats_used + t.taken < c.seat_capacity,
+                       write_uid = %(uid)s,
+                       write_date = (now() at time zone 'UTC')
+                  FROM target t
+                 WHERE c.id = t.id
+                   AND c.seats_used < c.seat_capacity
+             RETURNING c.id, t.taken, c.has_free_seats
+                """,
+                qty=remaining, product_id=product_id, company_id=company_id,
+                order=order, uid=self.env.uid,
+            ))
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            claims.append((self.browse(row[0]), row[1]))
+            remaining -= row[1]
+            if not row[2]:
+                filled.append(row[0])
+
+        if claims:
+            claimed = self.browse([credential.id for credential, _taken in claims])
+            claimed.invalidate_recordset(['seats_used', 'has_free_seats', 'write_uid', 'write_date'])
+            claimed._invalidate_stock_cache_on_commit([product_id])
+            claimed._schedule_expiry_for_records()
+            # Las que se llenaron dejan de contar como disponibles
+            if filled and self._stored_counters_enabled():
+                self._apply_counter_deltas(Counter({(product_id, 'available'): -len(filled)}))
+        return claims
+
+    @api.model
+    def _release_seat_counters(self, released_by_credential):
+        """
+        Decrementa los contadores de asientos en una sola sentencia UPDATE.
+
+        :param released_by_credential: Counter {credential_id: asientos liberados}
+        """
+        if not released_by_credential:
+            return
+
+        self.flush_model(['seats_used', 'seat_capacity', 'reset_required', 'has_free_seats'])
+        values = SQL(", ").join(
+            SQL("(%s, %s)", credential_id, count)
+            for credential_id, count in released_by_credential.items()
+        )
+        # ``old`` es la fila anterior al UPDATE: indica qué credenciales vuelven a tener lugar
+        self.env.cr.execute(SQL(
+            """
+            UPDATE service_credentials c
+               SET seats_used = GREATEST(c.seats_used - d.released, 0),
+                   has_free_seats = GREATEST(c.seats_used - d.released, 0) < c.seat_capacity
+                                    AND NOT c.reset_required
+              FROM (VALUES %s) AS d(id, released), service_credentials old
+             WHERE c.id = d.id AND old.id = c.id
+         RETURNING c.product_id, c.state = 'available' AND c.active
+                   AND c.has_free_seats AND NOT old.has_free_seats
+            """,
+            values,
+        ))
+        reopened = Counter(
+            (product_id, 'available') for product_id, reopened in self.env.cr.fetchall() if reopened
+        )
+        credentials = self.browse(list(released_by_credential))
+        credentials.invalidate_recordset(['seats_used', 'has_free_seats'])
+        credentials._invalidate_stock_cache_on_commit()
+        if reopened and self._stored_counters_enabled():
+            self._apply_counter_deltas(reopened)
+
+    ##### Expiración #####
+
+    @api.model
+    def _get_expirable_domain(self):
+        """Las credenciales compartidas con asientos en uso también vencen"""
+        return expression.OR([
+            super()._get_expirable_domain(),
+            [('state', '=', 'available'), ('seats_used', '>', 0)],
+        ])
+
+    def _after_expire(self):
+        """Los asientos en uso de las credenciales vencidas pasan a 'expired'"""
+        super()._after_expire()
+        self.env['service.credentials.seat'].sudo().search([
+            ('credential_id', 'in', self.ids),
+            ('state', '=', 'active'),
+        ]).write({'state': 'expired'})
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    credential_seat_mode = fields.Boolean(
+        string="Vender por Asientos",
+        help="Cada unidad vendida ocupa un asiento de una credencial compartida "
+             "en lugar de una credencial completa"
+    )
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    credential_seat_mode = fields.Boolean(
+        string="Vender por Asientos",
+        related='product_variant_id.credential_seat_mode',
+        readonly=False
+    )
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    credential_seat_ids = fields.One2many(
+        'service.credentials.seat',
+        'sale_line_id',
+        string='Asientos Asignados',
+        readonly=True
+    )
+
+    @api.depends(
+        'product_id.is_digital_service', 'product_id.credential_seat_mode',
+        'product_uom_qty', 'service_credential_ids', 'credential_seat_ids.state',
+    )
+    def _compute_credential_missing_qty(self):
+        """En modo asientos lo pendiente se mide en asientos en uso"""
+        seat_lines = self.filtered(
+            lambda l: l.product_id.is_digital_service and l.product_id.credential_seat_mode
+        )
+        super(SaleOrderLine, self - seat_lines)._compute_credential_missing_qty()
+        for line in seat_lines:
+            # Los asientos vencidos también se entregaron: no vuelven a asignarse
+            used = len(line.credential_seat_ids.filtered(lambda s: s.state in ('active', 'expired')))
+            line.credential_missing_qty = max(int(line.product_uom_qty) - used, 0)
+
+    def _release_credentials(self, reason):
+        """Además de las credenciales completas, libera los asientos en uso"""
+        super()._release_credentials(reason)
+        self.sudo().credential_seat_ids.action_release()
+
+    def _reserve_credentials(self):
+        """Los asientos no se reservan: se ocupan al confirmar con un solo UPDATE"""
+        return super(SaleOrderLine, self.filtered(
+            lambda l: not l.product_id.credential_seat_mode
+        ))._reserve_credentials()
+
+    def _assign_missing_credentials(self, qty):
+        """Las líneas en modo asientos ocupan asientos en lugar de credenciales completas"""
+        if not self.product_id.credential_seat_mode:
+            return super()._assign_missing_credentials(qty)
+        return self._assign_credential_seats(qty).credential_id
+
+    def action_assign_credential_manually(self):
+        """En modo asientos asigna los asientos que faltan"""
+        if not self.product_id.credential_seat_mode:
+            return super().action_assign_credential_manually()
+
+        self.ensure_one()
+        qty_needed = self.credential_missing_qty
+        if qty_needed <= 0:
+            raise UserError(_("Esta línea ya tiene todos sus asientos asignados."))
+
+        seats = self._assign_credential_seats(qty_needed)
+        if not seats:
+            raise UserError(
+                _("No hay asientos disponibles para el producto: %s") % self.product_id.name
+            )
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Credencial Asignada'),
+                'message': _('Se han asignado %d asiento(s) exitosamente.') % len(seats),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    def _assign_credential_seats(self, qty):
+        """
+        Ocupa ``qty`` asientos para la línea, crea los registros de asiento con un
+        solo ``create`` y encola una entrega por credencial compartida (bandeja de
+        entregas, con reintentos y estado de entrega).
+
+        :param qty: Cantidad de asientos a ocupar
+        :return: Recordset de service.credentials.seat creados
+        """
+        self.ensure_one()
+        Credentials = self.env['service.credentials']
+        claims = Credentials._claim_seats(self.product_id.id, qty, company_id=self.company_id.id)
+        if not claims:
+            return self.env['service.credentials.seat']
+
+        now = fields.Datetime.now()
+        seats = self.env['service.credentials.seat'].sudo().create([
+            {
+                'credential_id': credential.id,
+                'sale_line_id': self.id,
+                'assign_date': now,
+            }
+            for credential, taken in claims
+            for _seat in range(taken)
+        ])
+
+        credentials = Credentials.browse([credential.id for credential, _taken in claims])
+        self.env['service.credentials.event']._log(
+            'seat_assigned', credentials, sale_order=self.order_id
+        )
+        if not self.service_credential_id:
+            self.write({'service_credential_id': credentials[0].id})
+
+        # Un correo por credencial (no por asiento), en la bandeja de entregas
+        first_seat_by_credential = {}
+        for seat in seats:
+            first_seat_by_credential.setdefault(seat.credential_id, seat)
+        self.env['service.credentials.delivery']._enqueue_seats(
+            self.env['service.credentials.seat'].browse(
+                [seat.id for seat in first_seat_by_credential.values()]
+            )
+        )
+
+        _logger.info(
+            f"[SALE] {len(seats)} asientos asignados a orden {self.order_id.name}, línea {self.id}"
+        )
+        return seats
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+##### Este archivo expone el stock de credenciales por producto para el catálogo web.
+##### Las consultas se agrupan en una sola lectura y se guardan en una caché corta por
+##### worker; los cambios de estado la invalidan localmente al confirmar la transacción
+##### (los demás workers la refrescan al vencer el TTL).
+#####
+##### La caché se comparte entre los hilos del worker: toda lectura y escritura se hace
+##### con ``_STOCK_CACHE_LOCK`` (la consulta a la base queda fuera del candado).
+
+from odoo import models, api
+import threading
+import time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+STOCK_CACHE_TTL = 30  # segundos
+STOCK_MAX_PRODUCTS = 200
+STOCK_CACHE_MAX_ENTRIES = 10000
+
+# Campos de service.credentials que cambian el stock publicado
+STOCK_FIELDS = (
+    'product_id', 'state', 'active', 'company_id',
+    'seat_capacity', 'seats_used', 'has_free_seats', 'reset_required',
+)
+
+# {(base, compañía, producto): (vence_en, disponibles)} por worker
+_STOCK_CACHE = {}
+_STOCK_CACHE_LOCK = threading.Lock()
+
+
+def _invalidate_stock_cache(dbname, product_ids):
+    """Elimina de la caché del worker las entradas de los productos indicados"""
+    product_ids = set(product_ids)
+    with _STOCK_CACHE_LOCK:
+        for key in [key for key in _STOCK_CACHE if key[0] == dbname and key[2] in product_ids]:
+            _STOCK_CACHE.pop(key, None)
+
+
+class ServiceCredentialsStock(models.Model):
+    _inherit = "service.credentials"
+
+    @api.model
+    def _get_cached_stock(self, product_ids, company_id):
+        """
+        Devuelve las unidades disponibles de cada producto. Las entradas vigentes
+        salen de la caché y las faltantes se resuelven con una sola consulta agrupada.
+
+        :param product_ids: Lista de IDs de productos
+        :param company_id: Compañía cuyo pool se publica
+        :return: Diccionario {product_id: unidades disponibles}
+        """
+        dbname = self.env.cr.dbname
+        now = time.monotonic()
+        stock = {}
+        missing = []
+        with _STOCK_CACHE_LOCK:
+            for product_id in product_ids:
+                cached = _STOCK_CACHE.get((dbname, company_id, product_id))
+                if cached and cached[0] > now:
+                    stock[product_id] = cached[1]
+                else:
+                    missing.append(product_id)
+
+        if missing:
+            counts = self._get_available_counts(missing, company_id=company_id)
+            expires_at = now + STOCK_CACHE_TTL
+            with _STOCK_CACHE_LOCK:
+                if len(_STOCK_CACHE) > STOCK_CACHE_MAX_ENTRIES:
+                    _STOCK_CACHE.clear()
+                for product_id in missing:
+                    stock[product_id] = counts.get(product_id, 0)
+                    _STOCK_CACHE[(dbname, company_id, product_id)] = (expires_at, stock[product_id])
+
+        return stock
+
+    def _invalidate_stock_cache_on_commit(self, product_ids=None):
+        """Programa la invalidación local de la caché cuando la transacción se confirme"""
+        product_ids = set(product_ids or self.product_id.ids)
+        if not product_ids:
+            return
+        dbname = self.env.cr.dbname
+        self.env.cr.postcommit.add(lambda: _invalidate_stock_cache(dbname, product_ids))
+
+    ##### Invalidación #####
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._invalidate_stock_cache_on_commit()
+        return records
+
+    def write(self, vals):
+        if not any(field in vals for field in STOCK_FIELDS):
+            return super().write(vals)
+
+        product_ids = set(self.product_id.ids)
+        res = super().write(vals)
+        self._invalidate_stock_cache_on_commit(product_ids | set(self.product_id.ids))
+        return res
+
+    def unlink(self):
+        self._invalidate_stock_cache_on_commit()
+        return super().unlink()
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+##### Este archivo define la duración de suscripción de los servicios digitales.
+##### Al asignar, la credencial recibe su fecha de expiración según los días del
+##### producto. Una nueva venta del mismo servicio al mismo cliente puede renovar las
+##### credenciales que ya tiene (se extiende su vencimiento con un solo UPDATE) en
+##### lugar de consumir credenciales nuevas del pool; el cliente recibe un aviso por la
+##### bandeja de salida. Si la venta que renovó se cancela, se descuenta exactamente lo
+##### que se sumó (guardado en el evento 'renewed'). Las unidades renovables no se piden
+##### al pool: la validación previa a confirmar no las cuenta como faltantes.
+
+from odoo import models, fields, api, _, Command
+from odoo.tools import SQL
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ServiceCredentialsSubscription(models.Model):
+    _inherit = "service.credentials"
+
+    def _prepare_assignment_vals(self, sale_line, expire_date=False):
+        """Sin fecha explícita, la expiración sale de la duración del producto"""
+        days = sale_line.product_id.credential_duration_days
+        if not expire_date and days > 0:
+            expire_date = fields.Datetime.now() + timedelta(days=days)
+        return super()._prepare_assignment_vals(sale_line, expire_date=expire_date)
+
+    def _extend_expiration(self, days_by_credential):
+        """
+        Extiende el vencimiento de varias credenciales con una sola sentencia UPDATE.
+        Se cuenta desde el vencimiento actual o desde ahora si ya pasó.
+
+        :param days_by_credential: Diccionario {credential_id: días a sumar}
+        :return: Diccionario {credential_id: (vencimiento anterior, vencimiento nuevo)}
+        """
+        if not days_by_credential:
+            return {}
+
+        self.flush_model(['expire_date'])
+        values = SQL(", ").join(
+            SQL("(%s, %s)", credential_id, days)
+            for credential_id, days in days_by_credential.items()
+        )
+        # ``old`` es la fila anterior al UPDATE: guarda el vencimiento que se reemplaza
+        self.env.cr.execute(SQL(
+            """
+            UPDATE service_credentials c
+               SET expire_date = GREATEST(c.expire_date, now() at time zone 'UTC')
+                                 + make_interval(days => d.days),
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS d(id, days), service_credentials old
+             WHERE c.id = d.id AND old.id = c.id
+         RETURNING c.id, old.expire_date, c.expire_date
+            """,
+            self.env.uid, values,
+        ))
+        changes = {row[0]: (row[1], row[2]) for row in self.env.cr.fetchall()}
+        self.browse(list(changes)).invalidate_recordset(['expire_date', 'write_uid', 'write_date'])
+        return changes
+
+    def _shorten_expiration(self, shift_by_credential):
+        """
+        Descuenta del vencimiento de varias credenciales lo que sumó una renovación con
+        una sola sentencia UPDATE y adelanta el cron de expiración si hace falta.
+
+        :param shift_by_credential: Diccionario {credential_id: timedelta a restar}
+        :return: Recordset de credenciales acortadas
+        """
+        if not shift_by_credential:
+            return self.browse()
+
+        self.flush_model(['expire_date'])
+        values = SQL(", ").join(
+            SQL("(%s, %s::float8)", credential_id, shift.total_seconds())
+            for credential_id, shift in shift_by_credential.items()
+        )
+        self.env.cr.execute(SQL(
+            """
+            UPDATE service_credentials c
+               SET expire_date = c.expire_date - make_interval(secs => d.secs),
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS d(id, secs)
+             WHERE c.id = d.id AND c.expire_date IS NOT NULL
+         RETURNING c.id, c.expire_date
+            """,
+            self.env.uid, values,
+        ))
+        rows = self.env.cr.fetchall()
+        credentials = self.browse([row[0] for row in rows])
+        credentials.invalidate_recordset(['expire_date', 'write_uid', 'write_date'])
+        if rows:
+            self._schedule_expiry_check(min(row[1] for row in rows))
+        return credentials
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    credential_duration_days = fields.Integer(
+        string="Duración de la Suscripción (días)",
+        help="Días de vigencia de la credencial desde su asignación. "
+             "Con 0 la credencial no expira automáticamente."
+    )
+
+    credential_renewal = fields.Boolean(
+        string="Renovar Credencial Existente",
+        help="Si el cliente ya tiene una credencial vigente de este servicio, una nueva venta "
+             "extiende su vencimiento en lugar de asignar una credencial nueva"
+    )
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    credential_duration_days = fields.Integer(
+        string="Duración de la Suscripción (días)",
+        related='product_variant_id.credential_duration_days',
+        readonly=False
+    )
+
+    credential_renewal = fields.Boolean(
+        string="Renovar Credencial Existente",
+        related='product_variant_id.credential_renewal',
+        readonly=False
+    )
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    credential_renewed_ids = fields.Many2many(
+        'service.credentials',
+        'service_credentials_renewal_rel',
+        'sale_line_id',
+        'credential_id',
+        string='Credenciales Renovadas',
+        readonly=True,
+        copy=False
+    )
+
+    @api.depends('credential_renewed_ids')
+    def _compute_credential_missing_qty(self):
+        """Cada credencial renovada cubre una unidad de la línea"""
+        super()._compute_credential_missing_qty()
+        for line in self:
+            if line.credential_renewed_ids:
+                line.credential_missing_qty = max(
+                    line.credential_missing_qty - len(line.credential_renewed_ids), 0
+                )
+
+    def _auto_assign_credential(self):
+        """Antes de tomar credenciales del pool, renueva las que el cliente ya tiene"""
+        self._renew_credentials()
+        return super()._auto_assign_credential()
+
+    def _get_credential_qty_to_claim(self):
+        """Las unidades que renovarán credenciales del cliente no se piden al pool"""
+        qty_by_line = super()._get_credential_qty_to_claim()
+        renewable_by_line = self._get_renewal_candidates()
+        return {
+            line: max(qty - len(renewable_by_line.get(line, [])), 0)
+            for line, qty in qty_by_line.items()
+        }
+
+    def _get_renewal_candidates(self):
+        """
+        Credenciales vigentes del mismo cliente y servicio que renovaría cada línea.
+
+        - Una sola búsqueda de candidatas para todas las líneas (primero las que vencen antes).
+        - Cada credencial cubre una unidad y no se reparte entre dos líneas.
+
+        :return: Diccionario {sale.order.line: lista de service.credentials}
+        """
+        Credentials = self.env['service.credentials'].sudo()
+        lines = self.filtered(
+            lambda l: l.product_id.is_digital_service
+            and l.product_id.credential_renewal
+            and l.product_id.credential_duration_days > 0
+            and not l.product_id.credential_seat_mode
+            and l.credential_missing_qty > 0
+        )
+        if not lines:
+            return {}
+
+        candidates = Credentials.search([
+            ('state', '=', 'assigned'),
+            ('expire_date', '!=', False),
+            ('product_id', 'in', lines.product_id.ids),
+            ('partner_id', 'in', lines.order_id.partner_id.ids),
+            ('sale_line_id', 'not in', lines.ids),
+        ], order='expire_date, id')
+        if not candidates:
+            return {}
+
+        pool = defaultdict(list)
+        for credential in candidates:
+            pool[(credential.partner_id, credential.product_id)].append(credential)
+
+        renewable_by_line = {}
+        for line in lines:
+            available = pool[(line.order_id.partner_id, line.product_id)]
+            taken = available[:line.credential_missing_qty]
+            del available[:len(taken)]
+            if taken:
+                renewable_by_line[line] = taken
+        return renewable_by_line
+
+    def _renew_credentials(self):
+        """
+        Renueva credenciales vigentes del mismo cliente y servicio.
+
+        - Candidatas de ``_get_renewal_candidates`` (una sola búsqueda).
+        - Una sola sentencia UPDATE para extender todos los vencimientos.
+        - El evento 'renewed' de cada credencial guarda la línea y los vencimientos
+          anterior y nuevo, para revertir exactamente lo que se sumó.
+
+        :return: Recordset de credenciales renovadas
+        """
+        Credentials = self.env['service.credentials'].sudo()
+        renewed_by_line = self._get_renewal_candidates()
+        if not renewed_by_line:
+            return Credentials.browse()
+
+        days_by_credential = {
+            credential.id: line.product_id.credential_duration_days
+            for line, credentials in renewed_by_line.items() for credential in credentials
+        }
+        changes = Credentials._extend_expiration(days_by_credential)
+        renewed = Credentials.browse(list(changes))
+
+        # Aviso al cliente por la bandeja de salida (reintentos y estado de entrega)
+        self.env['service.credentials.delivery']._enqueue(
+            renewed, delivery_type='renewed',
+            sale_line_by_credential={
+                credential.id: line for line, credentials in renewed_by_line.items() for credential in credentials
+            },
+        )
+
+        Event = self.env['service.credentials.event']
+        for line, credentials in renewed_by_line.items():
+            line.write({'credential_renewed_ids': [Command.link(c.id) for c in credentials]})
+            Event._log(
+                'renewed', Credentials.browse([c.id for c in credentials]),
+                payload={'days': line.product_id.credential_duration_days, 'sale_line_id': line.id},
+                sale_order=line.order_id,
+                payload_by_credential={
+                    c.id: {
+                        'previous_expire_date': fields.Datetime.to_string(changes[c.id][0]),
+                        'expire_date': fields.Datetime.to_string(changes[c.id][1]),
+                    }
+                    for c in credentials if c.id in changes
+                },
+            )
+            _logger.info(
+                f"[SALE] {len(credentials)} credenciales renovadas por orden "
+                f"{line.order_id.name}, línea {line.id}"
+            )
+
+        # Las advertencias de vencimiento abiertas ya no aplican
+        activity_type = self.env.ref(
+            'novasur_service_credentials.mail_activity_type_credential_expiring',
+            raise_if_not_found=False
+        )
+        if activity_type:
+            self.env['mail.activity'].sudo().search([
+                ('res_model', '=', 'service.credentials'),
+                ('res_id', 'in', renewed.ids),
+                ('activity_type_id', '=', activity_type.id),
+            ]).action_feedback(feedback=_("Credencial renovada"))
+
+        return renewed
+
+    def _release_credentials(self, reason):
+        """Al cancelar o eliminar la línea, también revierte las renovaciones que hizo"""
+        self._revert_renewals(reason)
+        return super()._release_credentials(reason)
+
+    def _revert_renewals(self, reason):
+        """
+        Descuenta de las credenciales renovadas por las líneas exactamente lo que sumó
+        cada renovación (una sola sentencia UPDATE), cancela los avisos de renovación en
+        cola y desvincula las renovaciones.
+
+        Lo sumado sale del evento 'renewed' (vencimiento nuevo menos el anterior), no de
+        la duración actual del producto: así un cambio de duración no altera la reversión
+        y una credencial que estaba vencida vuelve a su vencimiento original.
+
+        :param reason: Motivo guardado en el evento de auditoría
+        :return: Recordset de credenciales cuya renovación se revirtió
+        """
+        Credentials = self.env['service.credentials'].sudo()
+        lines = self.sudo().filtered('credential_renewed_ids')
+        if not lines:
+            return Credentials.browse()
+
+        shift_by_credential = defaultdict(timedelta)
+        for line, credential, shift in lines._get_renewal_shifts():
+            if credential.state == 'assigned' and shift:
+                shift_by_credential[credential.id] += shift
+
+        reverted = Credentials._shorten_expiration(dict(shift_by_credential))
+
+        self.env['service.credentials.delivery'].sudo().search([
+            ('sale_line_id', 'in', lines.ids),
+            ('delivery_type', '=', 'renewed'),
+            ('state', '=', 'queued'),
+        ]).write({'state': 'cancelled'})
+
+        Event = self.env['service.credentials.event']
+        for line in lines:
+            Event._log(
+                'renewal_reverted', line.credential_renewed_ids & reverted,
+                payload={'reason': reason, 'sale_line_id': line.id},
+                sale_order=line.order_id,
+            )
+        lines.write({'credential_renewed_ids': [Command.clear()]})
+
+        _logger.info(f"[SALE] Renovación revertida ({reason}) en {len(reverted)} credenciales")
+        return reverted
+
+    def _get_renewal_shifts(self):
+        """
+        Lo que sumó cada renovación de las líneas, según el último evento 'renewed'
+        de cada (línea, credencial). Los eventos sin vencimientos guardados (anteriores
+        a este registro) usan los días de su payload.
+
+        :return: Lista de tuplas (línea, credencial, timedelta)
+        """
+        events = self.env['service.credentials.event'].sudo().search([
+            ('event_type', '=', 'renewed'),
+            ('credential_id', 'in', self.credential_renewed_ids.ids),
+            ('sale_order_id', 'in', self.order_id.ids),
+        ], order='id')
+        payload_by_key = {}
+        for event in events:
+            payload = event.payload or {}
+            payload_by_key[(payload.get('sale_line_id'), event.credential_id.id)] = payload
+
+        shifts = []
+        for line in self:
+            for credential in line.credential_renewed_ids:
+                payload = payload_by_key.get((line.id, credential.id)) or {}
+                if payload.get('previous_expire_date') and payload.get('expire_date'):
+                    shift = (
+                        fields.Datetime.to_datetime(payload['expire_date'])
+                        - fields.Datetime.to_datetime(payload['previous_expire_date'])
+                    )
+                else:
+                    shift = timedelta(days=payload.get('days') or 0)
+                shifts.append((line, credential, shift))
+        return shifts
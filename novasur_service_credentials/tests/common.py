@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+##### Base común de las pruebas de rendimiento del flujo venta → credencial.
+##### Siembra volúmenes realistas (miles de credenciales, cientos de líneas de venta),
+##### define los presupuestos de consultas y de tiempo, y escribe los tiempos medidos
+##### en un reporte JSON de benchmark al terminar cada clase.
+
+from odoo.tests.common import TransactionCase
+from odoo.tools import config
+from contextlib import contextmanager
+from cryptography.fernet import Fernet
+from unittest.mock import patch
+import json
+import os
+import time
+import logging
+
+_logger = logging.getLogger(__name__)
+
+##### Presupuestos #####
+
+# PROVISORIOS: estos números son estimaciones, aún no se midieron en Odoo 18 con
+# PostgreSQL. Antes de usarlos como referencia hay que correr
+#     odoo-bin -d <base> -i novasur_service_credentials --test-tags novasur_performance
+# y reemplazar cada valor por el conteo medido (el reporte JSON trae las consultas y
+# los segundos de cada flujo) más un margen chico.
+
+# Consultas por unidad adicional (línea de venta, correo, trabajo de asignación),
+# con caché caliente. Las pruebas de escala comparan dos volúmenes del mismo flujo:
+# la diferencia dividida por las unidades agregadas no puede superar este número.
+# Acotan el crecimiento por unidad: un N+1 (una consulta por registro en cada paso)
+# las supera aunque el total siga bajo el techo del flujo.
+QUERY_PER_UNIT = {
+    'confirm_line': 6,      # reserva, asignación, evento y entrega de una línea
+    'delivery_mail': 4,     # mail.mail enviado y su resultado
+    'assignment_job': 8,    # una línea completada desde la cola
+}
+
+# Consultas fijas de cada flujo (independientes del volumen)
+QUERY_BASE = {
+    'confirm_order': 60,
+    'confirm_orders': 80,
+    'cron_delivery': 30,
+    'cron_assignment_jobs': 30,
+}
+
+# Consultas SQL máximas por flujo (assertQueryCount, con caché caliente): fijas más
+# las de cada unidad. Si un cambio los supera, el test falla; si un cambio los baja,
+# conviene ajustar el número para fijar la mejora.
+QUERY_BUDGETS = {
+    'confirm_order': QUERY_BASE['confirm_order'] + 10 * QUERY_PER_UNIT['confirm_line'],      # 10 líneas
+    'confirm_orders': QUERY_BASE['confirm_orders'] + 200 * QUERY_PER_UNIT['confirm_line'],   # 20 órdenes
+    'confirm_reseller': 130,         # una línea de 200 unidades
+    'assign_manual': 45,             # asignación manual de 10 unidades
+    'credential_stats': 3,           # estadísticas de 40 productos
+    'read_passwords': 4,             # contraseñas de 1.000 credenciales
+    'cron_expiry': 90,               # 1.200 vencidas en 3 bloques
+    'cron_delivery': QUERY_BASE['cron_delivery'] + 100 * QUERY_PER_UNIT['delivery_mail'],    # 100 correos
+    'cron_assignment_jobs': (
+        QUERY_BASE['cron_assignment_jobs'] + 20 * QUERY_PER_UNIT['assignment_job']           # 20 trabajos
+    ),
+    'cron_recycle': 60,              # 300 credenciales a reiniciar
+    'cron_archive': 20,              # 1.000 credenciales al histórico
+    'cron_pool_report': 20,          # recálculo completo
+    'cron_forecast': 90,             # 42 servicios
+}
+
+# Tiempo máximo (segundos) por flujo, multiplicado por NOVASUR_BENCHMARK_FACTOR
+# para máquinas de CI más lentas.
+TIME_BUDGETS = {
+    'confirm_order': 3.0,
+    'confirm_orders': 30.0,
+    'confirm_reseller': 5.0,
+    'assign_manual': 1.0,
+    'credential_stats': 0.5,
+    'read_passwords': 1.0,
+    'decrypt_passwords': 1.0,
+    'cron_expiry': 10.0,
+    'cron_delivery': 20.0,
+    'cron_assignment_jobs': 10.0,
+    'cron_recycle': 10.0,
+    'cron_archive': 5.0,
+    'cron_pool_report': 5.0,
+    'cron_forecast': 5.0,
+}
+
+# Lectura de contraseñas Fernet frente al base64 anterior (mismo volumen, mismo camino ORM).
+# Descifrar un token cuesta más que decodificar base64 (HMAC-SHA256 + AES por registro);
+# la lectura completa, con la consulta incluida, puede ser hasta 4 veces más lenta.
+# El piso absoluto evita falsos positivos cuando la lectura base64 tarda milisegundos.
+DECRYPT_MAX_SLOWDOWN = 4.0
+DECRYPT_SLOWDOWN_FLOOR = 0.02
+
+BENCHMARK_FACTOR = float(os.environ.get('NOVASUR_BENCHMARK_FACTOR') or 1.0)
+BENCHMARK_REPORT_ENV = 'NOVASUR_BENCHMARK_REPORT'
+BENCHMARK_REPORT_NAME = 'novasur_service_credentials_benchmark.json'
+
+##### Volúmenes sembrados #####
+
+HOT_POOL_SIZE = 4000        # servicio más vendido
+SECONDARY_POOL_SIZE = 1000
+CATALOG_SIZE = 40           # servicios chicos (estadísticas y pronóstico)
+CATALOG_POOL_SIZE = 25
+ORDER_COUNT = 20
+LINES_PER_ORDER = 10
+PARTNER_COUNT = 20
+
+# Importación masiva: el objetivo es 100.000 filas en menos de un minuto (≥ 1.667 filas/s).
+# El presupuesto de la siembra es proporcional a las filas sembradas (6.000 filas → 3,6 s).
+IMPORT_MIN_ROWS_PER_SECOND = 100000 / 60
+IMPORT_ROWS = HOT_POOL_SIZE + SECONDARY_POOL_SIZE + CATALOG_SIZE * CATALOG_POOL_SIZE
+TIME_BUDGETS['import_credentials'] = IMPORT_ROWS / IMPORT_MIN_ROWS_PER_SECOND
+
+# Clave de cifrado de las pruebas (la opción de odoo.conf es obligatoria para cifrar)
+TEST_CIPHER_KEY = Fernet.generate_key().decode('ascii')
+
+
+def patch_cipher_keys():
+    """Patcher que configura ``service_credentials_keys`` con la clave de las pruebas"""
+    return patch.dict(config.options, {'service_credentials_keys': TEST_CIPHER_KEY})
+
+
+# Contexto de siembra: sin tracking ni mensajes de creación
+SEED_CONTEXT = {
+    'tracking_disable': True,
+    'mail_create_nolog': True,
+    'mail_create_nosubscribe': True,
+    'mail_notrack': True,
+}
+
+
+def get_benchmark_report_path():
+    """Ruta del reporte JSON (variable de entorno o directorio de datos de Odoo)"""
+    return os.environ.get(BENCHMARK_REPORT_ENV) or os.path.join(config['data_dir'], BENCHMARK_REPORT_NAME)
+
+
+def write_benchmark_report(dbname, suite, results):
+    """
+    Agrega los resultados de una clase de pruebas al reporte JSON.
+    Las demás clases ya registradas en el archivo se conservan.
+
+    :param dbname: Base de datos de la ejecución
+    :param suite: Nombre de la clase de pruebas
+    :param results: Diccionario {flujo: {'seconds', 'budget', 'queries'}}
+    """
+    path = get_benchmark_report_path()
+    report = {}
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            report = {}
+
+    report[suite] = {
+        'database': dbname,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'factor': BENCHMARK_FACTOR,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    _logger.info(f"[BENCHMARK] Reporte actualizado: {path}")
+
+
+class ServiceCredentialsPerformanceCase(TransactionCase):
+    """
+    Siembra un pool realista y ofrece las herramientas de medición:
+
+    - ``_benchmark(flujo)``: mide el tiempo de pared, lo guarda para el reporte y
+      falla si supera ``TIME_BUDGETS[flujo]``.
+    - ``_count_queries(función)``: consultas emitidas por una llamada (para comparar escalas).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.startClassPatcher(patch_cipher_keys())
+        cls._benchmark_results = {}
+        cls.company = cls.env.company
+
+        Partner = cls.env['res.partner'].with_context(**SEED_CONTEXT)
+        cls.partners = Partner.create([{
+            'name': f'Cliente Benchmark {i}',
+            'email': f'cliente.benchmark.{i}@example.com',
+        } for i in range(PARTNER_COUNT)])
+
+        Product = cls.env['product.product'].with_context(**SEED_CONTEXT)
+        cls.product_hot = Product.create(cls._product_vals('Streaming Premium', 'BENCH-HOT'))
+        cls.product_secondary = Product.create(cls._product_vals('Música Familiar', 'BENCH-SEC'))
+        cls.product_backorder = Product.create(cls._product_vals('Servicio Sin Stock', 'BENCH-BO'))
+        cls.catalog = Product.create([
+            cls._product_vals(f'Servicio Catálogo {i}', f'BENCH-CAT-{i}', auto_assign=False)
+            for i in range(CATALOG_SIZE)
+        ])
+
+        # Pool sembrado con la API de importación masiva (cifrado en lote)
+        started = time.perf_counter()
+        cls._seed_credentials(cls.product_hot, HOT_POOL_SIZE)
+        cls._seed_credentials(cls.product_secondary, SECONDARY_POOL_SIZE)
+        for product in cls.catalog:
+            cls._seed_credentials(product, CATALOG_POOL_SIZE)
+        elapsed = time.perf_counter() - started
+        cls._benchmark_results['import_credentials'] = {
+            'seconds': round(elapsed, 4),
+            'budget': round(TIME_BUDGETS['import_credentials'] * BENCHMARK_FACTOR, 4),
+            'queries': None,
+            'rows': IMPORT_ROWS,
+            'rows_per_second': round(IMPORT_ROWS / elapsed) if elapsed else None,
+        }
+
+        # Órdenes en borrador: 20 órdenes de 10 líneas alternando los dos servicios
+        cls.orders = cls._create_orders(
+            [cls.product_hot, cls.product_secondary], ORDER_COUNT, LINES_PER_ORDER
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._benchmark_results:
+            write_benchmark_report(cls.cr.dbname, cls.__name__, cls._benchmark_results)
+        super().tearDownClass()
+
+    ##### Siembra #####
+
+    @classmethod
+    def _product_vals(cls, name, code, auto_assign=True):
+        return {
+            'name': name,
+            'default_code': code,
+            'type': 'service',
+            'list_price': 5.0,
+            'is_digital_service': True,
+            'auto_assign_credentials': auto_assign,
+        }
+
+    @classmethod
+    def _seed_credentials(cls, product, count, prefix='bench'):
+        """Importa ``count`` credenciales del producto y devuelve el resumen"""
+        summary = cls.env['service.credentials']._import_credentials(
+            ({
+                'login': f'{prefix}.{product.id}.{i}@example.com',
+                'password': f'clave-{product.id}-{i}',
+            } for i in range(count)),
+            default_product=product,
+        )
+        assert summary['created'] == count, summary
+        return summary
+
+    @classmethod
+    def _create_orders(cls, products, count, lines_per_order, qty=1):
+        """Crea ``count`` órdenes en borrador repartidas entre los clientes sembrados"""
+        SaleOrder = cls.env['sale.order'].with_context(**SEED_CONTEXT)
+        return SaleOrder.create([{
+            'partner_id': cls.partners[i % len(cls.partners)].id,
+            'order_line': [(0, 0, {
+                'product_id': products[j % len(products)].id,
+                'product_uom_qty': qty,
+            }) for j in range(lines_per_order)],
+        } for i in range(count)])
+
+    ##### Medición #####
+
+    def _count_queries(self, func, *args, **kwargs):
+        """
+        Ejecuta ``func`` y devuelve la cantidad de consultas emitidas
+        (incluye el flush final de lo que dejó pendiente).
+        """
+        self.env.flush_all()
+        count0 = self.cr.sql_log_count
+        func(*args, **kwargs)
+        self.env.flush_all()
+        return self.cr.sql_log_count - count0
+
+    def _assert_queries_per_unit(self, unit, small, large):
+        """
+        Compara dos ejecuciones del mismo flujo con distinto volumen: cada unidad
+        agregada cuesta a lo sumo ``QUERY_PER_UNIT[unit]`` consultas.
+
+        :param unit: Clave de ``QUERY_PER_UNIT``
+        :param small: Tupla (unidades, consultas) de la ejecución chica
+        :param large: Tupla (unidades, consultas) de la ejecución grande
+        """
+        (small_units, small_count), (large_units, large_count) = small, large
+        per_unit = (large_count - small_count) / (large_units - small_units)
+        self.assertLessEqual(
+            per_unit, QUERY_PER_UNIT[unit],
+            f"'{unit}': {per_unit:.1f} consultas por unidad ({small_units} unidades: {small_count}, "
+            f"{large_units} unidades: {large_count}; máximo {QUERY_PER_UNIT[unit]})"
+        )
+
+    def _best_of(self, func, *args, repeat=3):
+        """Mejor tiempo de pared (segundos) de ``repeat`` ejecuciones de ``func``"""
+        timings = []
+        for _i in range(repeat):
+            started = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    @contextmanager
+    def _benchmark(self, name):
+        """
+        Mide el tiempo de pared del bloque. En la pasada con caché caliente (ver
+        ``@warmup``) lo registra para el reporte y lo compara con su presupuesto.
+        """
+        count0 = self.cr.sql_log_count
+        started = time.perf_counter()
+        yield
+        self.env.flush_all()
+        elapsed = time.perf_counter() - started
+        if not self.warm:
+            return
+
+        budget = TIME_BUDGETS[name] * BENCHMARK_FACTOR
+        self._benchmark_results[name] = {
+            'seconds': round(elapsed, 4),
+            'budget': budget,
+            'queries': self.cr.sql_log_count - count0,
+        }
+        self.assertLessEqual(
+            elapsed, budget,
+            f"Regresión de rendimiento en '{name}': {elapsed:.3f} s (presupuesto {budget:.3f} s)"
+        )
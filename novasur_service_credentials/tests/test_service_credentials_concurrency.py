@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+##### Prueba de concurrencia del flujo de venta completo (FOR UPDATE SKIP LOCKED).
+##### 50 órdenes del mismo producto se confirman al mismo tiempo con
+##### ``sale.order.action_confirm``, cada una en su propia conexión: ninguna credencial
+##### puede quedar asignada a dos líneas y ninguna transacción puede fallar por
+##### serialización.
+#####
+##### Los datos se confirman en una conexión aparte (los workers no ven la transacción
+##### del test) y se eliminan al final.
+
+from odoo import api, SUPERUSER_ID
+from odoo.sql_db import db_connect
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import errors as pg_errors
+import threading
+import uuid
+
+from .common import SEED_CONTEXT, patch_cipher_keys
+
+ORDER_COUNT = 50
+WORKERS = ORDER_COUNT
+POOL_SIZE = 60
+
+
+@tagged('post_install', '-at_install', 'novasur_performance')
+class TestServiceCredentialsConcurrency(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.startPatcher(patch_cipher_keys())
+        self.dbname = self.env.cr.dbname
+        self.prefix = uuid.uuid4().hex[:8]
+        self.addCleanup(self._cleanup)
+        with db_connect(self.dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, dict(SEED_CONTEXT))
+            product = env['product.product'].create({
+                'name': f'Servicio Concurrencia {self.prefix}',
+                'type': 'service',
+                'list_price': 5.0,
+                'is_digital_service': True,
+                'auto_assign_credentials': True,
+            })
+            self.product_id = product.id
+            env['service.credentials']._import_credentials(
+                ({
+                    'login': f'{self.prefix}.{i}@example.com',
+                    'password': f'clave-{i}',
+                } for i in range(POOL_SIZE)),
+                default_product=product,
+            )
+            partners = env['res.partner'].create([{
+                'name': f'Cliente Concurrencia {self.prefix} {i}',
+                'email': f'cliente.{self.prefix}.{i}@example.com',
+            } for i in range(ORDER_COUNT)])
+            self.partner_ids = partners.ids
+            orders = env['sale.order'].create([{
+                'partner_id': partner.id,
+                'order_line': [(0, 0, {
+                    'product_id': product.id,
+                    'product_uom_qty': 1,
+                })],
+            } for partner in partners])
+            self.order_ids = orders.ids
+            cr.commit()
+
+    def _cleanup(self):
+        if not getattr(self, 'product_id', None):
+            return
+        with db_connect(self.dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, dict(SEED_CONTEXT))
+            orders = env['sale.order'].browse(getattr(self, 'order_ids', [])).exists()
+            orders.filtered(lambda o: o.state == 'sale')._action_cancel()
+            orders.write({'state': 'cancel'})
+            orders.unlink()
+            product = env['product.product'].browse(self.product_id)
+            env['service.credentials'].with_context(active_test=False).search([
+                ('product_id', '=', product.id),
+            ]).unlink()
+            env['res.partner'].browse(getattr(self, 'partner_ids', [])).exists().unlink()
+            product.product_tmpl_id.unlink()
+            cr.commit()
+
+    def test_concurrent_confirmations_never_overlap(self):
+        barrier = threading.Barrier(WORKERS, timeout=60)
+
+        def confirm(order_id):
+            # Cada orden en su propia conexión y transacción, como dos checkouts reales
+            try:
+                with db_connect(self.dbname).cursor() as cr:
+                    env = api.Environment(cr, SUPERUSER_ID, {})
+                    order = env['sale.order'].browse(order_id)
+                    barrier.wait()
+                    order.action_confirm()
+                    env.flush_all()
+                    cr.commit()
+                return None
+            except pg_errors.SerializationFailure as e:
+                return ('serialization', order_id, str(e))
+            except Exception as e:
+                return ('error', order_id, repr(e))
+
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            failures = [f for f in executor.map(confirm, self.order_ids) if f]
+
+        self.assertFalse(
+            [f for f in failures if f[0] == 'serialization'],
+            "Una confirmación concurrente falló por serialización"
+        )
+        self.assertFalse(failures, f"Confirmaciones concurrentes fallidas: {failures}")
+
+        with db_connect(self.dbname).cursor() as cr:
+            # Ninguna credencial entregada a dos líneas: una sola asignación por credencial
+            cr.execute("""
+                SELECT e.credential_id
+                  FROM service_credentials_event e
+                  JOIN service_credentials c ON c.id = e.credential_id
+                 WHERE c.product_id = %s AND e.event_type = 'assigned'
+                 GROUP BY e.credential_id
+                HAVING count(*) > 1
+            """, [self.product_id])
+            self.assertFalse(cr.fetchall(), "Una credencial quedó asignada a dos líneas")
+
+            # Cada línea confirmada con exactamente una credencial
+            cr.execute("""
+                SELECT l.id, count(c.id)
+                  FROM sale_order_line l
+                  LEFT JOIN service_credentials c ON c.sale_line_id = l.id
+                 WHERE l.order_id = ANY(%s)
+                 GROUP BY l.id
+            """, [self.order_ids])
+            per_line = dict(cr.fetchall())
+            self.assertEqual(len(per_line), ORDER_COUNT)
+            self.assertEqual(
+                {line_id: 1 for line_id in per_line}, per_line,
+                "Cada línea confirmada debe tener exactamente una credencial"
+            )
+
+            cr.execute("""
+                SELECT count(*) FROM service_credentials
+                 WHERE product_id = %s AND state = 'assigned'
+            """, [self.product_id])
+            self.assertEqual(cr.fetchone()[0], ORDER_COUNT)
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+##### Pruebas de regresión de rendimiento del flujo venta → credencial.
+##### Fijan la cantidad de consultas (assertQueryCount) y el tiempo de pared de la
+##### confirmación, la asignación manual, las estadísticas y los crons sobre un pool
+##### sembrado con miles de credenciales, y el costo por unidad (línea, correo, trabajo)
+##### comparando dos volúmenes. Los tiempos quedan en el reporte de benchmark.
+
+from odoo import fields
+from odoo.tests import tagged
+from odoo.tests.common import warmup
+from odoo.tools import SQL
+from datetime import timedelta
+import base64
+
+from .common import (
+    ServiceCredentialsPerformanceCase, QUERY_BUDGETS, DECRYPT_MAX_SLOWDOWN, DECRYPT_SLOWDOWN_FLOOR,
+    CATALOG_POOL_SIZE, HOT_POOL_SIZE, LINES_PER_ORDER, ORDER_COUNT,
+    BENCHMARK_FACTOR, IMPORT_MIN_ROWS_PER_SECOND, IMPORT_ROWS,
+)
+from ..models.service_credentials_assignment_job import BACKORDER_PARAM
+
+
+@tagged('post_install', '-at_install', 'novasur_performance')
+class TestServiceCredentialsPerformance(ServiceCredentialsPerformanceCase):
+
+    def _assert_no_double_assignment(self, lines):
+        """Cada unidad vendida tiene su propia credencial y ninguna se repite"""
+        credentials = self.env['service.credentials'].search([('sale_line_id', 'in', lines.ids)])
+        self.assertEqual(len(credentials), int(sum(lines.mapped('product_uom_qty'))))
+        self.assertEqual(len(set(credentials.ids)), len(credentials))
+        self.assertFalse(any(lines.mapped('credential_missing_qty')))
+
+    def _backdate_events(self, product, days=1):
+        """Mueve al pasado los eventos de asignación del producto (historia de consumo)"""
+        self.env.flush_all()
+        self.env.cr.execute(SQL(
+            """
+            UPDATE service_credentials_event e
+               SET date = e.date - make_interval(days => %s)
+              FROM service_credentials c
+             WHERE c.id = e.credential_id AND c.product_id = %s
+            """,
+            days, product.id,
+        ))
+        self.env.invalidate_all()
+
+    ##### Siembra #####
+
+    def test_import_credentials_budget(self):
+        """
+        La siembra por la API de importación sostiene el ritmo del objetivo de
+        100.000 filas por minuto (presupuesto proporcional a las filas sembradas).
+        """
+        result = self._benchmark_results['import_credentials']
+        self.assertEqual(result['rows'], IMPORT_ROWS)
+        self.assertLessEqual(
+            result['seconds'], result['budget'],
+            f"Regresión de rendimiento en 'import_credentials': {result['seconds']:.3f} s para "
+            f"{IMPORT_ROWS} filas ({result['rows_per_second']} filas/s, mínimo "
+            f"{IMPORT_MIN_ROWS_PER_SECOND / BENCHMARK_FACTOR:.0f})"
+        )
+        self.assertEqual(self.product_hot.available_credential_count, HOT_POOL_SIZE)
+
+    ##### Confirmación de ventas #####
+
+    @warmup
+    def test_confirm_order(self):
+        order = self.orders[0]
+        with self.assertQueryCount(QUERY_BUDGETS['confirm_order']), self._benchmark('confirm_order'):
+            order.action_confirm()
+
+        self.assertEqual(order.state, 'sale')
+        self._assert_no_double_assignment(order.order_line)
+
+    @warmup
+    def test_confirm_orders(self):
+        """Confirmación en lote de cientos de líneas de distintos clientes"""
+        with self.assertQueryCount(QUERY_BUDGETS['confirm_orders']), self._benchmark('confirm_orders'):
+            self.orders.action_confirm()
+
+        self.assertEqual(len(self.orders.order_line), ORDER_COUNT * LINES_PER_ORDER)
+        self._assert_no_double_assignment(self.orders.order_line)
+
+    @warmup
+    def test_confirm_reseller(self):
+        """Un revendedor compra 200 cuentas en una sola línea"""
+        order = self._create_orders([self.product_hot], 1, 1, qty=200)
+        with self.assertQueryCount(QUERY_BUDGETS['confirm_reseller']), self._benchmark('confirm_reseller'):
+            order.action_confirm()
+
+        self._assert_no_double_assignment(order.order_line)
+
+    def test_confirm_reseller_constant_queries(self):
+        """Las consultas de una línea no crecen con la cantidad vendida"""
+        warm, small, large = (
+            self._create_orders([self.product_hot], 1, 1, qty=qty) for qty in (5, 20, 200)
+        )
+        warm.action_confirm()
+        small_count = self._count_queries(small.action_confirm)
+        large_count = self._count_queries(large.action_confirm)
+
+        self.assertLessEqual(
+            large_count, small_count + 2,
+            f"Confirmar 200 unidades usa {large_count} consultas; 20 unidades usan {small_count}"
+        )
+        self._assert_no_double_assignment((small | large).order_line)
+
+    def test_confirm_lines_scaling(self):
+        """Cada línea agregada a una orden cuesta un número acotado de consultas"""
+        products = [self.product_hot, self.product_secondary]
+        warm, small, large = (self._create_orders(products, 1, lines) for lines in (2, 5, 25))
+        warm.action_confirm()
+        small_count = self._count_queries(small.action_confirm)
+        large_count = self._count_queries(large.action_confirm)
+
+        self._assert_queries_per_unit('confirm_line', (5, small_count), (25, large_count))
+        self._assert_no_double_assignment((small | large).order_line)
+
+    def test_confirm_orders_scaling(self):
+        """Confirmar órdenes en lote escala por línea, no por orden"""
+        warm, small, large = self.orders[:1], self.orders[1:3], self.orders[3:13]
+        warm.action_confirm()
+        small_count = self._count_queries(small.action_confirm)
+        large_count = self._count_queries(large.action_confirm)
+
+        self._assert_queries_per_unit(
+            'confirm_line',
+            (len(small.order_line), small_count),
+            (len(large.order_line), large_count),
+        )
+        self._assert_no_double_assignment((small | large).order_line)
+
+    ##### Asignación manual #####
+
+    @warmup
+    def test_assign_manual(self):
+        product = self.catalog[0]
+        order = self._create_orders([product], 1, 1, qty=10)
+        order.action_confirm()
+        line = order.order_line
+        self.assertEqual(line.credential_missing_qty, 10)
+
+        with self.assertQueryCount(QUERY_BUDGETS['assign_manual']), self._benchmark('assign_manual'):
+            line.action_assign_credential_manually()
+
+        self._assert_no_double_assignment(line)
+
+    ##### Estadísticas de producto #####
+
+    @warmup
+    def test_credential_stats(self):
+        products = self.catalog
+        products.invalidate_recordset([
+            'credential_count', 'available_credential_count', 'assigned_credential_count',
+        ])
+        with self.assertQueryCount(QUERY_BUDGETS['credential_stats']), self._benchmark('credential_stats'):
+            counts = products.mapped('available_credential_count')
+
+        self.assertEqual(counts, [CATALOG_POOL_SIZE] * len(products))
+
+    def test_credential_stats_constant_queries(self):
+        """Las estadísticas cuestan lo mismo para 5 que para 40 productos"""
+        fnames = ['credential_count', 'available_credential_count', 'assigned_credential_count']
+
+        def read_stats(products):
+            products.invalidate_recordset(fnames)
+            products.read(fnames)
+
+        read_stats(self.catalog[:1])
+        few = self._count_queries(read_stats, self.catalog[:5])
+        many = self._count_queries(read_stats, self.catalog)
+        self.assertEqual(few, many)
+
+    ##### Contraseñas #####
+
+    @warmup
+    def test_read_passwords(self):
+        credentials = self.env['service.credentials'].search(
+            [('product_id', '=', self.product_hot.id)], order='id', limit=1000
+        )
+        credentials.invalidate_recordset(['password', 'password_encrypted'])
+        with self.assertQueryCount(QUERY_BUDGETS['read_passwords']), self._benchmark('read_passwords'):
+            passwords = credentials.mapped('password')
+
+        self.assertEqual(len(passwords), 1000)
+        self.assertTrue(all(passwords))
+
+    def test_decrypt_passwords(self):
+        """El descifrado en lote entra en su presupuesto; se reporta junto al base64 anterior"""
+        Credentials = self.env['service.credentials']
+        credentials = Credentials.search([('product_id', '=', self.product_hot.id)], order='id', limit=1000)
+        tokens = credentials.mapped('password_encrypted')
+        plain = Credentials._decrypt_passwords(tokens)
+        legacy = [base64.b64encode(password.encode('utf-8')) for password in plain]
+
+        legacy_seconds = self._best_of(Credentials._decrypt_passwords, legacy)
+        with self._benchmark('decrypt_passwords'):
+            decrypted = Credentials._decrypt_passwords(tokens)
+
+        self.assertEqual(decrypted, plain)
+        self._benchmark_results['decrypt_passwords_base64'] = {
+            'seconds': round(legacy_seconds, 4),
+            'budget': None,
+            'queries': 0,
+        }
+
+    def test_read_passwords_slowdown(self):
+        """
+        Leer 1.000 contraseñas cifradas con Fernet no cuesta más de
+        ``DECRYPT_MAX_SLOWDOWN`` veces lo que cuesta leerlas en el base64 anterior.
+        """
+        Credentials = self.env['service.credentials']
+        fernet = Credentials.search([('product_id', '=', self.product_hot.id)], order='id', limit=1000)
+        legacy = Credentials.search([('product_id', '=', self.product_secondary.id)], order='id', limit=1000)
+        self.assertEqual(len(legacy), 1000)
+
+        # Mismo volumen en el formato anterior (contraseña solo en base64, sin huella)
+        self.env.cr.execute(SQL(
+            """
+            UPDATE service_credentials c
+               SET password_encrypted = v.value, password_key_id = NULL
+              FROM (VALUES %s) AS v(id, value)
+             WHERE c.id = v.id
+            """,
+            SQL(", ").join(
+                SQL("(%s, %s::bytea)", credential.id, base64.b64encode(password.encode('utf-8')))
+                for credential, password in zip(legacy, legacy.mapped('password'))
+            ),
+        ))
+
+        def read(credentials):
+            credentials.invalidate_recordset(['password', 'password_encrypted'])
+            return credentials.mapped('password')
+
+        self.assertTrue(all(read(legacy)))
+        legacy_seconds = self._best_of(read, legacy)
+        fernet_seconds = self._best_of(read, fernet)
+        self._benchmark_results['read_passwords_legacy'] = {
+            'seconds': round(legacy_seconds, 4),
+            'budget': None,
+            'queries': None,
+        }
+        self._benchmark_results['read_passwords_fernet'] = {
+            'seconds': round(fernet_seconds, 4),
+            'budget': round(legacy_seconds * DECRYPT_MAX_SLOWDOWN + DECRYPT_SLOWDOWN_FLOOR, 4),
+            'queries': None,
+        }
+        self.assertLessEqual(
+            fernet_seconds, legacy_seconds * DECRYPT_MAX_SLOWDOWN + DECRYPT_SLOWDOWN_FLOOR,
+            f"Leer contraseñas Fernet tarda {fernet_seconds:.4f} s; en base64, {legacy_seconds:.4f} s "
+            f"(tolerancia ×{DECRYPT_MAX_SLOWDOWN})"
+        )
+
+    ##### Crons #####
+
+    @warmup
+    def test_cron_expiry(self):
+        order = self._create_orders([self.product_hot], 1, 1, qty=1200)
+        order.action_confirm()
+        credentials = order.order_line.service_credential_ids
+        credentials.with_context(tracking_disable=True).write({
+            'expire_date': fields.Datetime.now() - timedelta(days=1),
+        })
+
+        Credentials = self.env['service.credentials']
+        with self.assertQueryCount(QUERY_BUDGETS['cron_expiry']), self._benchmark('cron_expiry'):
+            expired = Credentials.cron_check_expired_credentials(chunk_size=500)
+
+        self.assertEqual(expired, 1200)
+        self.assertEqual(set(credentials.mapped('state')), {'expired'})
+
+    @warmup
+    def test_cron_delivery(self):
+        orders = self.orders[:10]
+        orders.action_confirm()
+        Delivery = self.env['service.credentials.delivery']
+        self.assertEqual(Delivery.search_count([
+            ('state', '=', 'queued'),
+            ('sale_line_id', 'in', orders.order_line.ids),
+        ]), 100)
+
+        with self.assertQueryCount(QUERY_BUDGETS['cron_delivery']), self._benchmark('cron_delivery'):
+            processed = Delivery.cron_process_credential_deliveries(batch_size=100)
+
+        self.assertEqual(processed, 100)
+
+    def test_cron_delivery_scaling(self):
+        """Cada correo agregado al lote cuesta un número acotado de consultas"""
+        Delivery = self.env['service.credentials.delivery']
+
+        def deliver(orders):
+            orders.action_confirm()
+            return self._count_queries(Delivery.cron_process_credential_deliveries, batch_size=100)
+
+        deliver(self.orders[:1])
+        small_count = deliver(self.orders[1:2])
+        large_count = deliver(self.orders[2:7])
+
+        self._assert_queries_per_unit(
+            'delivery_mail', (LINES_PER_ORDER, small_count), (5 * LINES_PER_ORDER, large_count),
+        )
+        self.assertFalse(Delivery.search_count([
+            ('state', '!=', 'sent'),
+            ('sale_line_id', 'in', self.orders[:7].order_line.ids),
+        ]))
+
+    @warmup
+    def test_cron_assignment_jobs(self):
+        self.env['ir.config_parameter'].sudo().set_param(BACKORDER_PARAM, True)
+        orders = self._create_orders([self.product_backorder], 2, 10)
+        orders.action_confirm()
+        Job = self.env['service.credentials.assignment.job']
+        jobs = Job.search([('sale_line_id', 'in', orders.order_line.ids)])
+        self.assertEqual(len(jobs), 20)
+
+        # Llega stock: la importación adelanta los trabajos pendientes
+        self._seed_credentials(self.product_backorder, 200, prefix='restock')
+        with self.assertQueryCount(QUERY_BUDGETS['cron_assignment_jobs']), self._benchmark('cron_assignment_jobs'):
+            processed = Job.cron_process_assignment_jobs()
+
+        self.assertEqual(processed, 20)
+        self.assertEqual(set(jobs.mapped('state')), {'done'})
+        self._assert_no_double_assignment(orders.order_line)
+
+    def test_cron_assignment_jobs_scaling(self):
+        """Cada trabajo agregado a la cola cuesta un número acotado de consultas"""
+        self.env['ir.config_parameter'].sudo().set_param(BACKORDER_PARAM, True)
+        Job = self.env['service.credentials.assignment.job']
+
+        def process(lines, prefix):
+            orders = self._create_orders([self.product_backorder], 1, lines)
+            orders.action_confirm()
+            self._seed_credentials(self.product_backorder, lines, prefix=prefix)
+            count = self._count_queries(Job.cron_process_assignment_jobs)
+            self._assert_no_double_assignment(orders.order_line)
+            return count
+
+        process(2, 'warm')
+        small_count = process(4, 'small')
+        large_count = process(20, 'large')
+
+        self._assert_queries_per_unit('assignment_job', (4, small_count), (20, large_count))
+
+    @warmup
+    def test_cron_recycle(self):
+        Credentials = self.env['service.credentials']
+        original = type(Credentials)._get_reset_providers
+
+        def _get_reset_providers(model):
+            providers = original(model)
+            providers['benchmark'] = {
+                'name': 'Benchmark',
+                'hook': lambda payload: {},
+                'rate_limit': 0,
+                'max_workers': 4,
+            }
+            return providers
+
+        self.patch(type(Credentials), '_get_reset_providers', _get_reset_providers)
+        self.product_secondary.credential_reset_provider = 'benchmark'
+        credentials = Credentials.search([('product_id', '=', self.product_secondary.id)], order='id', limit=300)
+        credentials.with_context(tracking_disable=True).write({
+            'state': 'expired',
+            'expire_date': fields.Datetime.now() - timedelta(days=10),
+        })
+
+        with self.assertQueryCount(QUERY_BUDGETS['cron_recycle']), self._benchmark('cron_recycle'):
+            reset = Credentials.cron_recycle_credentials(batch_size=300)
+
+        self.assertEqual(reset, 300)
+        self.assertEqual(set(credentials.mapped('state')), {'available'})
+
+    @warmup
+    def test_cron_archive(self):
+        Credentials = self.env['service.credentials']
+        credentials = Credentials.search([('product_id', '=', self.product_secondary.id)], order='id', limit=1000)
+        credentials.with_context(tracking_disable=True).write({'state': 'expired'})
+        self.env.flush_all()
+        self.env.cr.execute(SQL(
+            "UPDATE service_credentials SET write_date = write_date - interval '1 year' WHERE id = ANY(%s)",
+            credentials.ids,
+        ))
+        self.env.invalidate_all()
+
+        with self.assertQueryCount(QUERY_BUDGETS['cron_archive']), self._benchmark('cron_archive'):
+            archived = Credentials.cron_archive_credentials(batch_size=500)
+
+        self.assertEqual(archived, 1000)
+        self.assertFalse(credentials.exists())
+
+    @warmup
+    def test_cron_pool_report(self):
+        self.orders[:5].action_confirm()
+        Report = self.env['service.credentials.pool.report']
+        with self.assertQueryCount(QUERY_BUDGETS['cron_pool_report']), self._benchmark('cron_pool_report'):
+            Report.cron_refresh_pool_report()
+
+        row = Report.search([('product_id', '=', self.product_hot.id)])
+        self.assertEqual(row.assigned_count, 25)
+        self.assertEqual(row.available_count, HOT_POOL_SIZE - 25)
+
+    @warmup
+    def test_cron_forecast(self):
+        self.orders[:5].action_confirm()
+        self._backdate_events(self.product_hot)
+        Product = self.env['product.product']
+        with self.assertQueryCount(QUERY_BUDGETS['cron_forecast']), self._benchmark('cron_forecast'):
+            Product.cron_forecast_credential_stockout()
+
+        self.assertGreater(self.product_hot.credential_daily_consumption, 0)
+        self.assertGreater(self.product_hot.credential_cover_days, 0)
+
+    ##### Planes de las consultas críticas #####
+
+    def _explain(self, query):
+        """Plan de la consulta con las estadísticas al día y sin lectura secuencial"""
+        self.env.flush_all()
+        self.env.cr.execute("ANALYZE service_credentials")
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.env.cr.execute(SQL("EXPLAIN %s", query))
+        return "\n".join(row[0] for row in self.env.cr.fetchall())
+
+    def test_explain_available_pool(self):
+        plan = self._explain(SQL(
+            """
+            SELECT id FROM service_credentials
+             WHERE product_id = %s AND company_id = %s AND state = 'available' AND active
+          ORDER BY id
+             LIMIT 10
+               FOR UPDATE SKIP LOCKED
+            """,
+            self.product_hot.id, self.company.id,
+        ))
+        self.assertIn('service_credentials_alloc_fifo_idx', plan)
+        self.assertNotIn('Sort', plan)
+
+    def test_explain_expiry_range(self):
+        plan = self._explain(SQL(
+            """
+            SELECT id FROM service_credentials
+             WHERE state = 'assigned' AND expire_date IS NOT NULL AND expire_date < %s
+            """,
+            fields.Datetime.now(),
+        ))
+        self.assertIn('service_credentials_assigned_expire_idx', plan)
+
+    def test_explain_sale_line_lookup(self):
+        self.orders[:2].action_confirm()
+        plan = self._explain(SQL(
+            "SELECT id FROM service_credentials WHERE sale_line_id = ANY(%s)",
+            self.orders[:2].order_line.ids,
+        ))
+        self.assertIn('service_credentials__sale_line_id_index', plan)
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+from . import service_credentials_import_wizard
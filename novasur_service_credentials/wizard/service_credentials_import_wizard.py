@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+##### Asistente para importar credenciales desde un CSV del proveedor.
+##### El archivo se lee en streaming y se delega a service.credentials._import_credentials.
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+import base64
+import csv
+import io
+import logging
+
+_logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = {'login', 'password'}
+
+
+class ServiceCredentialsImportWizard(models.TransientModel):
+    _name = "service.credentials.import.wizard"
+    _description = "Importación masiva de credenciales"
+
+    file = fields.Binary(string="Archivo CSV", required=True)
+
+    filename = fields.Char(string="Nombre del archivo")
+
+    product_id = fields.Many2one(
+        "product.product",
+        string="Servicio por defecto",
+        domain=[('is_digital_service', '=', True)],
+        help="Servicio a usar en las filas que no indican la columna 'product'"
+    )
+
+    batch_ref = fields.Char(
+        string="Lote del proveedor",
+        help="Lote a registrar en las filas que no indican la columna 'batch' "
+             "(usado por la estrategia de rotación entre lotes)"
+    )
+
+    delimiter = fields.Selection([
+        (',', 'Coma (,)'),
+        (';', 'Punto y coma (;)'),
+        ('\t', 'Tabulación'),
+    ], string="Separador", default=',', required=True)
+
+    result = fields.Text(string="Resultado", readonly=True)
+
+    def _iter_rows(self):
+        """
+        Lee el CSV fila por fila sin cargarlo completo en una lista.
+        Columnas: login, password y opcionalmente product, notes, seats, batch.
+        """
+        self.ensure_one()
+        stream = io.TextIOWrapper(io.BytesIO(base64.b64decode(self.file)), encoding='utf-8-sig')
+        reader = csv.DictReader(stream, delimiter=self.delimiter)
+        columns = {(name or '').strip().lower() for name in (reader.fieldnames or [])}
+        missing = REQUIRED_COLUMNS - columns
+        if missing:
+            raise UserError(
+                _("El archivo no tiene las columnas requeridas: %s") % ", ".join(sorted(missing))
+            )
+        for row in reader:
+            yield {(key or '').strip().lower(): value for key, value in row.items()}
+
+    def action_import(self):
+        """Importa el archivo y muestra el resumen"""
+        self.ensure_one()
+        
+        if not self.file:
+            raise UserError(_("Debe seleccionar un archivo CSV."))
+        
+        try:
+            summary = self.env['service.credentials']._import_credentials(
+                self._iter_rows(),
+                default_product=self.product_id,
+                default_batch_ref=self.batch_ref,
+            )
+        except UnicodeDecodeError:
+            raise UserError(_("El archivo debe estar codificado en UTF-8."))
+        
+        lines = [
+            _("Credenciales creadas: %d") % summary['created'],
+            _("Ya existentes (omitidas): %d") % summary['skipped_existing'],
+            _("Duplicadas en el archivo (omitidas): %d") % summary['skipped_duplicate'],
+            _("Filas con error: %d") % summary['error_count'],
+        ]
+        lines += summary['errors']
+        self.result = "\n".join(lines)
+        
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+{
+    'name': 'Novasur - Servicios Digitales (Tienda en línea)',
+    'version': '18.0.1.0.0',
+    'summary': 'Puente entre las credenciales digitales y la tienda en línea (website_sale)',
+    'description': """
+        Integración de Credenciales Digitales con la Tienda en Línea
+        ============================================================
+        
+        * Reserva temporal de credenciales al actualizar el carrito
+        * Endpoint de stock para el catálogo (solo servicios publicados en el sitio)
+        
+        Se instala automáticamente cuando están instalados
+        novasur_service_credentials y website_sale.
+    """,
+    'author': 'Novasur',
+    'website': 'https://www.novasur.cl',
+    'category': 'Website/Website',
+    'license': 'LGPL-3',
+    'depends': [
+        'novasur_service_credentials',
+        'website_sale',
+    ],
+    'data': [],
+    'installable': True,
+    'application': False,
+    'auto_install': True,
+}
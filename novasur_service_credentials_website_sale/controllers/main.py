@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+##### Endpoint público con el stock de credenciales para el catálogo web.
+##### Una página de categoría pide todos sus productos en una sola llamada.
+##### Solo responde por servicios digitales publicados y visibles en el sitio actual.
+
+from odoo import http
+from odoo.http import request
+
+from odoo.addons.novasur_service_credentials.models.service_credentials_stock import STOCK_MAX_PRODUCTS
+
+
+class ServiceCredentialsStockController(http.Controller):
+
+    def _get_visible_product_ids(self, product_ids):
+        """
+        Filtra los IDs pedidos a los servicios digitales que el sitio actual publica
+        (vendibles, publicados, del sitio y de su compañía). Una sola búsqueda.
+
+        :param product_ids: Lista de IDs de product.product
+        :return: Lista de IDs visibles
+        """
+        website = request.website
+        template_domain = website.sale_product_domain() + [
+            ('is_published', '=', True),
+            ('company_id', 'in', [False, website.company_id.id]),
+        ]
+        return request.env['product.product'].sudo().search([
+            ('id', 'in', product_ids),
+            ('is_digital_service', '=', True),
+            ('product_tmpl_id', 'any', template_domain),
+        ]).ids
+
+    @http.route('/service_credentials/stock', type='json', auth='public', website=True, methods=['POST'])
+    def credential_stock(self, product_ids=None, **kwargs):
+        """
+        Devuelve la disponibilidad de credenciales de varios productos.
+        Los IDs que no son servicios digitales publicados en el sitio se ignoran.
+
+        :param product_ids: Lista de IDs de product.product (máximo STOCK_MAX_PRODUCTS)
+        :return: Diccionario {product_id: {'available': N, 'in_stock': bool}}
+        """
+        try:
+            product_ids = [int(product_id) for product_id in (product_ids or [])][:STOCK_MAX_PRODUCTS]
+        except (TypeError, ValueError):
+            return {}
+
+        product_ids = self._get_visible_product_ids(product_ids)
+        if not product_ids:
+            return {}
+
+        stock = request.env['service.credentials'].sudo()._get_cached_stock(
+            product_ids, request.website.company_id.id
+        )
+        return {
+            product_id: {'available': available, 'in_stock': available > 0}
+            for product_id, available in stock.items()
+        }
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+##### Extensiones de website_sale para las credenciales digitales.
+
+from . import sale_order                    # Reserva de credenciales al actualizar el carrito
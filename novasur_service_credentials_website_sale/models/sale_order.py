@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+##### Este archivo engancha el carrito de website_sale con las reservas de credenciales:
+##### cada cambio del carrito reserva o renueva las credenciales de sus líneas.
+
+from odoo import models
+
+
+class SaleOrder(models.Model):
+    _inherit = 'sale.order'
+
+    def _cart_update(self, product_id, line_id=None, add_qty=0, set_qty=0, **kwargs):
+        """Reserva (o renueva) las credenciales de las líneas después de actualizar el carrito"""
+        values = super()._cart_update(
+            product_id, line_id=line_id, add_qty=add_qty, set_qty=set_qty, **kwargs
+        )
+        self.order_line._reserve_credentials()
+        return values